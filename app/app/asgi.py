@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from core.asgi import EventStreamMiddleware, OffloadMiddleware  # noqa: E402 (needs the settings loaded above)
+
+application = EventStreamMiddleware(OffloadMiddleware(django_application))
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.AdmissionControlMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,9 +91,43 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # seconds a connection is kept for the next request of its thread
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
     }
 }
 
+# Read replicas, e.g. DB_REPLICA_HOSTS=replica1,replica2; reads of safe requests
+# are spread over them, see core/routers.py and ReplicaRoutingMiddleware
+
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+
+# `manage.py test` gets a replica mirroring the test database, for the routing
+# tests to enable; other tests read from the primary as usual
+if not DATABASE_REPLICAS and sys.argv[1:2] == ['test']:
+    DATABASES['replica_test'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Seconds a client reads from the primary after a write, to see its own changes.
+# Pins must be seen by every worker, so they're kept in a database cache table
+# on the primary (`manage.py createcachetable`)
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+REPLICA_PIN_CACHE = 'replica-pins'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'replica-pins': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'core_replica_pin_cache',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -109,6 +148,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+PASSWORD_HASHERS = [
+    'core.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+AUTHENTICATION_BACKENDS = [
+    'core.backends.EmailBackend',
+]
+
+# 'db' hands out rest_framework authtoken keys, 'signed' short lived signed
+# access tokens (verified without a query) plus refresh tokens kept in the db
+
+AUTH_TOKEN_MODE = os.environ.get('AUTH_TOKEN_MODE', 'db')
+SIGNED_ACCESS_TOKEN_LIFETIME = int(os.environ.get('SIGNED_ACCESS_TOKEN_LIFETIME', '300'))
+REFRESH_TOKEN_LIFETIME = int(os.environ.get('REFRESH_TOKEN_LIFETIME', str(30 * 24 * 3600)))
+# Seconds a worker trusts its cached is_active and token version of a user,
+# i.e. how late it may still accept the access tokens of a revoked user
+TOKEN_STATE_CACHE_SECONDS = int(os.environ.get('TOKEN_STATE_CACHE_SECONDS', '10'))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -132,9 +194,157 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = '/vol/web/static'
 MEDIA_ROOT = '/vol/web/media'
 
+# Resized images served at /media/synthesize/<id>/, see core/images.py
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', '/vol/web/cache/images')
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+IMAGE_MAX_DIMENSION = 2000
+IMAGE_QUALITY = 85
+
+# Applied to the stored images by `manage.py reprocess_images`: originals
+# are scaled down to IMAGE_ORIGINAL_MAX_DIMENSION and turned upright, the
+# IMAGE_DERIVATIVES, e.g. {'w': 200, 'h': 200, 'fit': 'cover'}, prerendered
+
+IMAGE_ORIGINAL_MAX_DIMENSION = 4000
+IMAGE_DERIVATIVES = []
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-AUTH_USER_MODEL = "core.User"
\ No newline at end of file
+AUTH_USER_MODEL = "core.User"
+
+
+# Django REST framework
+# Throttle buckets live in a memory mapped file shared by the workers of a
+# host, THROTTLE_TABLE_PATH (default: throttle-buckets in the temp directory)
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'reads': os.environ.get('THROTTLE_RATE_READS', '1200/min'),
+        'writes': os.environ.get('THROTTLE_RATE_WRITES', '300/min'),
+        'uploads': os.environ.get('THROTTLE_RATE_UPLOADS', '60/min'),
+        'token': os.environ.get('THROTTLE_RATE_TOKEN', '600/min'),
+    },
+}
+
+THROTTLE_TABLE_PATH = os.environ.get('THROTTLE_TABLE_PATH')
+THROTTLE_TABLE_SLOTS = int(os.environ.get('THROTTLE_TABLE_SLOTS', '65536'))
+
+# Admission control, per worker process: requests over the in-flight caps
+# wait up to their priority's deadline (seconds) in a bounded queue, then get a 503
+
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '32'))
+ADMISSION_MAX_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_PER_CLIENT', '8'))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '64'))
+ADMISSION_SHARES = {'reads': 1.0, 'writes': 0.75, 'uploads': 0.25}
+ADMISSION_QUEUE_DEADLINES = {'reads': 1.0, 'writes': 2.0, 'uploads': 0.5}
+ADMISSION_RETRY_AFTER = 1
+
+# Links (synthesizes times tags and chemcomps) one add or remove relations
+# request may change
+
+RELATIONS_MAX_LINKS = int(os.environ.get('RELATIONS_MAX_LINKS', '10000'))
+
+# Rows removed per transaction by deletion jobs, see core/deletion.py
+
+DELETION_BATCH_SIZE = int(os.environ.get('DELETION_BATCH_SIZE', '500'))
+
+# A running deletion job whose heartbeat is older than this many seconds
+# has lost its runner and can be taken over
+
+DELETION_LEASE_SECONDS = int(os.environ.get('DELETION_LEASE_SECONDS', '300'))
+
+# Seconds responses to requests with an Idempotency-Key are replayed for
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# Seconds a request holds its Idempotency-Key before a retry may take the key
+# over, when the request died without storing a response
+
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+# Days change feed entries are kept by `manage.py compact_change_log`; clients
+# with an older cursor download everything again
+
+CHANGES_RETENTION_DAYS = int(os.environ.get('CHANGES_RETENTION_DAYS', '30'))
+
+# Most ids a list endpoint accepts in `?ids=` multi-gets
+
+MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+
+# Rows counted exactly by paginated lists and the admin, larger counts are
+# the database's estimate, see core/pagination.py
+
+EXACT_COUNT_LIMIT = int(os.environ.get('EXACT_COUNT_LIMIT', '10000'))
+
+# Candidates per requested neighbour whose exact similarity is computed,
+# after ranking them by their MinHash estimate, see core/similarity.py
+
+SIMILARITY_RERANK_FACTOR = 4
+
+# Most synthesizes sharing a band with the requested one that are scored
+
+SIMILARITY_MAX_CANDIDATES = int(os.environ.get('SIMILARITY_MAX_CANDIDATES', '1000'))
+
+# Most sub-requests one request to /api/batch/ may carry
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+
+# Threads of a worker running the GETs of parallel batches
+
+BATCH_THREADS = int(os.environ.get('BATCH_THREADS', '4'))
+
+
+# Request performance instrumentation
+# Share of requests (0.0 - 1.0) timed and reported through the Server-Timing header.
+# Off unless enabled, so tests and dev servers don't log timings; production sets
+# e.g. SERVER_TIMING_SAMPLE_RATE=0.1
+
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', '0'))
+
+# Metrics exported at /metrics
+# With several worker processes, point METRICS_DIR to a directory shared by them
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1.0'))
+
+# /metrics answers the addresses of METRICS_ALLOWED_IPS, and anyone sending
+# `Authorization: Bearer <METRICS_TOKEN>` when a token is set
+
+METRICS_ALLOWED_IPS = list(filter(None, os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Under ASGI, requests to these paths hash passwords on their own threads
+
+ASGI_OFFLOAD_PATHS = ['/api/user/token/', '/api/user/create/']
+ASGI_OFFLOAD_THREADS = int(os.environ.get('ASGI_OFFLOAD_THREADS', '0')) or None
+
+# Server-sent change events, served by the ASGI application only
+# LocalBroker reaches the clients connected to the same process
+
+EVENT_STREAM_PATH = '/api/events/'
+EVENT_STREAM_HEARTBEAT = 15
+EVENT_STREAM_MAX_PENDING = 100
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'core.events.LocalBroker')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.timing': {
+            'handlers': ['console'],
+            'level': os.environ.get('TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -18,10 +18,16 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import BatchView, metrics_view
+from synthesize.views import SynthesizeImageView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
     path('api/synthesize/', include('synthesize.urls')),
+    path('api/batch/', BatchView.as_view(), name='batch'),
+    path('metrics', metrics_view, name='metrics'),
+    path('media/synthesize/<int:pk>/', SynthesizeImageView.as_view(), name='synthesize-image'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)   #   by default, static content is served by django dev server but to serve
                                                                     #   media content, we need to explicitly tell it.
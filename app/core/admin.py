@@ -1,13 +1,34 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 
-from core import models
+from core import changes, deletion, models
+from core.pagination import EstimatedCountPaginator
+
+
+def start_deletion_jobs(modeladmin, request, queryset, kind):
+    for user in queryset:
+        deletion.run_job_in_background(deletion.create_job(user, kind))
+    modeladmin.message_user(
+        request, _('Deletion started, follow its progress under Deletion jobs.'),
+        messages.SUCCESS,
+    )
+
+
+@admin.action(description=_('Delete selected users in the background'))
+def delete_users_in_background(modeladmin, request, queryset):
+    start_deletion_jobs(modeladmin, request, queryset, models.DeletionJob.USER)
+
+
+@admin.action(description=_('Delete all synthesizes of selected users in the background'))
+def delete_synthesizes_in_background(modeladmin, request, queryset):
+    start_deletion_jobs(modeladmin, request, queryset, models.DeletionJob.SYNTHESIZES)
 
 
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
+    actions = [delete_users_in_background, delete_synthesizes_in_background]
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal Info'), {'fields': ('name',)}),
@@ -31,7 +52,56 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ['email', 'kind', 'status', 'rows_deleted', 'files_deleted',
+                    'created', 'finished']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['kind', 'user', 'email', 'status', 'rows_deleted',
+                       'files_deleted', 'error', 'created', 'heartbeat', 'finished']
+
+    def has_add_permission(self, request):
+        return False    # jobs are started from the user list or `manage.py delete_user_data`
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Admin for tables of millions of rows.
+
+    Counts are estimated past EXACT_COUNT_LIMIT and the unfiltered total
+    isn't counted at all; the list is ordered by primary key only, and
+    the user is joined instead of looked up row by row."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    ordering = ['-id']
+    sortable_by = ['id']
+
+    def delete_model(self, request, obj):
+        changes.delete(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        changes.delete(queryset)
+
+
+class TagAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'user']
+    search_fields = ['name__startswith']    # prefix search, served by the name index
+
+
+class ChemcompAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'user']
+    search_fields = ['name__startswith']
+
+
+class SynthesizeAdmin(LargeTableAdmin):
+    list_display = ['id', 'title', 'user', 'time_years', 'chance']
+    search_fields = ['title__startswith']
+    autocomplete_fields = ['tags', 'chemcomps']     # search as you type, not every row as an option
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Chemcomp)
-admin.site.register(models.Synthesize)
+admin.site.register(models.DeletionJob, DeletionJobAdmin)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Chemcomp, ChemcompAdmin)
+admin.site.register(models.Synthesize, SynthesizeAdmin)
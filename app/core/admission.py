@@ -0,0 +1,80 @@
+import threading
+import time
+
+# Highest priority first: reads are cheap, uploads are the most expensive
+PRIORITIES = ('reads', 'writes', 'uploads')
+
+
+class Overloaded(Exception):
+    """The request was shed, `reason` tells which limit it hit"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """Cap the requests a worker runs at once, overall and per client.
+
+    Requests over a cap wait in a bounded queue until a slot frees up or
+    their deadline passes. Each priority may only fill its share of the
+    slots, and lower priorities don't get a slot while higher ones wait,
+    so uploads are shed first and reads last."""
+
+    def __init__(self, max_in_flight=32, max_per_client=8, queue_size=64,
+                 shares=None, deadlines=None):
+        shares = shares or {'reads': 1.0, 'writes': 0.75, 'uploads': 0.25}
+        self.limits = {
+            priority: max(1, int(max_in_flight * shares.get(priority, 1.0)))
+            for priority in PRIORITIES
+        }
+        self.max_per_client = max_per_client
+        self.queue_size = queue_size
+        self.deadlines = deadlines or {'reads': 1.0, 'writes': 2.0, 'uploads': 0.5}
+
+        self.in_flight = 0
+        self.per_client = {}
+        self.waiting = dict.fromkeys(PRIORITIES, 0)
+        self.condition = threading.Condition()
+
+    def _admissible(self, priority):
+        if self.in_flight >= self.limits[priority]:
+            return False
+        rank = PRIORITIES.index(priority)
+        return not any(self.waiting[higher] for higher in PRIORITIES[:rank])
+
+    def acquire(self, client, priority, wait=True):
+        """Take a slot for client or raise Overloaded"""
+        with self.condition:
+            if self.per_client.get(client, 0) >= self.max_per_client:
+                raise Overloaded('client')
+
+            if not self._admissible(priority):
+                if not wait or not self.deadlines.get(priority):
+                    raise Overloaded('capacity')
+                if sum(self.waiting.values()) >= self.queue_size:
+                    raise Overloaded('queue')
+
+                deadline = time.monotonic() + self.deadlines[priority]
+                self.waiting[priority] += 1
+                try:
+                    while not self._admissible(priority):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Overloaded('deadline')
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting[priority] -= 1
+                    # a shed waiter may have been holding back lower priorities
+                    self.condition.notify_all()
+
+            self.in_flight += 1
+            self.per_client[client] = self.per_client.get(client, 0) + 1
+
+    def release(self, client):
+        with self.condition:
+            self.in_flight -= 1
+            count = self.per_client.pop(client) - 1
+            if count:
+                self.per_client[client] = count
+            self.condition.notify_all()
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.core import checks
+        from core import changes, routers, similarity, tokens
+        changes.connect()
+        similarity.connect()
+        tokens.connect()
+        checks.register(routers.check_pin_cache, checks.Tags.caches)
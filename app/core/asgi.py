@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+from urllib.parse import parse_qs
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+
+from django.conf import settings
+from django.core import signing
+
+from core import events, tokens
+
+
+class OffloadMiddleware:
+    """Run password hashing endpoints on their own threads under ASGI.
+
+    Django runs every sync view of an ASGI worker on one shared thread, so
+    a burst of logins would stall all other requests while hashing. Requests
+    to ASGI_OFFLOAD_PATHS get a private thread instead (at most
+    ASGI_OFFLOAD_THREADS at once); hashlib releases the GIL while hashing."""
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = set(getattr(settings, 'ASGI_OFFLOAD_PATHS', ()))
+        self.threads = getattr(settings, 'ASGI_OFFLOAD_THREADS', None) or os.cpu_count()
+        self.semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.threads)   # bound to the running loop
+
+        async with self.semaphore:
+            async with ThreadSensitiveContext():
+                return await self.app(scope, receive, send)
+
+
+@sync_to_async
+def token_user_id(key):
+    from rest_framework.authtoken.models import Token
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user_id
+
+
+async def authenticate(scope):
+    """Return the id of the user authenticated by the Authorization header,
+    or the `token` query parameter for EventSource clients that can't send
+    headers; None when the credentials are missing or invalid"""
+    headers = dict(scope.get('headers', ()))
+    credentials = headers.get(b'authorization', b'').decode('latin-1').split()
+    if not credentials:
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        credentials = ['Token', token[0]] if token else []
+    if len(credentials) != 2:
+        return None
+
+    keyword, key = credentials
+    if keyword.lower() == 'token':
+        return await token_user_id(key)
+    if keyword.lower() == 'bearer':
+        try:
+            return await sync_to_async(tokens.read_access_token)(key)     # may read the user
+        except (signing.BadSignature, KeyError, TypeError):
+            return None
+    return None
+
+
+class EventStreamMiddleware:
+    """Serve the user's change events as server-sent events at EVENT_STREAM_PATH.
+
+    A connection costs one subscription and a coroutine on the event loop,
+    no thread, so a worker holds thousands of idle streams. Comments are
+    sent every EVENT_STREAM_HEARTBEAT seconds to keep proxies from closing
+    idle connections. The credentials are checked again at every heartbeat,
+    and the stream ends once they expired or were revoked."""
+
+    def __init__(self, app):
+        self.app = app
+        self.path = getattr(settings, 'EVENT_STREAM_PATH', '/api/events/')
+        self.heartbeat = getattr(settings, 'EVENT_STREAM_HEARTBEAT', 15)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.app(scope, receive, send)
+
+        user_id = await authenticate(scope)
+        if user_id is None:
+            await send({
+                'type': 'http.response.start', 'status': 401,
+                'headers': [(b'content-type', b'application/json')],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': b'{"detail": "Authentication credentials were not provided."}',
+            })
+            return
+
+        subscription = events.get_broker().subscribe(user_id)
+        try:
+            await send({
+                'type': 'http.response.start', 'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),     # don't let nginx buffer the stream
+                ],
+            })
+            await send({'type': 'http.response.body', 'body': b': connected\n\n',
+                        'more_body': True})
+            await self.stream(subscription, receive, send,
+                              lambda: authenticate(scope), user_id)
+        finally:
+            subscription.close()
+
+    async def stream(self, subscription, receive, send, reauthenticate, user_id):
+        loop = asyncio.get_running_loop()
+        checked = loop.time()
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            while not disconnected.done():
+                if loop.time() - checked >= self.heartbeat:
+                    if await reauthenticate() != user_id:
+                        await send({'type': 'http.response.body', 'body': b''})
+                        return
+                    checked = loop.time()
+                waiting = asyncio.ensure_future(subscription.get(self.heartbeat))
+                await asyncio.wait({waiting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    return
+                body = b''.join(
+                    b'event: change\ndata: %s\n\n' % json.dumps(event).encode()
+                    for event in waiting.result()
+                ) or b': keep-alive\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
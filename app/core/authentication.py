@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from core import tokens
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authenticate `Authorization: Bearer <access token>` headers.
+
+    The token is verified without touching the database, but for a cached
+    check that the user is still active and didn't revoke it, see
+    core.tokens.token_state. request.user is an unsaved User carrying only the id, which is all that the owner
+    filters and foreign keys need; use `load_user()` for the full row."""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+
+        try:
+            user_id = tokens.read_access_token(auth[1].decode())
+        except (signing.BadSignature, UnicodeError, KeyError, TypeError):
+            raise exceptions.AuthenticationFailed(_('Invalid or expired token.'))
+
+        user = get_user_model()(pk=user_id, is_active=True)     # checked by read_access_token
+        user.is_stateless = True
+        return (user, auth[1].decode())
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class BatchAuthentication(BaseAuthentication):
+    """Authenticate a sub-request of /api/batch/ as the user of the batch.
+
+    core.batch sets the batch's (user, auth) on the sub-request itself,
+    clients can't; list it after the classes reading credentials."""
+
+    def authenticate(self, request):
+        return getattr(request._request, 'batch_auth', None)
+
+
+def load_user(user):
+    """Return the full user row for a user authenticated by a signed token"""
+    if getattr(user, 'is_stateless', False):
+        return get_user_model().objects.get(pk=user.pk)
+    return user
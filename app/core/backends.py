@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+class EmailBackend(ModelBackend):
+    """Authenticate with a case-insensitive email.
+
+    The lookup matches the lower(email) index and loads the user's
+    auth token in the same query, so a login costs a single SELECT."""
+
+    def get_login_candidates(self, email):
+        return list(
+            UserModel._default_manager
+            .annotate(email_lower=Lower('email'))
+            .filter(email_lower=email.lower())
+            .select_related('auth_token')[:2]
+        )
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+
+        candidates = self.get_login_candidates(username)
+        if len(candidates) == 1:
+            user = candidates[0]
+        else:                               # emails only differing in case, require the exact one
+            user = next((c for c in candidates if c.email == username), None)
+
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            UserModel().set_password(password)
+            return
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
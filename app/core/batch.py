@@ -0,0 +1,160 @@
+"""Run several API requests inside one HTTP request.
+
+Sub-requests go through the middleware like any request, so they're
+timed, counted, admitted and routed to replicas one by one, by a
+handler of their own. Admission control takes their slots from the
+controller that admitted the batch, without waiting: a batch holding one
+of the worker's slots never waits for another. They run as the user the
+batch authenticated as, see BatchAuthentication."""
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve, reverse
+
+from rest_framework import serializers
+
+logger = logging.getLogger('core.batch')
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# The batch's Authorization header in the environ of its sub-requests, for
+# the middleware telling clients apart; DRF doesn't see it, see build_request
+AUTHORIZATION = 'batch.authorization'
+
+# Parts of the batch request's environ that don't carry over to sub-requests
+REQUEST_SPECIFIC = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_AUTHORIZATION',
+                    'HTTP_IDEMPOTENCY_KEY', 'PATH_INFO', 'QUERY_STRING', 'REQUEST_METHOD',
+                    'wsgi.input')
+
+# Threads running the GETs of parallel batches, shared by all batches of the worker
+pool = ThreadPoolExecutor(max_workers=getattr(settings, 'BATCH_THREADS', 4),
+                          thread_name_prefix='batch')
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+class SubRequestSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=METHODS, default='GET')
+    path = serializers.CharField(max_length=2000)
+    body = serializers.JSONField(required=False)
+
+    def validate_path(self, value):
+        path = urlsplit(value).path
+        if not path.startswith('/api/') or path.startswith(reverse('batch')):
+            raise serializers.ValidationError('Only API paths other than the batch itself.')
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Serializer for a list of sub-requests"""
+    requests = serializers.ListField(child=SubRequestSerializer(), min_length=1)
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+        if len(value) > max_requests:
+            raise serializers.ValidationError(f'At most {max_requests} requests are allowed.')
+        return value
+
+
+def get_handler():
+    """Return the handler running sub-requests through the middleware"""
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            handler = BaseHandler()
+            handler.load_middleware()
+            _handler = handler
+    return _handler
+
+
+def build_request(parent, method, path, body=None):
+    """Return a WSGI request for path, carrying over the parent's environ.
+
+    The parent's credentials aren't checked again: the sub-request
+    carries the user and auth the parent authenticated with as
+    `batch_auth`, which only this process can set."""
+    url = urlsplit(path)
+    payload = json.dumps(body).encode() if body is not None else b''
+    environ = {
+        key: value for key, value in parent.META.items() if key not in REQUEST_SPECIFIC
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+        AUTHORIZATION: parent.META.get('HTTP_AUTHORIZATION'),
+    })
+    request = WSGIRequest(environ)
+    request.batch_auth = (parent.user, parent.auth)
+    request.batch_admission = getattr(parent._request, '_admission', (None, None))[0]
+    return request
+
+
+def dispatch(parent, sub):
+    """Run one sub-request, return its status, headers and decoded body"""
+    request = build_request(parent, sub['method'], sub['path'], sub.get('body'))
+    try:
+        resolve(request.path_info)
+    except Resolver404:
+        return {'status': 404, 'headers': {}, 'body': {'detail': 'Not found.'}}
+
+    try:
+        response = get_handler().get_response(request)
+        body = response.content.decode(response.charset or 'utf-8') or None
+        if body and response.get('Content-Type', '').startswith('application/json'):
+            body = json.loads(body)
+    except Exception:
+        # the middleware turns errors of views into responses, not those after them
+        logger.exception('Sub-request %s %s failed', sub['method'], sub['path'])
+        return {'status': 500, 'headers': {}, 'body': {'detail': 'Server error.'}}
+
+    headers = {key: value for key, value in response.items() if key != 'Content-Length'}
+    return {'status': response.status_code, 'headers': headers, 'body': body}
+
+
+def dispatch_in_thread(parent, sub):
+    # the pool's threads keep their connections between batches, up to
+    # CONN_MAX_AGE, like the request_started and request_finished signals do
+    close_old_connections()
+    try:
+        return dispatch(parent, sub)
+    finally:
+        close_old_connections()
+
+
+def run(parent, subrequests, parallel=False):
+    """Run the sub-requests in order and return their responses.
+
+    With parallel, each run of consecutive GETs is dispatched at once on
+    the pool; writes always run alone, in order, so reads after a write
+    see it."""
+    responses = []
+    index = 0
+    while index < len(subrequests):
+        if not parallel or subrequests[index]['method'] != 'GET':
+            responses.append(dispatch(parent, subrequests[index]))
+            index += 1
+            continue
+
+        reads = []
+        while index < len(subrequests) and subrequests[index]['method'] == 'GET':
+            reads.append(subrequests[index])
+            index += 1
+        if len(reads) == 1:
+            responses.append(dispatch(parent, reads[0]))
+            continue
+        responses.extend(pool.map(lambda sub: dispatch_in_thread(parent, sub), reads))
+    return responses
@@ -0,0 +1,185 @@
+import gc
+import math
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from core.models import Tag, Chemcomp, Synthesize
+
+BENCH_EMAIL_DOMAIN = 'bench.local'
+BENCH_PASSWORD = 'benchpass'
+
+
+def percentile(sorted_values, pct):
+    """Return the pct percentile of already sorted values (linear interpolation)"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Summarize request latencies (seconds) measured over elapsed wall time"""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput': round(count / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(values) / count * 1000, 3) if count else None,
+        'p50_ms': round(percentile(values, 50) * 1000, 3) if count else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 3) if count else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 3) if count else None,
+    }
+
+
+def bench_email(index):
+    return f'bench-{index}@{BENCH_EMAIL_DOMAIN}'
+
+
+@transaction.atomic
+def seed(users, records, tags, chemcomps, links=3):
+    """Create benchmark users, each owning the given number of
+    tags, chemcomps and synthesize records (with `links` of each attached)"""
+    user_model = get_user_model()
+    password = make_password(BENCH_PASSWORD)    # hash once, it is the same for every user
+    emails = [bench_email(index) for index in range(users)]
+    user_model.objects.bulk_create([
+        user_model(email=email, name=f'Bench {index}', password=password)
+        for index, email in enumerate(emails)
+    ])
+    created_users = list(user_model.objects.filter(email__in=emails).order_by('id'))
+
+    TagLink = Synthesize.tags.through
+    ChemcompLink = Synthesize.chemcomps.through
+    rand = random.Random(0)
+    for user in created_users:
+        Tag.objects.bulk_create([
+            Tag(user=user, name=f'tag {index}') for index in range(tags)
+        ])
+        Chemcomp.objects.bulk_create([
+            Chemcomp(user=user, name=f'chemcomp {index}') for index in range(chemcomps)
+        ])
+        Synthesize.objects.bulk_create([
+            Synthesize(
+                user=user,
+                title=f'record {index}',
+                time_years=rand.randint(1, 10 ** 9),
+                chance=Decimal(rand.randint(0, 9999)) / 100,
+            )
+            for index in range(records)
+        ], batch_size=1000)
+
+        # bulk_create doesn't return ids on every backend, read them back
+        tag_ids = list(Tag.objects.filter(user=user).values_list('id', flat=True))
+        chemcomp_ids = list(Chemcomp.objects.filter(user=user).values_list('id', flat=True))
+        synthesize_ids = Synthesize.objects.filter(user=user).values_list('id', flat=True)
+        tag_links = []
+        chemcomp_links = []
+        for synthesize_id in synthesize_ids:
+            for tag_id in rand.sample(tag_ids, min(links, len(tag_ids))):
+                tag_links.append(TagLink(synthesize_id=synthesize_id, tag_id=tag_id))
+            for chemcomp_id in rand.sample(chemcomp_ids, min(links, len(chemcomp_ids))):
+                chemcomp_links.append(
+                    ChemcompLink(synthesize_id=synthesize_id, chemcomp_id=chemcomp_id)
+                )
+        TagLink.objects.bulk_create(tag_links, batch_size=1000)
+        ChemcompLink.objects.bulk_create(chemcomp_links, batch_size=1000)
+
+    return created_users
+
+
+def remove_seeded():
+    """Delete every benchmark user together with their data"""
+    return get_user_model().objects.filter(
+        email__endswith=f'@{BENCH_EMAIL_DOMAIN}'
+    ).delete()
+
+
+def measure(func, repeat=20, min_time=0.02):
+    """Time func like timeit: calibrate a loop count so every sample runs
+    for at least min_time, then return `repeat` per-call durations (seconds)"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed * 10 < min_time else 2
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()                            # keep collector pauses out of the samples
+    try:
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(loops):
+                func()
+            samples.append((time.perf_counter() - started) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return samples
+
+
+def mann_whitney_p(first, second):
+    """Two sided p-value of the Mann-Whitney U test (normal approximation
+    with tie correction), i.e. how likely both samples share a distribution"""
+    n1, n2 = len(first), len(second)
+    ranked = sorted([(value, 0) for value in first] + [(value, 1) for value in second])
+
+    ranks = [0.0] * len(ranked)
+    tie_term = 0
+    index = 0
+    while index < len(ranked):
+        end = index
+        while end + 1 < len(ranked) and ranked[end + 1][0] == ranked[index][0]:
+            end += 1
+        for position in range(index, end + 1):
+            ranks[position] = (index + end) / 2 + 1
+        ties = end - index + 1
+        tie_term += ties ** 3 - ties
+        index = end + 1
+
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    total = n1 + n2
+    variance = n1 * n2 / 12 * ((total + 1) - tie_term / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return max(0.0, min(1.0, math.erfc(max(z, 0) / math.sqrt(2))))
+
+
+def compare_samples(baseline, current, alpha=0.01, threshold=0.10):
+    """Compare two sample sets; a change counts only when it is both
+    statistically significant and larger than threshold (relative median)"""
+    base_median = statistics.median(baseline)
+    current_median = statistics.median(current)
+    ratio = current_median / base_median if base_median else float('inf')
+    p_value = mann_whitney_p(baseline, current)
+
+    verdict = 'unchanged'
+    if p_value < alpha and ratio > 1 + threshold:
+        verdict = 'regression'
+    elif p_value < alpha and ratio < 1 - threshold:
+        verdict = 'improvement'
+
+    return {
+        'baseline_median': base_median,
+        'current_median': current_median,
+        'ratio': round(ratio, 4),
+        'p_value': round(p_value, 6),
+        'verdict': verdict,
+    }
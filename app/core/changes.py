@@ -0,0 +1,146 @@
+"""Record changes of synthesizes, tags and chemcomps in the ChangeLog.
+
+Saves are recorded by a signal handler, links by m2m_changed and by
+core.relations for its bulk operations. Deletes go through `delete()`,
+or `record_deleted()` for code deleting rows itself: a post_delete
+handler would make Django delete related rows one by one. Deleting a
+tag, chemcomp or synthesize also removes its links without logging
+them: clients drop the links of deleted objects themselves. Every
+change is also published to the user's event stream, see core.events.
+
+Entries get their position, the clients' cursor, in `sequence()`."""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Max, Min, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from core.events import publish_on_commit
+from core.models import ChangeLog, Chemcomp, Synthesize, Tag
+
+MODEL_NAMES = {Synthesize: 'synthesize', Tag: 'tag', Chemcomp: 'chemcomp'}
+RELATED_MODELS = {'tags': 'tag', 'chemcomps': 'chemcomp'}
+
+
+def record_links(user_id, field_name, synthesize_ids, related_ids, linked):
+    """Log (un)linking every synthesize with every related id"""
+    action = ChangeLog.LINKED if linked else ChangeLog.UNLINKED
+    ChangeLog.objects.bulk_create([
+        ChangeLog(
+            user_id=user_id, model='synthesize', object_id=synthesize_id, action=action,
+            related_model=RELATED_MODELS[field_name], related_id=related_id,
+        )
+        for synthesize_id in synthesize_ids
+        for related_id in related_ids
+    ], batch_size=1000)
+    publish_on_commit(user_id, {
+        'model': 'synthesize', 'ids': list(synthesize_ids), 'action': action,
+        'related_model': RELATED_MODELS[field_name], 'related_ids': list(related_ids),
+    })
+
+
+def record(instance, action):
+    model = MODEL_NAMES[type(instance)]
+    ChangeLog.objects.create(
+        user_id=instance.user_id, model=model, object_id=instance.pk, action=action,
+    )
+    publish_on_commit(instance.user_id, {'model': model, 'ids': [instance.pk], 'action': action})
+
+
+def record_deleted(model, rows):
+    """Log the deletes of the (pk, user id) rows of model"""
+    by_user = {}
+    for pk, user_id in rows:
+        by_user.setdefault(user_id, []).append(pk)
+    name = MODEL_NAMES[model]
+    ChangeLog.objects.bulk_create([
+        ChangeLog(user_id=user_id, model=name, object_id=pk, action=ChangeLog.DELETED)
+        for user_id, pks in by_user.items()
+        for pk in pks
+    ], batch_size=1000)
+    for user_id, pks in by_user.items():
+        publish_on_commit(user_id, {'model': name, 'ids': pks, 'action': ChangeLog.DELETED})
+
+
+def delete(queryset):
+    """Delete the rows of queryset and log their deletes, in one transaction"""
+    rows = list(queryset.values_list('pk', 'user_id'))
+    with transaction.atomic():
+        queryset.model.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+        record_deleted(queryset.model, rows)
+
+
+def sequence(user_id):
+    """Give the user's entries without a position theirs, return the last one.
+
+    Entries become visible in the order their transactions commit, which
+    isn't the order of their ids: a transaction may take an id and commit
+    after one that took a later id. Positions are only given to visible
+    entries and always follow the positions given before, so a cursor
+    never moves past an entry that's yet to commit. Every query runs on
+    the primary: positions counted from a lagging replica could repeat
+    positions already handed out."""
+    log = ChangeLog.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id)
+    pending = Q(position__isnull=True)
+
+    def state():
+        return log.aggregate(last=Max('position'), first=Min('id', filter=pending),
+                             end=Max('id', filter=pending))
+
+    current = state()
+    if current['first'] is None:
+        return current['last']
+    with transaction.atomic():
+        # one sequence() of the user at a time
+        list(get_user_model().objects.using(DEFAULT_DB_ALIAS).select_for_update()
+             .filter(pk=user_id).values_list('pk'))
+        current = state()
+        if current['first'] is None:
+            return current['last']
+        offset = (current['last'] or 0) - current['first'] + 1
+        # entries of the range committing from now on are given positions by a later call
+        log.filter(pending, id__gte=current['first'], id__lte=current['end']) \
+            .update(position=F('id') + offset)
+    return current['end'] + offset
+
+
+def saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return      # loading fixtures
+    record(instance, ChangeLog.CREATED if created else ChangeLog.UPDATED)
+
+
+def user_deleted(sender, instance, **kwargs):
+    ChangeLog.objects.filter(user_id=instance.pk).delete()
+
+
+def links_changed(field_name):
+    def handler(instance, action, reverse, pk_set, **kwargs):
+        if action == 'pre_clear':
+            # clear() doesn't tell which links it removes, look them up first
+            if reverse:
+                pk_set = set(instance.synthesize_set.values_list('pk', flat=True))
+            else:
+                pk_set = set(getattr(instance, field_name).values_list('pk', flat=True))
+        elif action not in ('post_add', 'post_remove') or not pk_set:
+            return
+
+        linked = action == 'post_add'
+        if reverse:     # instance is the tag or chemcomp, pk_set synthesizes
+            record_links(instance.user_id, field_name, pk_set, [instance.pk], linked)
+        else:
+            record_links(instance.user_id, field_name, [instance.pk], pk_set, linked)
+    return handler
+
+
+_link_handlers = {field_name: links_changed(field_name) for field_name in RELATED_MODELS}
+
+
+def connect():
+    for model in MODEL_NAMES:
+        post_save.connect(saved, sender=model, dispatch_uid=f'changelog-save-{model.__name__}')
+    post_delete.connect(user_deleted, sender=settings.AUTH_USER_MODEL,
+                        dispatch_uid='changelog-delete-user')
+    for field_name, handler in _link_handlers.items():
+        m2m_changed.connect(handler, sender=getattr(Synthesize, field_name).through,
+                            dispatch_uid=f'changelog-links-{field_name}')
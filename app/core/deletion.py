@@ -0,0 +1,154 @@
+"""Batched deletion of users and their synthesizes.
+
+Deleting a user in one go makes Django's Collector load every related
+row into memory and holds the locks of one huge transaction. A deletion
+job instead removes the rows in batches of bounded size, each in its own
+short transaction, and deletes the image files in the background.
+
+A runner holds a job by renewing its heartbeat after every batch; a
+running job whose heartbeat is older than DELETION_LEASE_SECONDS was
+abandoned and can be claimed by another runner."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import changes
+from core.models import ChangeLog, Chemcomp, DeletionJob, IdempotencyKey, RefreshToken, \
+    Synthesize, Tag
+
+logger = logging.getLogger(__name__)
+
+media_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='media-delete')
+
+
+def create_job(user, kind=DeletionJob.USER):
+    return DeletionJob.objects.create(kind=kind, user=user, email=user.email)
+
+
+def claimable():
+    """Condition for the jobs not held by a live runner"""
+    lease = timedelta(seconds=getattr(settings, 'DELETION_LEASE_SECONDS', 300))
+    stale = Q(heartbeat__isnull=True) | Q(heartbeat__lt=timezone.now() - lease)
+    return ~Q(status=DeletionJob.DONE) & (~Q(status=DeletionJob.RUNNING) | stale)
+
+
+def claim_job(job):
+    """Mark the job running under a fresh lease, return False when a live
+    runner holds it or it's done"""
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = DeletionJob.objects.filter(claimable(), pk=job.pk) \
+            .select_for_update(skip_locked=True).exists()
+        if claimed:
+            DeletionJob.objects.filter(pk=job.pk).update(status=DeletionJob.RUNNING,
+                                                         heartbeat=now)
+    if claimed:
+        job.status, job.heartbeat = DeletionJob.RUNNING, now
+    return claimed
+
+
+def delete_file(name):
+    try:
+        default_storage.delete(name)
+    except OSError:
+        logger.warning('Could not delete media file %s', name, exc_info=True)
+        return False
+    return True
+
+
+def delete_in_batches(queryset, batch_size, on_batch, file_field=None, tombstones=False):
+    """Delete the rows of queryset batch by batch, return the rows deleted.
+
+    Each batch is deleted by primary key in its own transaction, so the
+    Collector only ever sees batch_size rows and the through table rows
+    pointing to them are removed with one DELETE per table. With
+    tombstones, the deletes are logged in the change feed in the same
+    transaction."""
+    model = queryset.model
+    deleted = 0
+    while True:
+        fields = ['pk', 'user_id', file_field] if file_field else ['pk', 'user_id']
+        rows = list(queryset.order_by('pk').values_list(*fields)[:batch_size])
+        if not rows:
+            return deleted
+
+        with transaction.atomic():
+            count, _ = model.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            if tombstones:
+                changes.record_deleted(model, [row[:2] for row in rows])
+        deleted += count
+        on_batch(count, [row[2] for row in rows if file_field and row[2]])
+
+
+def run_job(job, batch_size=None, progress=None):
+    """Run a deletion job to the end, recording its progress on the job.
+
+    Returns None without doing anything when another runner holds the job."""
+    batch_size = batch_size or getattr(settings, 'DELETION_BATCH_SIZE', 500)
+    user_id = job.user_id
+    file_deletions = []
+
+    def on_batch(count, files):
+        job.heartbeat = timezone.now()
+        DeletionJob.objects.filter(pk=job.pk).update(rows_deleted=F('rows_deleted') + count,
+                                                     heartbeat=job.heartbeat)
+        job.rows_deleted += count
+        file_deletions.extend(media_executor.submit(delete_file, name) for name in files)
+        if progress:
+            progress(job)
+
+    if not claim_job(job):
+        return None
+    try:
+        if user_id is not None:
+            # the log of a deleted user goes with them, tombstones would be wasted
+            delete_in_batches(Synthesize.objects.filter(user_id=user_id), batch_size,
+                              on_batch, file_field='image',
+                              tombstones=job.kind == DeletionJob.SYNTHESIZES)
+            if job.kind == DeletionJob.USER:
+                for model in (Tag, Chemcomp, RefreshToken, IdempotencyKey, ChangeLog):
+                    delete_in_batches(model.objects.filter(user_id=user_id),
+                                      batch_size, on_batch)
+                # what's left is a handful of rows: the auth token, groups, permissions
+                count, _ = get_user_model().objects.filter(pk=user_id).delete()
+                on_batch(count, [])
+
+        job.files_deleted = sum(future.result() for future in file_deletions)
+        job.status = DeletionJob.DONE
+        job.finished = timezone.now()
+    except Exception as error:
+        logger.exception('Deletion job %s failed', job.pk)
+        job.status = DeletionJob.FAILED
+        job.error = str(error)
+        raise
+    finally:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=job.status, files_deleted=job.files_deleted,
+            error=job.error, finished=job.finished,
+        )
+
+    return job
+
+
+def run_job_in_background(job):
+    """Run the job on its own thread so the request starting it returns at once"""
+
+    def run():
+        try:
+            run_job(job)
+        except Exception:
+            pass    # already logged and recorded on the job
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name=f'deletion-job-{job.pk}', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,106 @@
+"""Per-user change events pushed to the clients of the event stream.
+
+Events are hints: they say what changed, clients fetch the data from the
+change feed. The broker is set by EVENT_BROKER; LocalBroker fans events
+out within one process, a broker shared by all processes (e.g. on Redis
+pub/sub) only has to offer the same publish and subscribe methods."""
+import asyncio
+import threading
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+RESYNC = {'action': 'resync'}     # sent instead of the events a slow client missed
+
+
+class Subscription:
+    """Events of one user waiting for one connection.
+
+    Lives on the event loop of the connection; only `push` is called by
+    the broker, through the loop. Keeps at most `max_pending` events, a
+    client falling further behind gets a single RESYNC instead."""
+
+    __slots__ = ('broker', 'user_id', 'loop', 'max_pending', 'pending', 'overflowed', 'ready')
+
+    def __init__(self, broker, user_id, loop, max_pending):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = loop
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def push(self, event):
+        if len(self.pending) >= self.max_pending:
+            self.pending.clear()
+            self.overflowed = True
+        elif not self.overflowed:
+            self.pending.append(event)
+        self.ready.set()
+
+    async def get(self, timeout):
+        """Return the pending events, or [] once timeout passes without any"""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return [RESYNC]
+        events = list(self.pending)
+        self.pending.clear()
+        return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Fan events out to the subscriptions of this process"""
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id, max_pending=None):
+        """Subscribe to the events of user, from within a running event loop"""
+        subscription = Subscription(
+            self, user_id, asyncio.get_running_loop(),
+            max_pending or getattr(settings, 'EVENT_STREAM_MAX_PENDING', 100),
+        )
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, user_id, event):
+        """Send event to the user's subscriptions, from any thread"""
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                self.unsubscribe(subscription)      # its loop is closed
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'EVENT_BROKER', 'core.events.LocalBroker'))()
+
+
+def publish_on_commit(user_id, event):
+    """Publish event once the transaction making the change commits"""
+    transaction.on_commit(lambda: get_broker().publish(user_id, event))
@@ -0,0 +1,79 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+
+
+class SetManyRelatedField(ManyRelatedField):
+    """Many related field resolving the whole list of ids at once, of at
+    most max_length ids"""
+    default_error_messages = {
+        'max_length': _('Ensure this field has no more than {max_length} elements.'),
+    }
+
+    def __init__(self, *args, max_length=None, **kwargs):
+        self.max_length = max_length
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        if self.max_length is not None and len(data) > self.max_length:
+            self.fail('max_length', max_length=self.max_length)
+
+        return self.child_relation.to_internal_value_many(data)
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field limited to the objects of the requesting user.
+
+    With many=True the submitted ids are looked up with a single IN query
+    and every invalid or missing id is reported at once."""
+
+    def __init__(self, user_field='user', **kwargs):
+        self.user_field = user_field
+        super().__init__(**kwargs)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        max_length = kwargs.pop('max_length', None)
+        list_kwargs = {'child_relation': cls(*args, **kwargs), 'max_length': max_length}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return SetManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset.none()      # no user to limit to, accept no ids at all
+        return queryset.filter(**{self.user_field: request.user})
+
+    def to_internal_value_many(self, data):
+        queryset = self.get_queryset()
+        pk_field = queryset.model._meta.pk
+        pks, errors = [], []
+        for value in data:
+            try:
+                if isinstance(value, bool):
+                    raise TypeError
+                pks.append(pk_field.to_python(value))
+            except (TypeError, DjangoValidationError):
+                errors.append(self.error_messages['incorrect_type'].format(
+                    data_type=type(value).__name__,
+                ))
+
+        pks = list(dict.fromkeys(pks))      # keep the submitted order, drop repeats
+        found = {obj.pk: obj for obj in queryset.filter(pk__in=pks)} if pks else {}
+        errors.extend(
+            self.error_messages['does_not_exist'].format(pk_value=pk)
+            for pk in pks if pk not in found
+        )
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return [found[pk] for pk in pks]
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+
+from django.contrib.auth.hashers import BasePasswordHasher, mask_hash, must_update_salt
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_noop as _
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """Memory-hard password hashing with scrypt from hashlib.
+
+    Cheaper in CPU than the PBKDF2 default while much harder to attack
+    with GPUs. Listed first in PASSWORD_HASHERS, it transparently replaces
+    older hashes the next time their users log in."""
+    algorithm = 'scrypt'
+    work_factor = 2 ** 14
+    block_size = 8
+    parallelism = 1
+    maximum_memory = 0      # OpenSSL default (32 MiB), enough for these parameters
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            maxmem=self.maximum_memory,
+            dklen=64,
+        )
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash)
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash = encoded.split('$', 6)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password,
+            decoded['salt'],
+            decoded['work_factor'],
+            decoded['block_size'],
+            decoded['parallelism'],
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('work factor'): decoded['work_factor'],
+            _('block size'): decoded['block_size'],
+            _('parallelism'): decoded['parallelism'],
+            _('salt'): mask_hash(decoded['salt']),
+            _('hash'): mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (
+            decoded['work_factor'] != self.work_factor or
+            decoded['block_size'] != self.block_size or
+            decoded['parallelism'] != self.parallelism or
+            must_update_salt(decoded['salt'], self.salt_entropy)
+        )
+
+    def harden_runtime(self, password, encoded):
+        # The runtime of scrypt can't be topped up like PBKDF2 iterations
+        pass
@@ -0,0 +1,118 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def fingerprint(request):
+    """Hash what makes two requests the same one"""
+    data = request.data
+    if hasattr(data, 'lists'):      # QueryDict of a form post
+        data = dict(data.lists())
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return hashlib.sha256(f'{request.method} {request.path}\n{payload}'.encode()).hexdigest()
+
+
+def error(detail, status_code, **headers):
+    return Response({'detail': detail}, status=status_code, headers=headers)
+
+
+def claim(request, key, digest):
+    """Record the key for this request, or return the record of an earlier one.
+
+    The key of a request that has run for longer than the lease without
+    storing its response, e.g. because its worker died, is taken over."""
+    now = timezone.now()
+    expires = now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+    lease = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 60))
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return True, IdempotencyKey.objects.create(
+                    user=request.user, key=key, fingerprint=digest, started=now,
+                    expires=expires,
+                )
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None:
+                return False, None
+            if record.expires <= now:
+                record.delete()     # expired, the key may be used again
+                continue
+            if record.response_status is None and record.fingerprint == digest \
+                    and record.started <= now - lease:
+                # only one of several retries racing for it gets the key
+                taken = IdempotencyKey.objects.filter(
+                    pk=record.pk, started=record.started, response_status__isnull=True,
+                ).update(started=now)
+                if taken:
+                    record.started = now
+                    return True, record
+            return False, record
+    return False, None
+
+
+def idempotent(view_method):
+    """Make a viewset method safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs and its response is stored for
+    IDEMPOTENCY_KEY_TTL seconds; retries get the stored response back.
+    A retry arriving while the first request still runs gets a 409,
+    which costs a single failed insert on the unique (user, key) index.
+    The response is stored in the transaction of the view's writes, so
+    they are never committed without it. Errors aren't stored, so a
+    failed request can be retried for real."""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return error(f'{HEADER} must be at most 255 characters.',
+                         status.HTTP_400_BAD_REQUEST)
+
+        digest = fingerprint(request)
+        created, record = claim(request, key, digest)
+        if not created:
+            if record is not None and record.fingerprint != digest:
+                return error(f'This {HEADER} was used for a different request.',
+                             status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record is None or record.response_status is None:
+                return error(f'A request with this {HEADER} is in progress.',
+                             status.HTTP_409_CONFLICT, **{'Retry-After': '1'})
+            return Response(
+                json.loads(record.response_data) if record.response_data else None,
+                status=record.response_status,
+                headers={'Idempotent-Replayed': 'true'},
+            )
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code < 400:
+                    record.response_status = response.status_code
+                    if response.data is not None:
+                        record.response_data = json.dumps(response.data, cls=JSONEncoder)
+                    record.save(update_fields=['response_status', 'response_data'])
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 400:
+            record.delete()
+        return response
+
+    return wrapper
@@ -0,0 +1,285 @@
+"""Resized variants of uploaded images, rendered on demand.
+
+Variants are kept in a disk cache of at most IMAGE_CACHE_MAX_BYTES; a
+hit touches the file and the least recently used files are evicted
+first. They are keyed by the name of the source image, which is unique
+per upload and never reused for other content, and by the parameters.
+A variant missing from the cache is rendered by one request only: the
+others wait on the same lock, across threads and worker processes, and
+then read it from the cache."""
+import fcntl
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+from PIL import Image, ImageOps, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from core.models import synthesize_image_file_path
+
+FITS = ('contain', 'cover')
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+LOCK_STRIPES = 256
+ORIENTATION = 0x0112    # EXIF tag
+EVICT_TO = 0.9          # share of the cache's size left after an eviction
+
+
+def negotiate_format(accept, source_name):
+    """Return WebP where the client accepts it, else the source's own format"""
+    if 'image/webp' in accept and features.check('webp'):
+        return 'webp'
+    return 'png' if source_name.lower().endswith('.png') else 'jpeg'
+
+
+def target_size(size, width, height):
+    """Fill in a missing dimension from the source's aspect ratio"""
+    source_width, source_height = size
+    if width and height:
+        return width, height
+    if width:
+        return width, max(1, round(source_height * width / source_width))
+    return max(1, round(source_width * height / source_height)), height
+
+
+def is_rotated(image):
+    """Whether image is stored turned by 90 degrees, EXIF orientations 5 to 8"""
+    return image.getexif().get(ORIENTATION, 1) in (5, 6, 7, 8)
+
+
+def upright_size(image):
+    """The size of image once its EXIF orientation is applied"""
+    width, height = image.size
+    return (height, width) if is_rotated(image) else (width, height)
+
+
+def draft(image, size):
+    """Let JPEGs decode at 1/2, 1/4 or 1/8 scale while still larger than the
+    upright size, i.e. before exif_transpose"""
+    width, height = size
+    image.draft('RGB', (height, width) if is_rotated(image) else (width, height))
+
+
+def encode(image, image_format):
+    if image_format.upper() == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, image_format.upper(), quality=getattr(settings, 'IMAGE_QUALITY', 85))
+    return output.getvalue()
+
+
+def render(source, width, height, fit, image_format):
+    """Return the bytes of source resized into width x height.
+
+    `contain` fits the whole image in the box without enlarging it,
+    `cover` fills the box, cropping what sticks out."""
+    with Image.open(source) as image:
+        size = target_size(upright_size(image), width, height)
+        draft(image, size)
+        image = ImageOps.exif_transpose(image)
+        if fit == 'cover':
+            image = ImageOps.fit(image, size, Image.LANCZOS)
+        else:
+            image.thumbnail(size, Image.LANCZOS)
+        return encode(image, image_format)
+
+
+def optimise(source):
+    """Return source upright and within IMAGE_ORIGINAL_MAX_DIMENSION, or None if it is already.
+
+    Images that are already are left alone, every re-encoding of a JPEG
+    loses a little more of it."""
+    max_dimension = getattr(settings, 'IMAGE_ORIGINAL_MAX_DIMENSION', 4000)
+    with Image.open(source) as image:
+        image_format = image.format
+        if image.getexif().get(ORIENTATION, 1) == 1 and max(image.size) <= max_dimension:
+            return None
+        draft(image, (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        return encode(image, image_format)
+
+
+class VariantCache:
+    """Size-bounded LRU cache of files in a directory.
+
+    The total size is tracked in the `size` file as files are added; the
+    directory is only scanned once it's over max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Return the cached file opened, or None"""
+        path = self.path(key)
+        try:
+            variant = open(path, 'rb')
+            os.utime(path)      # most recently used
+        except FileNotFoundError:
+            return None
+        return variant
+
+    def put(self, key, data):
+        """Store data under key and return it opened"""
+        variant, total = self.store(key, data)
+        self.evict_if_full(total)
+        return variant
+
+    def store(self, key, data):
+        """Store data under key, return it opened and the cache's new total size"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.',
+                                         delete=False) as temp:
+            temp.write(data)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(temp.name, path)     # readers never see a partial file
+        return open(path, 'rb'), self.add_size(len(data) - replaced)
+
+    @contextmanager
+    def size_file(self):
+        """The file holding the total size of the cache, locked"""
+        with open(os.path.join(self.directory, 'size'), 'a+') as size_file:
+            fcntl.flock(size_file, fcntl.LOCK_EX)
+            try:
+                size_file.seek(0)
+                yield size_file
+            finally:
+                fcntl.flock(size_file, fcntl.LOCK_UN)
+
+    def add_size(self, delta):
+        """Add delta to the total size, return it or None if it isn't known yet"""
+        with self.size_file() as size_file:
+            total = size_file.read()
+            if not total:
+                return None     # the next evict() counts it
+            total = int(total) + delta
+            size_file.truncate(0)
+            size_file.write(str(total))
+        return total
+
+    def evict_if_full(self, total):
+        if total is None or total > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the cache is back to
+        EVICT_TO of its size. One process evicts at a time, the others
+        leave it to that one."""
+        locks = os.path.join(self.directory, 'locks')
+        os.makedirs(locks, exist_ok=True)
+        with open(os.path.join(locks, 'evict'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                self.remove_least_recently_used()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def remove_least_recently_used(self):
+        entries = []
+        for directory in os.scandir(self.directory):
+            if directory.is_dir() and directory.name != 'locks':
+                for entry in os.scandir(directory.path):
+                    if entry.name.startswith('.'):
+                        continue    # still being written
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total - removed <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.unlink(path)     # open copies stay readable until closed
+            except FileNotFoundError:
+                pass
+            removed += size
+
+        # recounted from the files, which corrects any drift of the tracked size
+        with self.size_file() as size_file:
+            size_file.truncate(0)
+            size_file.write(str(total - removed))
+
+    @contextmanager
+    def lock(self, key):
+        """Hold the lock of the stripe of key, shared by all processes"""
+        locks = os.path.join(self.directory, 'locks')
+        os.makedirs(locks, exist_ok=True)
+        stripe = int(key[:8], 16) % LOCK_STRIPES
+        with open(os.path.join(locks, str(stripe)), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_or_render(self, key, render_variant):
+        variant = self.get(key)
+        if variant is not None:
+            return variant
+        total = 0
+        with self.lock(key):
+            variant = self.get(key)     # rendered while this request waited
+            if variant is None:
+                variant, total = self.store(key, render_variant())
+        self.evict_if_full(total)       # not while holding the stripe
+        return variant
+
+
+def get_cache():
+    return VariantCache(settings.IMAGE_CACHE_DIR,
+                        getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+
+def variant(name, width, height, fit, image_format):
+    """Return the variant of the stored image name, opened, rendering it if needed"""
+    key = hashlib.sha256(
+        f'{name}\n{width}x{height}\n{fit}\n{image_format}'.encode()
+    ).hexdigest()
+
+    def render_variant():
+        with default_storage.open(name) as source:
+            return render(source, width, height, fit, image_format)
+
+    return get_cache().get_or_render(key, render_variant)
+
+
+def reprocess(name):
+    """Optimise the stored image name and render its IMAGE_DERIVATIVES.
+
+    Returns the name the optimised image was saved under, None if it
+    didn't change. Doesn't touch the database, it runs in the worker
+    processes of `manage.py reprocess_images`."""
+    with default_storage.open(name) as source:
+        data = optimise(source)
+    new_name = None
+    if data is not None:
+        # a new name, variants of the old one are never served for it
+        new_name = default_storage.save(synthesize_image_file_path(None, name), ContentFile(data))
+
+    current = new_name or name
+    for derivative in getattr(settings, 'IMAGE_DERIVATIVES', []):
+        image_formats = {negotiate_format('image/webp', current), negotiate_format('', current)}
+        for image_format in image_formats:
+            variant(current, derivative.get('w'), derivative.get('h'),
+                    derivative.get('fit', 'contain'), image_format).close()
+    return new_name
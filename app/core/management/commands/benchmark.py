@@ -0,0 +1,240 @@
+import io
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, \
+                                        get_internal_wsgi_application
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core import benchmarking
+from core.models import Tag, Chemcomp, Synthesize
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that doesn't log every request to stderr"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def json_request(method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else None
+    return method, path, body, {'Content-Type': 'application/json'}
+
+
+def multipart_request(path, field, filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        'Content-Type: image/jpeg\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return 'POST', path, body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def sample_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (120, 30, 200)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Seed benchmark data and load test every API endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--records', type=int, default=100,
+                            help='synthesize records per user')
+        parser.add_argument('--tags', type=int, default=20, help='tags per user')
+        parser.add_argument('--chemcomps', type=int, default=20, help='chemcomps per user')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests sent to every route')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--routes', help='comma separated subset of routes to run')
+        parser.add_argument('--url', help='benchmark an already running server '
+                                          'instead of starting a local one')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--label', help='free text stored with the results, e.g. a commit')
+        parser.add_argument('--throttle', action='store_true',
+                            help='keep rate limiting on for the local server')
+        parser.add_argument('--no-seed', action='store_true',
+                            help='reuse benchmark data seeded by an earlier run')
+        parser.add_argument('--keep-data', action='store_true',
+                            help="don't delete the benchmark data afterwards")
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            benchmarking.remove_seeded()
+            self.stdout.write('Seeding benchmark data...')
+            benchmarking.seed(
+                options['users'], options['records'],
+                options['tags'], options['chemcomps'],
+            )
+
+        clients = self.load_clients()
+        if not clients:
+            self.stderr.write('No benchmark users found, run without --no-seed')
+            return
+
+        server = None
+        no_throttle = None
+        base_url = options['url']
+        if not base_url:
+            if not options['throttle']:     # the benchmark clients would hit the rate limits
+                no_throttle = override_settings(REST_FRAMEWORK={
+                    **getattr(settings, 'REST_FRAMEWORK', {}),
+                    'DEFAULT_THROTTLE_RATES': {},
+                })
+                no_throttle.enable()
+            server = self.start_server()
+            base_url = 'http://127.0.0.1:%s' % server.server_address[1]
+
+        scenarios = self.scenarios()
+        if options['routes']:
+            wanted = set(options['routes'].split(','))
+            scenarios = [scenario for scenario in scenarios if scenario[0] in wanted]
+
+        results = {}
+        try:
+            for name, build in scenarios:
+                results[name] = self.run_scenario(
+                    base_url, build, clients,
+                    options['requests'], options['concurrency'],
+                )
+                self.stdout.write(
+                    '{:<40} {throughput:>9} req/s  p50 {p50_ms} ms  p95 {p95_ms} ms  '
+                    'p99 {p99_ms} ms  errors {errors}'.format(name, **results[name])
+                )
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if no_throttle is not None:
+                no_throttle.disable()
+            if not options['keep_data']:
+                benchmarking.remove_seeded()
+
+        report = {
+            'label': options['label'],
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'config': {
+                key: options[key] for key in
+                ('users', 'records', 'tags', 'chemcomps', 'requests', 'concurrency')
+            },
+            'routes': results,
+        }
+        with open(options['output'], 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+    def load_clients(self):
+        """Return the token and owned ids of every benchmark user"""
+        clients = []
+        users = get_user_model().objects.filter(
+            email__endswith=f'@{benchmarking.BENCH_EMAIL_DOMAIN}'
+        )
+        for user in users:
+            token, _ = Token.objects.get_or_create(user=user)
+            clients.append({
+                'email': user.email,
+                'token': token.key,
+                'synthesize_ids': list(Synthesize.objects.filter(user=user)
+                                       .values_list('id', flat=True)),
+                'tag_ids': list(Tag.objects.filter(user=user).values_list('id', flat=True)),
+                'chemcomp_ids': list(Chemcomp.objects.filter(user=user)
+                                     .values_list('id', flat=True)),
+            })
+        return clients
+
+    def start_server(self):
+        """Serve the project's WSGI application from a background thread"""
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        server.set_app(get_internal_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def scenarios(self):
+        """Return (route name, request builder) for every API route"""
+        image = sample_jpeg()
+        synthe_list = reverse('synthesize:synthesize-list')
+
+        def pick(values, rand, count=1):
+            return rand.sample(values, min(count, len(values)))
+
+        return [
+            ('user:token', lambda c, r: json_request('POST', reverse('user:token'), {
+                'email': c['email'], 'password': benchmarking.BENCH_PASSWORD,
+            })),
+            ('user:me', lambda c, r: json_request('GET', reverse('user:me'))),
+            ('synthesize:tag-list', lambda c, r: json_request(
+                'GET', reverse('synthesize:tag-list'))),
+            ('synthesize:tag-create', lambda c, r: json_request(
+                'POST', reverse('synthesize:tag-list'), {'name': 'bench tag'})),
+            ('synthesize:chemcomp-list', lambda c, r: json_request(
+                'GET', reverse('synthesize:chemcomp-list'))),
+            ('synthesize:chemcomp-create', lambda c, r: json_request(
+                'POST', reverse('synthesize:chemcomp-list'), {'name': 'bench chemcomp'})),
+            ('synthesize:synthesize-list', lambda c, r: json_request('GET', synthe_list)),
+            ('synthesize:synthesize-filter', lambda c, r: json_request(
+                'GET', synthe_list + '?tags=' + ','.join(
+                    str(tag_id) for tag_id in pick(c['tag_ids'], r, 2)))),
+            ('synthesize:synthesize-detail', lambda c, r: json_request(
+                'GET', reverse('synthesize:synthesize-detail',
+                               args=pick(c['synthesize_ids'], r)))),
+            ('synthesize:synthesize-create', lambda c, r: json_request('POST', synthe_list, {
+                'title': 'bench record', 'time_years': 1000, 'chance': '42.00',
+                'tags': pick(c['tag_ids'], r, 3),
+                'chemcomps': pick(c['chemcomp_ids'], r, 3),
+            })),
+            ('synthesize:synthesize-upload-image', lambda c, r: multipart_request(
+                reverse('synthesize:synthesize-upload-image',
+                        args=pick(c['synthesize_ids'], r)),
+                'image', 'bench.jpg', image)),
+        ]
+
+    def run_scenario(self, base_url, build, clients, total, concurrency):
+        """Send `total` requests with `concurrency` parallel clients"""
+
+        def send(index):
+            client = clients[index % len(clients)]
+            method, path, body, headers = build(client, random.Random(index))
+            headers['Authorization'] = f'Token {client["token"]}'
+            request = urllib.request.Request(
+                base_url + path, data=body, headers=headers, method=method,
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as error:
+                status = error.code
+            except (urllib.error.URLError, OSError):
+                status = None       # refused, reset or timed out
+            return time.perf_counter() - started, status
+
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for latency, status in pool.map(send, range(total)):
+                latencies.append(latency)
+                if status is None or status >= 400:
+                    errors += 1
+
+        return benchmarking.summarize(latencies, time.perf_counter() - started, errors)
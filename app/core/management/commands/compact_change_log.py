@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core import changes
+from core.models import ChangeLog
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than CHANGES_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=getattr(settings, 'CHANGES_RETENTION_DAYS', 30))
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = ChangeLog.objects.filter(created__lt=cutoff)
+        deleted = 0
+        for user_id in old.values_list('user_id', flat=True).distinct().iterator():
+            changes.sequence(user_id)
+            last = old.filter(user_id=user_id).aggregate(last=Max('position'))['last']
+            with transaction.atomic():
+                count, _ = ChangeLog.objects.filter(user_id=user_id, position__lte=last).delete()
+                # cursors before this position can't be served any more
+                ChangeLog.objects.create(user_id=user_id, model='', object_id=0,
+                                         action=ChangeLog.TRUNCATED, position=last)
+            deleted += count
+        self.stdout.write(self.style.SUCCESS(f'{deleted} change log entries deleted'))
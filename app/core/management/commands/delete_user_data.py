@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import deletion
+from core.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = 'Delete users, or only their synthesizes, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*')
+        parser.add_argument('--synthesizes-only', action='store_true',
+                            help='keep the users, tags and chemcomps')
+        parser.add_argument('--resume', action='store_true',
+                            help='also finish jobs that failed or whose runner stopped')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        kind = DeletionJob.SYNTHESIZES if options['synthesizes_only'] else DeletionJob.USER
+        users = get_user_model().objects.filter(email__in=options['emails'])
+        missing = set(options['emails']) - {user.email for user in users}
+        if missing:
+            raise CommandError(f'Unknown users: {", ".join(sorted(missing))}')
+
+        jobs = [deletion.create_job(user, kind) for user in users]
+        if options['resume']:
+            jobs = list(DeletionJob.objects.filter(deletion.claimable())
+                        .exclude(pk__in=[job.pk for job in jobs])) + jobs
+
+        for job in jobs:
+            finished = deletion.run_job(
+                job, options['batch_size'],
+                progress=lambda job: self.stdout.write(f'{job}: {job.rows_deleted} rows deleted'),
+            )
+            if finished is None:
+                self.stdout.write(f'{job}: skipped, another runner holds it')
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f'{job}: done, {job.rows_deleted} rows and {job.files_deleted} files deleted'
+            ))
@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.deletion import delete_file
+from core.models import SYNTHESIZE_IMAGE_DIR, Synthesize
+
+
+def unreferenced(directory, cutoff, batch_size):
+    """Yield the image files older than cutoff no synthesize refers to, batch by batch.
+
+    The directory is streamed and looked up batch_size names at a time,
+    neither the listing nor the referenced names are held in memory."""
+    with os.scandir(directory) as entries:
+        batch = {}
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:     # newer ones may belong to uploads in flight
+                batch[SYNTHESIZE_IMAGE_DIR + entry.name] = stat.st_size
+            if len(batch) >= batch_size:
+                yield orphans(batch)
+                batch = {}
+        if batch:
+            yield orphans(batch)
+
+
+def orphans(batch):
+    referenced = set(Synthesize.objects.filter(image__in=batch).values_list('image', flat=True))
+    return [(name, size) for name, size in batch.items() if name not in referenced]
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded synthesize images no synthesize refers to anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only list the files that would be deleted')
+        parser.add_argument('--grace-seconds', type=int, default=86400,
+                            help='keep files younger than this, uploads may not be saved yet')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=8)
+
+    def handle(self, *args, **options):
+        directory = default_storage.path(SYNTHESIZE_IMAGE_DIR)
+        if not os.path.isdir(directory):
+            self.stdout.write(self.style.SUCCESS('No uploaded images'))
+            return
+
+        cutoff = time.time() - options['grace_seconds']
+        found = deleted = freed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for batch in unreferenced(directory, cutoff, options['batch_size']):
+                found += len(batch)
+                if options['dry_run']:
+                    for name, size in batch:
+                        self.stdout.write(f'{name} ({size} bytes)')
+                    freed += sum(size for _, size in batch)
+                    continue
+
+                results = pool.map(delete_file, [name for name, _ in batch])
+                for (_, size), done in zip(batch, results):
+                    deleted += done
+                    freed += size if done else 0
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'{found} unreferenced files, {freed} bytes would be freed'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{deleted} of {found} unreferenced files deleted, {freed} bytes freed'))
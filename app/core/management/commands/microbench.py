@@ -0,0 +1,123 @@
+import json
+import os
+import platform
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import benchmarking
+from core.microbenchmarks import BENCHMARKS
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'microbench_baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Run the microbenchmarks and store or compare against baselines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='only run these benchmarks')
+        parser.add_argument('--repeat', type=int, default=20, help='samples per benchmark')
+        parser.add_argument('--min-time', type=float, default=0.02,
+                            help='minimum seconds per sample')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--save', action='store_true',
+                            help='store the results as the new baseline')
+        parser.add_argument('--compare', action='store_true',
+                            help='compare the results against the baseline')
+        parser.add_argument('--alpha', type=float, default=0.01,
+                            help='significance level of the comparison')
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help='smallest relative change of the median that counts')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+
+        results = self.run(names, options['repeat'], options['min_time'])
+
+        if options['compare']:
+            regressions = self.compare(results, options)
+            if regressions:
+                raise CommandError(f'{regressions} benchmark(s) regressed')
+
+        if options['save']:
+            self.save(results, options['baseline'])
+
+    def run(self, names, repeat, min_time):
+        """Run the benchmarks on seeded data that is rolled back afterwards"""
+        results = {}
+        with transaction.atomic():
+            user = benchmarking.seed(users=1, records=200, tags=30, chemcomps=30)[0]
+            for name in names:
+                timed = BENCHMARKS[name](user)
+                samples = benchmarking.measure(timed, repeat=repeat, min_time=min_time)
+                results[name] = [float(f'{sample:.6g}') for sample in samples]
+                median = statistics.median(samples)
+                self.stdout.write(
+                    f'{name:<45} {median * 1e6:>12.2f} us {1 / median:>12.1f} ops/s'
+                )
+            transaction.set_rollback(True)
+
+        return results
+
+    def environment(self):
+        return {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'database': connection.vendor,
+        }
+
+    def compare(self, results, options):
+        """Print the comparison with the baseline, return the regression count"""
+        try:
+            with open(options['baseline']) as fp:
+                baseline = json.load(fp)
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {options["baseline"]}, run with --save first')
+
+        if baseline.get('environment') != self.environment():
+            self.stdout.write(self.style.WARNING(
+                f'Baseline was recorded on {baseline.get("environment")}, '
+                'results may not be comparable'
+            ))
+
+        regressions = 0
+        for name, samples in results.items():
+            if name not in baseline['benchmarks']:
+                self.stdout.write(f'{name:<45} no baseline')
+                continue
+
+            comparison = benchmarking.compare_samples(
+                baseline['benchmarks'][name], samples,
+                alpha=options['alpha'], threshold=options['threshold'],
+            )
+            line = '{:<45} {:>+8.1%}  p={p_value:<10} {verdict}'.format(
+                name, comparison['ratio'] - 1, **comparison,
+            )
+            if comparison['verdict'] == 'regression':
+                regressions += 1
+                line = self.style.ERROR(line)
+            elif comparison['verdict'] == 'improvement':
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
+
+        return regressions
+
+    def save(self, results, path):
+        """Store the samples as baseline, keeping benchmarks that weren't run"""
+        baseline = {'benchmarks': {}}
+        if os.path.exists(path):
+            with open(path) as fp:
+                baseline = json.load(fp)
+
+        baseline['environment'] = self.environment()
+        baseline['benchmarks'].update(results)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Baseline written to {path}'))
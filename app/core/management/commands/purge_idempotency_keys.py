@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete stored responses of expired idempotency keys'
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(expires__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired idempotency keys deleted'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired refresh tokens'
+
+    def handle(self, *args, **options):
+        deleted = tokens.purge_expired_refresh_tokens()
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired refresh tokens deleted'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import similarity
+from core.models import Synthesize
+
+
+class Command(BaseCommand):
+    help = 'Recompute the similarity signatures of all synthesizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_id, total = 0, 0
+        while True:
+            ids = list(Synthesize.objects.filter(pk__gt=last_id).order_by('pk')
+                       .values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            similarity.update(ids)
+            last_id, total = ids[-1], total + len(ids)
+        self.stdout.write(self.style.SUCCESS(f'{total} synthesizes indexed'))
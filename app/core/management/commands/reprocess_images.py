@@ -0,0 +1,103 @@
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from core import changes, images
+from core.deletion import delete_file
+from core.models import ChangeLog, Synthesize
+
+
+def reprocess_image(name):
+    """Return (new name or None, error), a broken image doesn't stop the run"""
+    try:
+        return images.reprocess(name), None
+    except Exception as error:
+        return None, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = 'Optimise the stored synthesize images and prerender their derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                            help='worker processes for the image work, 1 runs it inline')
+        parser.add_argument('--resume', action='store_true',
+                            help='continue after the last checkpointed synthesize')
+        parser.add_argument('--checkpoint',
+                            default=os.path.join(settings.MEDIA_ROOT, '.reprocess_images.json'))
+        parser.add_argument('--max-writes-per-second', type=float, default=50)
+
+    def handle(self, *args, **options):
+        state = {'last_id': 0, 'processed': 0, 'rewritten': 0, 'failed': 0}
+        if options['resume'] and os.path.exists(options['checkpoint']):
+            with open(options['checkpoint']) as checkpoint:
+                state = json.load(checkpoint)
+
+        executor = None
+        if options['processes'] > 1:
+            connections.close_all()     # not to be shared with the forked workers
+            executor = ProcessPoolExecutor(options['processes'], initializer=django.setup)
+        try:
+            while True:
+                rows = list(
+                    Synthesize.objects.filter(pk__gt=state['last_id'])
+                    .exclude(image='').exclude(image=None)
+                    .order_by('pk').values_list('pk', 'user_id', 'image')[:options['batch_size']]
+                )
+                if not rows:
+                    break
+
+                names = [name for _, _, name in rows]
+                if executor:
+                    results = list(executor.map(reprocess_image, names))
+                else:
+                    results = [reprocess_image(name) for name in names]
+
+                for (pk, user_id, name), (new_name, error) in zip(rows, results):
+                    if error:
+                        state['failed'] += 1
+                        self.stderr.write(f'Synthesize {pk}, {name}: {error}')
+                    elif new_name:
+                        state['rewritten'] += self.save_image(
+                            pk, user_id, name, new_name, options['max_writes_per_second'],
+                        )
+                state['last_id'] = rows[-1][0]
+                state['processed'] += len(rows)
+                self.save_checkpoint(options['checkpoint'], state)
+                self.stdout.write(f'{state["processed"]} images processed, '
+                                  f'{state["rewritten"]} rewritten, {state["failed"]} failed')
+        finally:
+            if executor:
+                executor.shutdown()
+
+        with contextlib.suppress(FileNotFoundError):     # no batch ran, nothing was saved
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {state["processed"]} images processed, {state["rewritten"]} rewritten, '
+            f'{state["failed"]} failed'
+        ))
+
+    def save_image(self, pk, user_id, name, new_name, max_writes_per_second):
+        """Point the synthesize to its rewritten image, at most max_writes_per_second"""
+        started = time.monotonic()
+        with transaction.atomic():
+            # unless a new image was uploaded meanwhile
+            updated = Synthesize.objects.filter(pk=pk, image=name).update(image=new_name)
+            if updated:
+                changes.record(Synthesize(pk=pk, user_id=user_id), ChangeLog.UPDATED)
+        delete_file(name if updated else new_name)
+        time.sleep(max(0.0, 1 / max_writes_per_second - (time.monotonic() - started)))
+        return updated
+
+    def save_checkpoint(self, path, state):
+        with open(f'{path}.tmp', 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(f'{path}.tmp', path)
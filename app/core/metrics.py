@@ -0,0 +1,286 @@
+import atexit
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# Snapshot holding the sums of the workers that are gone, see retire()
+RETIRED_NAME = 'retired'
+
+METRICS_HELP = {
+    'http_request_duration_seconds': ('histogram', 'Request latency per route'),
+    'http_responses_total': ('counter', 'Responses per route, method and status'),
+    'http_request_queries': ('histogram', 'SQL queries executed per request'),
+    'http_requests_shed_total': ('counter', 'Requests rejected by admission control'),
+    'synthesize_image_upload_bytes_total': ('counter', 'Bytes of synthesize images uploaded'),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """In-process store of counters and histograms.
+
+    When METRICS_DIR is set, every worker process periodically writes its
+    snapshot to that directory and the exporter sums all of them up."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        self.pid = None
+        self.worker = None
+
+    @property
+    def name(self):
+        """Name of this process's snapshot: the host, as pids only tell
+        processes apart within one container, the pid, and a random part,
+        as pids are reused"""
+        if self.pid != os.getpid():         # a new process, e.g. after a fork
+            self.pid = os.getpid()
+            self.worker = f'{socket.gethostname()}-{self.pid}-{uuid.uuid4().hex[:8]}'
+        return self.worker
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter"""
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets, **labels):
+        """Record a value in a histogram with the given upper bounds"""
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': list(buckets),
+                    'counts': [0] * len(buckets),
+                    'sum': 0,
+                    'count': 0,
+                }
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break                           # counts are cumulated on export
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        """Return a JSON serializable copy of all metrics"""
+        with self.lock:
+            return {
+                'counters': [
+                    [name, list(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, list(labels), dict(data, counts=list(data['counts']))]
+                    for (name, labels), data in self.histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        """Write this process's snapshot to METRICS_DIR, at most once per interval"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+
+        now = time.monotonic()
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if not force and now - self.last_flush < interval:
+            return
+        self.last_flush = now
+
+        os.makedirs(directory, exist_ok=True)
+        path = snapshot_path(directory, self.name)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as fp:
+            json.dump(self.snapshot(), fp)
+        os.replace(temp_path, path)     # readers never see a half written file
+
+    def retire_snapshot(self):
+        """Fold this process's snapshot into the retired one as it exits"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory and os.path.exists(snapshot_path(directory, self.name)):
+            self.flush(force=True)
+            retire(directory, snapshot_path(directory, self.name))
+
+
+def snapshot_path(directory, name):
+    return os.path.join(directory, f'metrics-{name}.json')
+
+
+def parse_worker(path):
+    """Return the host and pid of a worker's snapshot, None for others"""
+    parts = os.path.basename(path)[len('metrics-'):-len('.json')].rsplit('-', 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    return parts[0], int(parts[1])
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True                     # another user's process
+    return True
+
+
+def retire(directory, path):
+    """Add the snapshot at path to the retired snapshot and remove it.
+
+    Counters must never go down, so the counts of workers that are gone
+    are kept in RETIRED_NAME. Exporters retire under a lock on the
+    directory, so a snapshot is only counted once."""
+    with open(os.path.join(directory, 'metrics.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path) as fp:
+                snapshot = json.load(fp)
+        except FileNotFoundError:
+            return                      # retired by another exporter
+        except ValueError:
+            snapshot = None             # cut short as the worker died
+
+        if snapshot is not None:
+            retired_path = snapshot_path(directory, RETIRED_NAME)
+            snapshots = [snapshot]
+            try:
+                with open(retired_path) as fp:
+                    snapshots.append(json.load(fp))
+            except FileNotFoundError:
+                pass
+            temp_path = f'{retired_path}.tmp'
+            with open(temp_path, 'w') as fp:
+                json.dump(to_snapshot(*merge(snapshots)), fp)
+            os.replace(temp_path, retired_path)
+        remove(path)
+
+
+registry = MetricsRegistry()
+atexit.register(registry.retire_snapshot)
+
+
+def collect():
+    """Return the snapshots of this process and of every other worker.
+
+    Snapshots left behind by workers of this host that died without
+    retiring them are retired first. Pids of other hosts can't be checked
+    from here, their own exporters retire them."""
+    snapshots = [registry.snapshot()]
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory or not os.path.isdir(directory):
+        return snapshots
+
+    host = socket.gethostname()
+    for entry in os.scandir(directory):
+        worker = parse_worker(entry.path) if entry.name.endswith('.json') else None
+        if worker and worker[0] == host and not is_running(worker[1]):
+            retire(directory, entry.path)
+
+    own_file = os.path.basename(snapshot_path(directory, registry.name))
+    for entry in os.scandir(directory):
+        if entry.name == own_file or not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path) as fp:
+                snapshots.append(json.load(fp))
+        except (OSError, ValueError):
+            continue                    # the worker is rewriting or removing it
+
+    return snapshots
+
+
+def merge(snapshots):
+    """Sum up counters and histograms of several snapshots"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+
+        for name, labels, data in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = dict(data, counts=list(data['counts']))
+                continue
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], data['counts'])]
+            merged['sum'] += data['sum']
+            merged['count'] += data['count']
+
+    return counters, histograms
+
+
+def to_snapshot(counters, histograms):
+    """Turn the result of merge() back into a snapshot"""
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), data] for (name, labels), data in histograms.items()],
+    }
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus(snapshots):
+    """Render snapshots in the Prometheus text exposition format"""
+    counters, histograms = merge(snapshots)
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name in described or name not in METRICS_HELP:
+            return
+        described.add(name)
+        metric_type, help_text = METRICS_HELP[name]
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    for (name, labels), data in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(data['buckets'], data['counts']):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}'
+            )
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {data["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {data["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {data["count"]}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,122 @@
+"""Microbenchmarks of the API hot paths, run with `manage.py microbench`.
+
+Every benchmark is a setup function receiving the seeded benchmark user;
+it prepares its inputs and returns the callable that gets timed."""
+from itertools import count
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core import models
+from synthesize import serializers, views
+
+BENCHMARKS = {}
+
+factory = APIRequestFactory()
+
+
+def benchmark(name):
+    """Register a microbenchmark setup function under the given name"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def synthesize_rows(user):
+    queryset = models.Synthesize.objects.filter(user=user).order_by('-id')
+    return list(queryset.prefetch_related('tags', 'chemcomps')[:50])
+
+
+def viewset_for(viewset_class, user, params, action='list'):
+    request = Request(factory.get('/', params))
+    request.user = user
+    view = viewset_class()
+    view.request = request
+    view.action = action
+    view.format_kwarg = None
+    return view
+
+
+@benchmark('serializers.synthesize.serialize')
+def serialize_synthesizes(user):
+    rows = synthesize_rows(user)    # queries run here, outside of the timed call
+    return lambda: serializers.SynthesizeSerializer(rows, many=True).data
+
+
+@benchmark('serializers.synthesize_detail.serialize')
+def serialize_synthesize_details(user):
+    rows = synthesize_rows(user)
+    return lambda: serializers.SynthesizeDetailSerializer(rows, many=True).data
+
+
+@benchmark('serializers.synthesize.validate')
+def validate_synthesize(user):
+    tag_ids = list(models.Tag.objects.filter(user=user).values_list('id', flat=True)[:10])
+    cc_ids = list(models.Chemcomp.objects.filter(user=user).values_list('id', flat=True)[:10])
+    payload = {
+        'title': 'Validated', 'time_years': 1000, 'chance': '12.50',
+        'link': 'https://example.com', 'tags': tag_ids, 'chemcomps': cc_ids,
+    }
+
+    context = {'request': viewset_for(views.SynthesizeViewSet, user, {}).request}
+
+    def validate():
+        serializer = serializers.SynthesizeSerializer(data=payload, context=context)
+        serializer.is_valid(raise_exception=True)
+
+    return validate
+
+
+@benchmark('models.user_manager.create_user')
+def create_user(user):
+    emails = (f'microbench-{index}@bench.local' for index in count())
+    manager = get_user_model().objects
+    return lambda: manager.create_user(next(emails), 'benchpass', name='Bench')
+
+
+@benchmark('models.synthesize_image_file_path')
+def image_file_path(user):
+    return lambda: models.synthesize_image_file_path(None, 'upload.image.jpeg')
+
+
+@benchmark('views.synthesize.get_queryset')
+def synthesize_get_queryset(user):
+    tag_ids = models.Tag.objects.filter(user=user).values_list('id', flat=True)[:3]
+    cc_ids = models.Chemcomp.objects.filter(user=user).values_list('id', flat=True)[:3]
+    view = viewset_for(views.SynthesizeViewSet, user, {
+        'tags': ','.join(map(str, tag_ids)),
+        'chemcomps': ','.join(map(str, cc_ids)),
+    })
+    return lambda: str(view.get_queryset().query)   # build and compile the SQL, don't run it
+
+
+@benchmark('views.tag.get_queryset')
+def tag_get_queryset(user):
+    view = viewset_for(views.TagViewSet, user, {'assigned_only': '1'})
+    return lambda: str(view.get_queryset().query)
+
+
+@benchmark('auth.authenticate')
+def login(user):
+    """A full login of one user; 1 / duration is the logins per second of one core"""
+    user.set_password('benchpass')
+    user.save(update_fields=['password'])
+    return lambda: authenticate(username=user.email.upper(), password='benchpass')
+
+
+@benchmark('hashers.scrypt.verify')
+def scrypt_verify(user):
+    hasher = get_hasher('scrypt')
+    encoded = make_password('benchpass', hasher='scrypt')
+    return lambda: hasher.verify('benchpass', encoded)
+
+
+@benchmark('hashers.pbkdf2_sha256.verify')
+def pbkdf2_verify(user):
+    hasher = get_hasher('pbkdf2_sha256')
+    encoded = make_password('benchpass', hasher='pbkdf2_sha256')
+    return lambda: hasher.verify('benchpass', encoded)
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import JsonResponse
+
+from core import batch, metrics, tokens
+from core.admission import AdmissionController, Overloaded
+from core.routers import pick_replica, read_from, replica_aliases
+from core.timing import RequestTimer
+
+timing_logger = logging.getLogger('core.timing')
+
+
+def client_credentials(request):
+    """The Authorization header of request, or of the batch it's part of"""
+    return request.META.get('HTTP_AUTHORIZATION') or request.META.get(batch.AUTHORIZATION)
+
+
+class ServerTimingMiddleware:
+    """Time a sampled share of requests and report the breakdown
+    as a Server-Timing header and a structured log line"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 0)
+        if not sample_rate or random.random() >= sample_rate:
+            return self.get_response(request)   # not sampled, no overhead beyond the coin flip
+
+        timer = RequestTimer()
+        request.timer = timer
+        with connection.execute_wrapper(timer.execute_wrapper):
+            response = self.get_response(request)
+
+        response['Server-Timing'] = timer.header_value()
+
+        match = getattr(request, 'resolver_match', None)
+        timing_logger.info(json.dumps({
+            'event': 'request_timing',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **timer.as_dict(),
+        }))
+
+        return response
+
+
+class MetricsMiddleware:
+    """Record latency, status and query count of every request per route"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        metrics.registry.observe(
+            'http_request_duration_seconds', duration, metrics.LATENCY_BUCKETS,
+            route=route, method=request.method,
+        )
+        metrics.registry.observe(
+            'http_request_queries', queries[0], metrics.QUERY_COUNT_BUCKETS,
+            route=route,
+        )
+        metrics.registry.inc(
+            'http_responses_total',
+            route=route, method=request.method, status=response.status_code,
+        )
+        metrics.registry.flush()
+
+        return response
+
+
+class AdmissionControlMiddleware:
+    """Shed load with 503 once this worker runs as many requests as it can.
+
+    Clients are told by their Authorization header, or else their address.
+    Requests are prioritized as reads, writes and uploads by the view they
+    resolve to, see AdmissionController."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.retry_after = getattr(settings, 'ADMISSION_RETRY_AFTER', 1)
+        self.controller = AdmissionController(
+            max_in_flight=getattr(settings, 'ADMISSION_MAX_IN_FLIGHT', 32),
+            max_per_client=getattr(settings, 'ADMISSION_MAX_PER_CLIENT', 8),
+            queue_size=getattr(settings, 'ADMISSION_QUEUE_SIZE', 64),
+            shares=getattr(settings, 'ADMISSION_SHARES', None),
+            deadlines=getattr(settings, 'ADMISSION_QUEUE_DEADLINES', None),
+        )
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            controller, client = getattr(request, '_admission', (None, None))
+            if controller is not None:
+                controller.release(client)
+
+    def get_priority(self, request, view_func):
+        actions = getattr(view_func, 'actions', None) or {}
+        if actions.get(request.method.lower()) == 'upload_image':
+            return 'uploads'
+        return 'reads' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'writes'
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        client = client_credentials(request) or request.META.get('REMOTE_ADDR')
+        priority = self.get_priority(request, view_func)
+        # sub-requests of a batch count against the slots of the worker that
+        # admitted the batch, but must not wait while the batch holds one
+        batch_controller = getattr(request, 'batch_admission', None)
+        controller = batch_controller or self.controller
+        try:
+            # sync views of an ASGI worker share one thread, waiting would stall it
+            controller.acquire(
+                client, priority,
+                wait=batch_controller is None and not isinstance(request, ASGIRequest),
+            )
+        except Overloaded as error:
+            metrics.registry.inc('http_requests_shed_total', priority=priority,
+                                 reason=error.reason)
+            response = JsonResponse(
+                {'detail': 'Server is overloaded, try again later.'}, status=503,
+            )
+            response['Retry-After'] = str(self.retry_after)
+            return response
+
+        request._admission = (controller, client)
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Serve the reads of GET, HEAD and OPTIONS requests from a read replica.
+
+    A client that sent any other request is pinned to the primary for
+    REPLICA_PIN_SECONDS, so it reads its own writes despite replication
+    lag. Clients are told apart by their credentials: the user of a signed
+    access token, else the Authorization header itself. Credentials handed
+    out by a write are pinned with it (see `routers.pin_credentials`), so
+    the first reads with a fresh token find it. Anonymous clients are never
+    pinned. Pins are kept in the REPLICA_PIN_CACHE cache, which must be
+    shared by all workers."""
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def pin_key(self, authorization):
+        if not authorization:
+            return None
+        scheme, _, credentials = authorization.partition(' ')
+        if scheme.lower() == 'bearer':
+            try:
+                return f'replica-pin:user:{tokens.decode_access_token(credentials)[0]}'
+            except (signing.BadSignature, KeyError, TypeError):
+                return None
+        return f'replica-pin:auth:{hashlib.sha256(authorization.encode()).hexdigest()}'
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        cache = caches[getattr(settings, 'REPLICA_PIN_CACHE', 'default')]
+        key = self.pin_key(client_credentials(request))
+
+        if request.method not in self.SAFE_METHODS:
+            response = self.get_response(request)
+            keys = {key} | {
+                self.pin_key(authorization)
+                for authorization in getattr(request, 'replica_pin_credentials', ())
+            }
+            keys.discard(None)
+            if keys:
+                cache.set_many(dict.fromkeys(keys, True),
+                               getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+            return response
+
+        if key is not None and cache.get(key):
+            return self.get_response(request)
+        with read_from(pick_replica()):
+            return self.get_response(request)
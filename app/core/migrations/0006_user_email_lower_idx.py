@@ -0,0 +1,18 @@
+# Generated by Django 3.2.2 on 2026-10-19 13:37
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+from core.operations import add_index
+
+
+class Migration(migrations.Migration):
+    atomic = False      # indexes can't be built concurrently inside a transaction
+
+    dependencies = [
+        ('core', '0005_synthesize_image'),
+    ]
+
+    operations = [
+        add_index('user', models.Index(django.db.models.functions.text.Lower('email'), name='core_user_email_lower_idx')),
+    ]
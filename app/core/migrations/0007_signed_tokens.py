@@ -0,0 +1,45 @@
+# Generated by Django 3.2.2 on 2026-10-19 13:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+
+from core.operations import OnlyOn
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_email_lower_idx'),
+    ]
+
+    operations = [
+        # SQLite rebuilds the table to add a column and can't rebuild
+        # expression indexes (Django 3.2), so drop and recreate it around that;
+        # other databases add the column in place and keep the index
+        OnlyOn(['sqlite'], migrations.RemoveIndex(
+            model_name='user',
+            name='core_user_email_lower_idx',
+        )),
+        migrations.AddField(
+            model_name='user',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        OnlyOn(['sqlite'], migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='core_user_email_lower_idx'),
+        )),
+        migrations.CreateModel(
+            name='RefreshToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_hash', models.CharField(max_length=64, unique=True)),
+                ('token_version', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expires', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
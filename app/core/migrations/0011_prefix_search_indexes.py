@@ -0,0 +1,19 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:01
+
+from django.db import migrations, models
+
+from core.operations import add_index
+
+
+class Migration(migrations.Migration):
+    atomic = False      # indexes can't be built concurrently inside a transaction
+
+    dependencies = [
+        ('core', '0010_changelog'),
+    ]
+
+    operations = [
+        add_index('chemcomp', models.Index(fields=['name'], name='core_chemcomp_name_prefix_idx', opclasses=['varchar_pattern_ops'])),
+        add_index('synthesize', models.Index(fields=['title'], name='core_synth_title_prefix_idx', opclasses=['varchar_pattern_ops'])),
+        add_index('tag', models.Index(fields=['name'], name='core_tag_name_prefix_idx', opclasses=['varchar_pattern_ops'])),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:04
+
+from django.db import migrations, models
+
+from core.operations import add_index
+
+
+class Migration(migrations.Migration):
+    atomic = False      # indexes can't be built concurrently inside a transaction
+
+    dependencies = [
+        ('core', '0011_prefix_search_indexes'),
+    ]
+
+    operations = [
+        add_index('synthesize', models.Index(fields=['user', 'id'], name='core_synth_user_id_idx')),
+        add_index('synthesize', models.Index(fields=['user', 'chance', 'id'], name='core_synth_user_chance_idx')),
+        add_index('synthesize', models.Index(fields=['user', 'time_years', 'id'], name='core_synth_user_years_idx')),
+        add_index('synthesize', models.Index(fields=['user', 'title', 'id'], name='core_synth_user_title_idx')),
+    ]
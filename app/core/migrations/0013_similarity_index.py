@@ -0,0 +1,36 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_synthesize_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilaritySignature',
+            fields=[
+                ('synthesize', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='core.synthesize')),
+                ('signature', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('synthesize', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.synthesize')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='similarityband',
+            index=models.Index(fields=['user', 'band', 'bucket'], name='core_simband_bucket_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_similarity_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='refreshtoken',
+            name='expires',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
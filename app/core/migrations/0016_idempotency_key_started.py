@@ -0,0 +1,19 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_deletion_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='started',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:31
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def position_existing_entries(apps, schema_editor):
+    # cursors handed out so far are ids, an entry keeps its id as position
+    ChangeLog = apps.get_model('core', 'ChangeLog')
+    ChangeLog.objects.using(schema_editor.connection.alias).update(position=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_idempotency_key_started'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='changelog',
+            name='core_changelog_user_id_idx',
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='position',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(position_existing_entries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['user', 'position'], name='core_changelog_user_pos_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.2 on 2026-10-19 14:41
+
+from django.db import migrations, models
+
+from core.operations import add_index
+
+
+class Migration(migrations.Migration):
+    atomic = False      # indexes can't be built concurrently inside a transaction
+
+    dependencies = [
+        ('core', '0017_changelog_position'),
+    ]
+
+    operations = [
+        add_index('synthesize', models.Index(fields=['image'], name='core_synth_image_idx')),
+    ]
@@ -2,17 +2,22 @@ import uuid
 import os
 
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 
 from django.conf import settings    # recommended way to import settings in django
 
+SYNTHESIZE_IMAGE_DIR = 'uploads/synthesize/'
+
+
 def synthesize_image_file_path(instance, main_filename):
     """return a valid path for uploaded file with unique name"""
     main_file_extension = main_filename.split('.')[-1]
     new_filename = f'{uuid.uuid4()}.{main_file_extension}'
 
-    return os.path.join('uploads/synthesize/', new_filename)
+    return os.path.join(SYNTHESIZE_IMAGE_DIR, new_filename)
 
 
 class UserManager(BaseUserManager):
@@ -47,11 +52,17 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    token_version = models.PositiveIntegerField(default=0)     # bumped to revoke signed tokens
 
     objects = UserManager()
 
     USERNAME_FIELD = "email"
 
+    class Meta:
+        indexes = [
+            models.Index(Lower('email'), name='core_user_email_lower_idx'),    # case-insensitive login
+        ]
+
 
 class Tag(models.Model):
     """Model for tag management for Synthesize"""
@@ -61,6 +72,13 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            # prefix search in the admin, `name LIKE 'abc%'`
+            models.Index(fields=['name'], name='core_tag_name_prefix_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
+
     def __str__(self) -> str:
         """String reprensation of tag object"""
         return self.name
@@ -74,6 +92,12 @@ class Chemcomp(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='core_chemcomp_name_prefix_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
@@ -92,5 +116,163 @@ class Synthesize(models.Model):
     chance = models.DecimalField(max_digits=5, decimal_places=2)
     image = models.ImageField(null=True, upload_to=synthesize_image_file_path)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['title'], name='core_synth_title_prefix_idx',
+                         opclasses=['varchar_pattern_ops']),
+            # list filters and orderings within a user, ties broken by id
+            models.Index(fields=['user', 'id'], name='core_synth_user_id_idx'),
+            models.Index(fields=['user', 'chance', 'id'], name='core_synth_user_chance_idx'),
+            models.Index(fields=['user', 'time_years', 'id'], name='core_synth_user_years_idx'),
+            models.Index(fields=['user', 'title', 'id'], name='core_synth_user_title_idx'),
+            # gc_media looks files up by name
+            models.Index(fields=['image'], name='core_synth_image_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return self.title
+
+
+class RefreshToken(models.Model):
+    """Long lived token exchanged for new signed access tokens"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='refresh_tokens',
+    )
+    key_hash = models.CharField(max_length=64, unique=True)    # sha256 of the key, never the key itself
+    token_version = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)     # purge_refresh_tokens deletes by it
+
+    def __str__(self) -> str:
+        return f'Refresh token of {self.user_id}'
+
+
+class DeletionJob(models.Model):
+    """Batched deletion of a user, or of all their synthesizes, with its progress"""
+    USER = 'user'
+    SYNTHESIZES = 'synthesizes'
+    KIND_CHOICES = [(USER, 'User and all their data'), (SYNTHESIZES, 'All synthesizes of a user')]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,     # the job outlives the user it deletes
+        null=True,
+        related_name='+',
+    )
+    email = models.EmailField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    rows_deleted = models.PositiveIntegerField(default=0)
+    files_deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)    # renewed by the runner holding the job
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f'Delete {self.kind} of {self.email}'
+
+
+class IdempotencyKey(models.Model):
+    """Response of a request sent with an Idempotency-Key, replayed on retries"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)      # sha256 of method, path and payload
+    response_status = models.PositiveSmallIntegerField(null=True)     # null while in progress
+    response_data = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(default=timezone.now)     # of the request holding the key
+    expires = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='core_idempotency_user_key'),
+        ]
+
+    def __str__(self) -> str:
+        return self.key
+
+
+class ChangeLog(models.Model):
+    """Append-only log of changes to a user's data, the position is the sync cursor"""
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    LINKED = 'linked'
+    UNLINKED = 'unlinked'
+    TRUNCATED = 'truncated'     # marks the last position removed by compact_change_log
+
+    # a cascade would run before the tombstones of the user's rows are
+    # written, core.changes removes the log once the user is gone instead
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+    )
+    model = models.CharField(max_length=20)      # synthesize, tag or chemcomp
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10)
+    related_model = models.CharField(max_length=20, blank=True)    # set for (un)linked
+    related_id = models.BigIntegerField(null=True)
+    position = models.BigIntegerField(null=True)    # given once committed, see core.changes.sequence
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'position'], name='core_changelog_user_pos_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.action} {self.model} {self.object_id}'
+
+
+class SimilaritySignature(models.Model):
+    """MinHash signature of the tags and chemcomps of a synthesize, see core/similarity.py"""
+    synthesize = models.OneToOneField(
+        'Synthesize',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    signature = models.BinaryField()
+
+    def __str__(self) -> str:
+        return f'Signature of synthesize {self.synthesize_id}'
+
+
+class SimilarityBand(models.Model):
+    """One LSH band of a signature, synthesizes sharing a bucket are candidate neighbours"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,     # leads the bucket index
+    )
+    synthesize = models.ForeignKey(
+        'Synthesize',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()       # hash of the band's rows
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'band', 'bucket'], name='core_simband_bucket_idx'),
+        ]
+
     def __str__(self) -> str:
-        return self.title
\ No newline at end of file
+        return f'Band {self.band} of synthesize {self.synthesize_id}'
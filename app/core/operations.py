@@ -0,0 +1,57 @@
+"""Migration operations running differently per database vendor"""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+from django.db.migrations.operations.base import Operation
+
+
+class OnlyOn(Operation):
+    """Run operation against the database only on the given vendors.
+
+    The migration state always changes, so the models look the same on
+    every database; only the schema changes are skipped elsewhere, or
+    made by otherwise, an operation leading to the same state."""
+    reduces_to_sql = False
+
+    def __init__(self, vendors, operation, otherwise=None):
+        self.vendors = vendors
+        self.operation = operation
+        self.otherwise = otherwise
+
+    def deconstruct(self):
+        kwargs = {'otherwise': self.otherwise} if self.otherwise is not None else {}
+        return self.__class__.__name__, [self.vendors, self.operation], kwargs
+
+    @property
+    def reversible(self):
+        return self.operation.reversible and getattr(self.otherwise, 'reversible', True)
+
+    def operation_for(self, connection):
+        return self.operation if connection.vendor in self.vendors else self.otherwise
+
+    def state_forwards(self, app_label, state):
+        self.operation.state_forwards(app_label, state)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        operation = self.operation_for(schema_editor.connection)
+        if operation is not None:
+            operation.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        operation = self.operation_for(schema_editor.connection)
+        if operation is not None:
+            operation.database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        description = f'{self.operation.describe()} (on {", ".join(self.vendors)} only)'
+        if self.otherwise is not None:
+            description += f', else {self.otherwise.describe()}'
+        return description
+
+
+def add_index(model_name, index):
+    """AddIndex built without blocking writes to the table on PostgreSQL.
+
+    Indexes can't be built concurrently inside a transaction, so the
+    migration must set atomic = False."""
+    return OnlyOn(['postgresql'], AddIndexConcurrently(model_name=model_name, index=index),
+                  otherwise=migrations.AddIndex(model_name=model_name, index=index))
@@ -0,0 +1,198 @@
+"""Pagination that doesn't count every row of large tables.
+
+An exact COUNT(*) reads every matching row. Here rows are counted
+exactly only up to EXACT_COUNT_LIMIT; past that the count is the query
+planner's estimate where the database has one (PostgreSQL), else the
+limit itself, and is flagged as not exact."""
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Return the planner's estimate of the rows of queryset, or None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def limited_count(queryset, limit=None):
+    """Count the rows of queryset, return (count, exact).
+
+    At most limit + 1 rows are read, a larger count is estimated. The
+    capped count always runs first: the planner's estimate can be far
+    off either way, a small count is never replaced by it."""
+    if not isinstance(queryset, QuerySet):
+        return len(queryset), True
+    if limit is None:
+        limit = getattr(settings, 'EXACT_COUNT_LIMIT', 10000)
+
+    count = queryset.order_by()[:limit + 1].count()
+    if count <= limit:
+        return count, True
+    # the estimate may be off, but never report fewer rows than were counted
+    return max(estimate_count(queryset) or 0, count), False
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator counting large object lists with limited_count"""
+
+    exact = True
+
+    @cached_property
+    def count(self):
+        count, self.exact = limited_count(self.object_list)
+        return count
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """Limit/offset pagination of lists requested with a `limit`.
+
+    Lists requested without one stay unpaginated. The count is exact up
+    to EXACT_COUNT_LIMIT rows, estimated past it and flagged by
+    `count_exact`; `?count=exact` asks for an exact count whatever it
+    costs. Whether there's a next page is known from fetching one row
+    past the page, never from the count."""
+    max_limit = 1000
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.request = request
+        if request.query_params.get(self.count_query_param) == 'exact':
+            self.count, self.count_exact = self.get_count(queryset), True
+        else:
+            self.count, self.count_exact = limited_count(queryset)
+
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        if not self.count_exact:
+            if self.has_next:
+                self.count = max(self.count, self.offset + len(rows))
+            elif rows:      # the last page, which tells the count exactly
+                self.count, self.count_exact = self.offset + len(rows), True
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return super().get_next_link()
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_exact': self.count_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class CursorSerializer(signing.JSONSerializer):
+    """JSON serializer for signing that also takes dates and decimals"""
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=DjangoJSONEncoder).encode('latin-1')
+
+
+class KeysetPagination(BasePagination):
+    """Pagination by position in the list's ordering, for `?page_size=`.
+
+    The cursor holds the sort key values of the last row of a page; the
+    next page is the rows after them, which an index on the ordering
+    finds without counting or skipping the rows before. The queryset's
+    ordering has to be total, i.e. end with a unique field. Cursors are
+    signed for their ordering, clients can't make up their own."""
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            self.page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            self.page_size = 0
+        if self.page_size < 1:
+            raise NotFound('Invalid page size.')
+        self.page_size = min(self.page_size, self.max_page_size)
+        self.request = request
+        self.model = queryset.model
+        self.keys = [(name.lstrip('-'), name.startswith('-'))
+                     for name in queryset.query.order_by]
+        self.salt = f'core.pagination.keyset:{",".join(queryset.query.order_by)}'
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.next_position = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_position = [getattr(rows[-1], name) for name, _ in self.keys]
+        return rows
+
+    def after(self, position):
+        """Condition for the rows after position, e.g. for ordering by
+        (-chance, -id): chance < c OR (chance = c AND id < i)"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, position):
+            condition |= Q(**equal, **{f'{name}__{"lt" if descending else "gt"}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, position):
+        return signing.dumps(position, salt=self.salt, serializer=CursorSerializer)
+
+    def decode_cursor(self, cursor):
+        """Return the position in cursor as values of the sort key's fields"""
+        try:
+            position = signing.loads(cursor, salt=self.salt, serializer=CursorSerializer)
+        except signing.BadSignature:
+            raise NotFound('Invalid cursor.')
+        if not isinstance(position, list) or len(position) != len(self.keys):
+            raise NotFound('Invalid cursor.')
+        try:
+            values = [self.model._meta.get_field(name).to_python(value)
+                      for (name, _), value in zip(self.keys, position)]
+        except (ValidationError, TypeError):
+            raise NotFound('Invalid cursor.')
+        if None in values:
+            raise NotFound('Invalid cursor.')
+        return values
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
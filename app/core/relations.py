@@ -0,0 +1,45 @@
+"""Add and remove tags and chemcomps of synthesizes without rewriting the set.
+
+Both run a single statement on the M2M through table, however many
+synthesizes and related ids are given. Like `QuerySet.update`, they
+don't send `m2m_changed`; the change log and the similarity index are
+updated directly instead, in the same transaction as the links."""
+from django.db import transaction
+
+from core.changes import record_links
+from core.similarity import update_on_commit
+from core.models import Synthesize
+
+RELATION_FIELDS = ('tags', 'chemcomps')
+
+
+def _through(field_name):
+    field = Synthesize._meta.get_field(field_name)
+    return field.remote_field.through, f'{field.m2m_field_name()}_id', \
+        f'{field.m2m_reverse_field_name()}_id'
+
+
+@transaction.atomic(savepoint=False)     # part of the caller's transaction, if any
+def add_related(user_id, field_name, synthesize_ids, related_ids):
+    """Link every synthesize to every related id, skipping existing links"""
+    through, source, target = _through(field_name)
+    through.objects.bulk_create([
+        through(**{source: synthesize_id, target: related_id})
+        for synthesize_id in synthesize_ids
+        for related_id in related_ids
+    ], batch_size=1000, ignore_conflicts=True)
+    record_links(user_id, field_name, synthesize_ids, related_ids, linked=True)
+    update_on_commit(synthesize_ids)
+
+
+@transaction.atomic(savepoint=False)
+def remove_related(user_id, field_name, synthesize_ids, related_ids):
+    """Unlink the related ids from every synthesize, return the links removed"""
+    through, source, target = _through(field_name)
+    deleted, _ = through.objects.filter(**{
+        f'{source}__in': synthesize_ids, f'{target}__in': related_ids,
+    }).delete()
+    if deleted:
+        record_links(user_id, field_name, synthesize_ids, related_ids, linked=False)
+        update_on_commit(synthesize_ids)
+    return deleted
@@ -0,0 +1,74 @@
+"""Send the reads of safe requests to read replicas.
+
+Outside of requests routed by ReplicaRoutingMiddleware, e.g. in
+management commands, every query goes to the primary, so code that
+reads and then writes never acts on stale replica data."""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def read_from(alias):
+    """Send reads within the block to the given database alias"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Writes go to the primary, reads to the replica picked for the
+    current request, if any"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True     # replicas hold the same data as the primary
+
+
+def pin_credentials(request, authorization):
+    """Pin the client that will send `Authorization: <authorization>` to
+    the primary, like the client of the current write; for views handing
+    out credentials, whose first reads need the rows the write created"""
+    request = getattr(request, '_request', request)     # the HttpRequest of a DRF request
+    request.replica_pin_credentials = \
+        getattr(request, 'replica_pin_credentials', []) + [authorization]
+
+
+def pick_replica():
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases else None
+
+
+def check_pin_cache(app_configs, **kwargs):
+    """Refuse replicas with a pin cache workers don't share, with which a
+    client's next read lands on a worker that doesn't know about its write"""
+    if not replica_aliases():
+        return []
+    alias = getattr(settings, 'REPLICA_PIN_CACHE', 'default')
+    if isinstance(caches[alias], (LocMemCache, DummyCache)):
+        return [checks.Error(
+            f'The replica pin cache {alias!r} is not shared by the worker processes.',
+            hint='Point REPLICA_PIN_CACHE to a database, memcached or file based cache.',
+            id='core.E001',
+        )]
+    return []
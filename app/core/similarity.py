@@ -0,0 +1,159 @@
+"""Similar synthesizes by the Jaccard similarity of their tags and chemcomps.
+
+Each synthesize with tags or chemcomps has a MinHash signature: for
+each of PERMUTATIONS hash functions, the smallest hash of its elements.
+Two signatures agree at a position with a probability equal to the
+Jaccard similarity of the two sets. Signatures are cut into BANDS bands
+and synthesizes sharing the bucket of a band are the candidates, found
+through the (user, band, bucket) index instead of comparing every pair.
+At most SIMILARITY_MAX_CANDIDATES candidates, those sharing the most
+bands, are loaded and ranked by their estimated similarity, the best
+ones then by the exact similarity of their current sets.
+
+Signatures are updated once the transaction changing the links commits.
+Deleting a tag or chemcomp doesn't update them, it only leaves an id
+that no longer matches anything; `manage.py rebuild_similarity_index`
+recomputes them all."""
+import hashlib
+import random
+import struct
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import m2m_changed
+
+from core.models import SimilarityBand, SimilaritySignature, Synthesize
+
+PERMUTATIONS = 64
+BANDS = 16      # of 4 rows: pairs over about half similar are very likely candidates
+ROWS = PERMUTATIONS // BANDS
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20211)     # the same hash functions in every process
+_HASHES = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(PERMUTATIONS)]
+
+
+def element_sets(synthesize_ids):
+    """Return the tag and chemcomp elements of each synthesize"""
+    sets = {synthesize_id: set() for synthesize_id in synthesize_ids}
+    for field_name, offset in (('tags', 0), ('chemcomps', 1)):
+        field = Synthesize._meta.get_field(field_name)
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = field.remote_field.through.objects.filter(**{f'{source}__in': sets})
+        for synthesize_id, related_id in links.values_list(source, target):
+            sets[synthesize_id].add(related_id * 2 + offset)   # tags even, chemcomps odd
+    return sets
+
+
+def signature(elements):
+    return [min((a * x + b) % _PRIME for x in elements) & 0xFFFFFFFF for a, b in _HASHES]
+
+
+def pack(values):
+    return struct.pack(f'<{len(values)}I', *values)
+
+
+def unpack(data):
+    data = bytes(data)
+    return struct.unpack(f'<{len(data) // 4}I', data)
+
+
+def buckets(values):
+    """Return the bucket of each band of a signature"""
+    return [
+        int.from_bytes(
+            hashlib.blake2b(pack(values[band * ROWS:(band + 1) * ROWS]), digest_size=8).digest(),
+            'little', signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+
+def update(synthesize_ids):
+    """Recompute the signatures and bands of the synthesizes"""
+    owners = dict(Synthesize.objects.filter(pk__in=synthesize_ids).values_list('pk', 'user_id'))
+    sets = element_sets(owners)
+    signatures, bands = [], []
+    for synthesize_id, elements in sets.items():
+        if not elements:
+            continue
+        values = signature(elements)
+        signatures.append(SimilaritySignature(synthesize_id=synthesize_id, signature=pack(values)))
+        bands.extend(
+            SimilarityBand(user_id=owners[synthesize_id], synthesize_id=synthesize_id,
+                           band=band, bucket=bucket)
+            for band, bucket in enumerate(buckets(values))
+        )
+
+    with transaction.atomic():
+        SimilarityBand.objects.filter(synthesize_id__in=synthesize_ids).delete()
+        SimilaritySignature.objects.filter(synthesize_id__in=synthesize_ids).delete()
+        SimilaritySignature.objects.bulk_create(signatures)
+        SimilarityBand.objects.bulk_create(bands)
+
+
+def update_on_commit(synthesize_ids):
+    synthesize_ids = list(synthesize_ids)
+    transaction.on_commit(lambda: update(synthesize_ids))
+
+
+def similar(synthesize, k):
+    """Return up to k (id, similarity) of the user's synthesizes most similar to synthesize"""
+    row = SimilaritySignature.objects.filter(synthesize_id=synthesize.pk).first()
+    if row is None:
+        return []       # no tags or chemcomps
+
+    values = unpack(row.signature)
+    in_bucket = Q()
+    for band, bucket in enumerate(buckets(values)):
+        in_bucket |= Q(band=band, bucket=bucket)
+    # a common signature shares buckets with many synthesizes, only the
+    # ones sharing the most bands are worth loading
+    candidates = SimilarityBand.objects.filter(in_bucket, user_id=synthesize.user_id) \
+        .exclude(synthesize_id=synthesize.pk).values('synthesize_id') \
+        .annotate(shared=Count('pk')).order_by('-shared', 'synthesize_id') \
+        .values('synthesize_id')[:getattr(settings, 'SIMILARITY_MAX_CANDIDATES', 1000)]
+
+    estimates = sorted(
+        (
+            (-sum(a == b for a, b in zip(values, unpack(other))), synthesize_id)
+            for synthesize_id, other in SimilaritySignature.objects
+            .filter(synthesize_id__in=candidates).values_list('synthesize_id', 'signature')
+        ),
+    )[:k * getattr(settings, 'SIMILARITY_RERANK_FACTOR', 4)]
+    if not estimates:
+        return []
+
+    sets = element_sets([synthesize.pk] + [synthesize_id for _, synthesize_id in estimates])
+    target = sets.pop(synthesize.pk)
+    ranked = sorted(
+        ((jaccard(target, elements), synthesize_id) for synthesize_id, elements in sets.items()),
+        key=lambda item: (-item[0], item[1]),
+    )
+    return [(synthesize_id, score) for score, synthesize_id in ranked[:k] if score > 0]
+
+
+def links_changed(instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # the synthesizes losing the tag or chemcomp are unknown after the clear
+        synthesize_ids = list(instance.synthesize_set.values_list('pk', flat=True))
+    elif action == 'post_clear' and not reverse:
+        synthesize_ids = [instance.pk]
+    elif action in ('post_add', 'post_remove') and pk_set:
+        synthesize_ids = pk_set if reverse else [instance.pk]
+    else:
+        return
+    if synthesize_ids:
+        update_on_commit(synthesize_ids)
+
+
+def connect():
+    for field_name in ('tags', 'chemcomps'):
+        m2m_changed.connect(links_changed, sender=getattr(Synthesize, field_name).through,
+                            dispatch_uid=f'similarity-links-{field_name}')
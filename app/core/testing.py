@@ -0,0 +1,118 @@
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+
+from rest_framework.test import APIClient
+
+
+class QueryBudget:
+    """Declares how many SQL queries a request to an endpoint may run.
+
+    `prepare(user, size)` creates `size` rows for the user and returns the
+    url and payload of the request, so the same request can be repeated
+    at several data sizes."""
+
+    def __init__(self, route, method, budget, prepare, format='json',
+                 anonymous=False, label=None):
+        self.route = route
+        self.method = method
+        self.budget = budget
+        self.prepare = prepare
+        self.format = format
+        self.anonymous = anonymous
+        self.label = label
+
+    def __str__(self):
+        name = f'{self.method} {self.route}'
+        return f'{name} ({self.label})' if self.label else name
+
+
+_user_counter = count()
+
+
+def format_queries(captured):
+    return '\n'.join(
+        f'  {index}. {query["sql"]}' for index, query in enumerate(captured, 1)
+    )
+
+
+def route_names(namespace, urlpatterns):
+    """Return the namespaced names of the given url patterns, including
+    the ones of included patterns"""
+    names = set()
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            inner = f'{namespace}:{pattern.namespace}' if pattern.namespace else namespace
+            names |= route_names(inner, pattern.url_patterns)
+        elif pattern.name:
+            names.add(f'{namespace}:{pattern.name}')
+    return names
+
+
+class QueryBudgetTestMixin:
+    """Runs every declared QueryBudget at two data sizes and fails when the
+    query count grows with the row count or goes over the budget.
+
+    Test cases set `budgets` and the `covered_routes` every budget
+    must account for."""
+
+    budgets = ()
+    covered_routes = ()
+    budget_sizes = (2, 12)
+
+    def create_budget_user(self, size):
+        index = next(_user_counter)
+        return get_user_model().objects.create_user(
+            f'budget-{index}@g.com', 'testpass', name=f'Budget {size}',
+        )
+
+    def count_queries(self, budget, size):
+        user = self.create_budget_user(size)
+        client = APIClient()
+        if not budget.anonymous:
+            client.force_authenticate(user=user)
+        url, data = budget.prepare(user, size)
+
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, budget.method.lower())(
+                url, data, format=budget.format,
+            )
+
+        self.assertLess(
+            response.status_code, 400,
+            f'{budget} failed with {response.status_code}: {getattr(response, "data", "")}',
+        )
+        return context.captured_queries
+
+    def assertQueryBudget(self, budget):
+        small, large = self.budget_sizes
+        small_queries = self.count_queries(budget, small)
+        large_queries = self.count_queries(budget, large)
+
+        if len(large_queries) > len(small_queries):
+            self.fail(
+                f'{budget} runs {len(small_queries)} queries for {small} rows but '
+                f'{len(large_queries)} for {large} rows:\n{format_queries(large_queries)}'
+            )
+
+        if len(large_queries) > budget.budget:
+            self.fail(
+                f'{budget} runs {len(large_queries)} queries, over its budget of '
+                f'{budget.budget}:\n{format_queries(large_queries)}'
+            )
+
+    def test_query_budgets(self):
+        """Test every endpoint stays within its query budget at any data size"""
+        for budget in self.budgets:
+            with self.subTest(endpoint=str(budget)):
+                self.assertQueryBudget(budget)
+
+    def test_every_route_has_a_budget(self):
+        """Test that no route is left without a query budget"""
+        declared = {budget.route for budget in self.budgets}
+        missing = set(self.covered_routes) - declared
+
+        self.assertFalse(missing, f'Routes without a query budget: {sorted(missing)}')
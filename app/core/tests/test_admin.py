@@ -1,8 +1,14 @@
+from decimal import Decimal
+from unittest.mock import patch
+
 from django.http import response
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
+from core.models import Synthesize, Tag
+from core.pagination import EstimatedCountPaginator
+
 
 class AdminSiteTests(TestCase):
 
@@ -41,3 +47,85 @@ class AdminSiteTests(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+
+class LargeTableAdminTests(TestCase):
+    """Tests for the synthesize, tag and chemcomp admin pages"""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@admin.com',
+            password='admin123',
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user('owner@g.com', 'user123')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.synthesize = Synthesize.objects.create(
+            user=self.user, title='Salt water', time_years=5, chance=Decimal('1.00'),
+        )
+        self.synthesize.tags.add(self.tag)
+
+    def test_changelists_search_by_prefix(self):
+        """Test the changelists list and prefix search their rows"""
+        for url, found, missed in (
+            (reverse('admin:core_synthesize_changelist'), 'Salt', 'water'),
+            (reverse('admin:core_tag_changelist'), 'Veg', 'gan'),
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url, {'q': found}).context['cl'].result_count, 1)
+            self.assertEqual(self.client.get(url, {'q': missed}).context['cl'].result_count, 0)
+
+    def test_synthesize_change_page(self):
+        """Test the change page doesn't render every tag as an option"""
+        Tag.objects.create(user=self.user, name='Unrelated')
+        url = reverse('admin:core_synthesize_change', args=[self.synthesize.id])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Vegan')      # the selected tag only
+        self.assertNotContains(response, 'Unrelated')
+
+    def test_tag_autocomplete(self):
+        """Test tags are searched by the autocomplete widget"""
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'Ve', 'app_label': 'core', 'model_name': 'synthesize', 'field_name': 'tags',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['text'] for item in response.json()['results']], ['Vegan'])
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    """Tests for counting large lists only up to a limit"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('many@g.com', 'user123')
+        Tag.objects.bulk_create(Tag(user=self.user, name=f'tag {i}') for i in range(5))
+
+    def test_small_count_exact(self):
+        """Test counts within the limit are exact"""
+        paginator = EstimatedCountPaginator(Tag.objects.order_by('id'), 2)
+
+        self.assertEqual(paginator.count, 5)
+        self.assertTrue(paginator.exact)
+        self.assertEqual(paginator.num_pages, 3)
+
+    @override_settings(EXACT_COUNT_LIMIT=3)
+    def test_large_count_capped(self):
+        """Test counting stops past EXACT_COUNT_LIMIT"""
+        paginator = EstimatedCountPaginator(Tag.objects.order_by('id'), 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 4)
+        self.assertFalse(paginator.exact)
+        self.assertEqual(len(paginator.page(2).object_list), 2)
+
+    @override_settings(EXACT_COUNT_LIMIT=3)
+    @patch('core.pagination.estimate_count', return_value=1000)
+    def test_small_count_not_estimated(self, estimate_count):
+        """Test a count within the limit is exact however off the estimate is"""
+        paginator = EstimatedCountPaginator(Tag.objects.filter(name='tag 1'), 2)
+
+        self.assertEqual(paginator.count, 1)
+        self.assertTrue(paginator.exact)
+        estimate_count.assert_not_called()
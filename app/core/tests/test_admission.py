@@ -0,0 +1,125 @@
+import threading
+import time
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import resolve, reverse
+
+from core.admission import AdmissionController, Overloaded
+from core.middleware import AdmissionControlMiddleware
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    """Tests for capping requests in flight"""
+
+    def test_client_cap(self):
+        """Test one client can't take more than its share of slots"""
+        controller = AdmissionController(max_in_flight=10, max_per_client=2)
+        controller.acquire('a', 'reads')
+        controller.acquire('a', 'reads')
+
+        with self.assertRaises(Overloaded) as context:
+            controller.acquire('a', 'reads')
+        self.assertEqual(context.exception.reason, 'client')
+        controller.acquire('b', 'reads')
+
+    def test_priority_shares(self):
+        """Test uploads only get their share of the slots"""
+        controller = AdmissionController(max_in_flight=4, max_per_client=4)
+        controller.acquire('a', 'uploads')
+
+        with self.assertRaises(Overloaded):
+            controller.acquire('b', 'uploads', wait=False)
+        controller.acquire('b', 'writes')
+        controller.acquire('c', 'reads')
+
+    def test_waiter_times_out(self):
+        """Test a queued request is shed once its deadline passes"""
+        controller = AdmissionController(max_in_flight=1, deadlines={'reads': 0.05})
+        controller.acquire('a', 'reads')
+
+        started = time.monotonic()
+        with self.assertRaises(Overloaded) as context:
+            controller.acquire('b', 'reads')
+        self.assertEqual(context.exception.reason, 'deadline')
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_full_queue_sheds_immediately(self):
+        controller = AdmissionController(max_in_flight=1, queue_size=0)
+        controller.acquire('a', 'reads')
+
+        with self.assertRaises(Overloaded) as context:
+            controller.acquire('b', 'reads')
+        self.assertEqual(context.exception.reason, 'queue')
+
+    def test_waiter_admitted_on_release(self):
+        """Test a queued request runs as soon as a slot frees up"""
+        controller = AdmissionController(max_in_flight=1, deadlines={'reads': 5})
+        controller.acquire('a', 'reads')
+        admitted = threading.Event()
+
+        def wait_for_slot():
+            controller.acquire('b', 'reads')
+            admitted.set()
+
+        thread = threading.Thread(target=wait_for_slot)
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(admitted.is_set())
+
+        controller.release('a')
+        thread.join(timeout=5)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(controller.per_client, {'b': 1})
+
+    def test_lower_priority_waits_behind_higher(self):
+        """Test writes don't take a slot while reads are queued"""
+        controller = AdmissionController(max_in_flight=4, deadlines={'reads': 5})
+        for client in 'abcd':
+            controller.acquire(client, 'reads')
+        thread = threading.Thread(target=controller.acquire, args=('e', 'reads'))
+        thread.start()
+        while not controller.waiting['reads']:
+            time.sleep(0.001)
+
+        with self.assertRaises(Overloaded):
+            controller.acquire('f', 'writes', wait=False)
+
+        controller.release('a')
+        thread.join(timeout=5)
+        self.assertEqual(controller.in_flight, 4)
+
+
+class AdmissionControlMiddlewareTests(SimpleTestCase):
+    """Tests for shedding load in the middleware"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=4, ADMISSION_RETRY_AFTER=3)
+    def test_upload_shed_with_retry_after(self):
+        """Test uploads are shed with 503 and Retry-After once their share is used"""
+        middleware = AdmissionControlMiddleware(lambda request: HttpResponse())
+        middleware.controller.acquire('other', 'uploads')
+        url = reverse('synthesize:synthesize-upload-image', args=[1])
+        request = self.factory.post(url, HTTP_AUTHORIZATION='Token abc')
+
+        response = middleware.process_view(request, resolve(url).func, (), {})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+
+    def test_slot_released_after_response(self):
+        """Test the slot is given back once the view has responded"""
+        def get_response(request):
+            view = resolve(request.path).func
+            return middleware.process_view(request, view, (), {}) or HttpResponse()
+
+        middleware = AdmissionControlMiddleware(get_response)
+        request = self.factory.get(reverse('synthesize:synthesize-list'))
+
+        response = middleware(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(middleware.controller.in_flight, 0)
+        self.assertEqual(middleware.controller.per_client, {})
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.asgi import OffloadMiddleware
+from core.hashers import ScryptPasswordHasher
+
+
+class ScryptPasswordHasherTests(TestCase):
+    """Tests for the scrypt password hasher"""
+
+    def test_encode_and_verify(self):
+        """Test that scrypt hashes verify only the original password"""
+        encoded = make_password('secret', hasher='scrypt')
+
+        self.assertTrue(encoded.startswith('scrypt$'))
+        self.assertTrue(get_hasher('scrypt').verify('secret', encoded))
+        self.assertFalse(get_hasher('scrypt').verify('wrong', encoded))
+
+    def test_changed_parameters_must_update(self):
+        """Test that hashes with other parameters get upgraded"""
+        hasher = ScryptPasswordHasher()
+        encoded = hasher.encode('secret', hasher.salt(), n=2 ** 10)
+
+        self.assertTrue(hasher.verify('secret', encoded))
+        self.assertTrue(hasher.must_update(encoded))
+        self.assertFalse(hasher.must_update(hasher.encode('secret', hasher.salt())))
+
+
+class EmailBackendTests(TestCase):
+    """Tests for the case-insensitive email backend"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('Login@g.com', 'testpass')
+
+    def test_login_is_case_insensitive(self):
+        """Test a user can log in with the email in any case"""
+        self.assertEqual(authenticate(username='LOGIN@G.COM', password='testpass'), self.user)
+        self.assertIsNone(authenticate(username='login@g.com', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@g.com', password='testpass'))
+
+    def test_login_runs_one_query(self):
+        """Test the user and the auth token are read in one query"""
+        with self.assertNumQueries(1):
+            authenticate(username='login@g.com', password='testpass')
+
+    def test_ambiguous_emails_need_exact_match(self):
+        """Test emails that differ only in case aren't mixed up"""
+        other = get_user_model().objects.create_user('login@g.com', 'otherpass')
+
+        self.assertEqual(authenticate(username='login@g.com', password='otherpass'), other)
+        self.assertIsNone(authenticate(username='LOGIN@g.com', password='testpass'))
+
+    def test_old_hash_upgraded_on_login(self):
+        """Test a PBKDF2 password is rehashed with scrypt on login"""
+        self.user.password = make_password('testpass', hasher='pbkdf2_sha256')
+        self.user.save()
+
+        self.assertEqual(authenticate(username='login@g.com', password='testpass'), self.user)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+
+
+@override_settings(ASGI_OFFLOAD_PATHS=['/api/user/token/'])
+class OffloadMiddlewareTests(SimpleTestCase):
+    """Tests for offloading hashing endpoints under ASGI"""
+
+    def run_request(self, path):
+        threads = []
+
+        async def app(scope, receive, send):
+            threads.append(await sync_to_async(threading.get_ident)())
+
+        # a fresh event loop, like an ASGI server's, with no sync caller above it
+        asyncio.run(OffloadMiddleware(app)({'type': 'http', 'path': path}, None, None))
+        return threads[0]
+
+    def test_token_requests_get_their_own_thread(self):
+        """Test sync code of offloaded paths leaves the shared thread"""
+        shared = self.run_request('/api/synthesize/synthesize/')
+        shared_again = self.run_request('/api/user/me/')
+        offloaded = self.run_request('/api/user/token/')
+
+        self.assertEqual(shared, shared_again)
+        self.assertNotEqual(offloaded, shared)
@@ -0,0 +1,134 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Tag
+
+BATCH_URL = reverse('batch')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('synthesize:tag-list')
+SYNTHE_URL = reverse('synthesize:synthesize-list')
+
+
+class BatchApiTests(TestCase):
+    """Tests for running several requests through /api/batch/"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('batch@g.com', 'testpass', name='Batch')
+        self.client.force_authenticate(user=self.user)
+
+    def batch(self, *requests, parallel=False):
+        return self.client.post(BATCH_URL, {'requests': list(requests), 'parallel': parallel},
+                                format='json')
+
+    def test_login_required(self):
+        """Test the batch itself must be authenticated"""
+        response = APIClient().post(BATCH_URL, {'requests': [{'path': ME_URL}]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_initial_screen_in_one_request(self):
+        """Test sub-requests run as the batch's user, responses in order"""
+        Tag.objects.create(user=self.user, name='Mine')
+        other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        Tag.objects.create(user=other, name='Theirs')
+
+        response = self.batch(
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': TAGS_URL},
+            {'method': 'GET', 'path': SYNTHE_URL + '?tags=1'},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        me, tags, synthesizes = response.data
+        self.assertEqual(me['status'], 200)
+        self.assertEqual(me['body']['email'], 'batch@g.com')
+        self.assertEqual([tag['name'] for tag in tags['body']], ['Mine'])
+        self.assertEqual(synthesizes['body'], [])
+
+    def test_write_then_read(self):
+        """Test a read sees the write made before it in the same batch"""
+        response = self.batch(
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': 'Fresh'}},
+            {'method': 'GET', 'path': TAGS_URL},
+        )
+
+        created, tags = response.data
+        self.assertEqual(created['status'], 201)
+        self.assertEqual([tag['name'] for tag in tags['body']], ['Fresh'])
+        self.assertTrue(Tag.objects.filter(user=self.user, name='Fresh').exists())
+
+    def test_failures_are_per_request(self):
+        """Test a failing sub-request doesn't stop the others"""
+        response = self.batch(
+            {'method': 'GET', 'path': '/api/nowhere/'},
+            {'method': 'POST', 'path': TAGS_URL, 'body': {'name': ''}},
+            {'method': 'GET', 'path': ME_URL},
+        )
+
+        self.assertEqual([entry['status'] for entry in response.data], [404, 400, 200])
+
+    def test_invalid_paths_rejected(self):
+        """Test only API paths other than the batch itself are accepted"""
+        for path in ('/admin/', BATCH_URL):
+            response = self.batch({'method': 'GET', 'path': path})
+
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_too_many_requests_rejected(self):
+        """Test batches over BATCH_MAX_REQUESTS are rejected"""
+        response = self.batch(*[{'method': 'GET', 'path': ME_URL}] * 3)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=1)
+    def test_sub_requests_share_the_batch_slots(self):
+        """Test sub-requests count against the worker's cap instead of slots of their own"""
+        response = self.batch({'method': 'GET', 'path': ME_URL})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['status'], 503)
+
+    def test_parallel_gets(self):
+        """Test GETs run concurrently still come back in order"""
+        response = self.batch(
+            {'method': 'GET', 'path': ME_URL},
+            {'method': 'GET', 'path': reverse('synthesize:api-root')},
+            {'method': 'GET', 'path': ME_URL},
+            parallel=True,
+        )
+
+        self.assertEqual([entry['status'] for entry in response.data], [200, 200, 200])
+        self.assertEqual(response.data[0]['body']['email'], 'batch@g.com')
+        self.assertIn('tag', response.data[1]['body'])
+
+    def test_sub_requests_pass_the_middleware(self):
+        """Test sub-requests are recorded per route like any request"""
+        registry = metrics.MetricsRegistry()
+        with patch('core.metrics.registry', registry):
+            self.batch({'method': 'GET', 'path': TAGS_URL}, {'method': 'GET', 'path': ME_URL})
+
+        text = metrics.render_prometheus([registry.snapshot()])
+        self.assertIn('route="synthesize:tag-list",status="200"', text)
+        self.assertIn('route="user:me",status="200"', text)
+
+    def test_server_error_is_per_request(self):
+        """Test a sub-request raising gets a 500 entry, the others run"""
+        self.client.raise_request_exception = False
+
+        with patch('synthesize.views.TagViewSet.list', side_effect=RuntimeError('boom')):
+            response = self.batch(
+                {'method': 'GET', 'path': TAGS_URL},
+                {'method': 'GET', 'path': ME_URL},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['status'] for entry in response.data], [500, 200])
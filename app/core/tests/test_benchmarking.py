@@ -0,0 +1,80 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core import benchmarking
+from core.models import Tag, Chemcomp, Synthesize
+
+
+class BenchmarkingTests(TestCase):
+    """Tests for the benchmark helpers"""
+
+    def test_percentile_interpolates(self):
+        """Test percentiles are interpolated between samples"""
+        values = [1, 2, 3, 4]
+
+        self.assertEqual(benchmarking.percentile(values, 0), 1)
+        self.assertEqual(benchmarking.percentile(values, 50), 2.5)
+        self.assertEqual(benchmarking.percentile(values, 100), 4)
+        self.assertIsNone(benchmarking.percentile([], 50))
+
+    def test_summarize(self):
+        """Test the summary reports throughput and latency percentiles"""
+        summary = benchmarking.summarize([0.01, 0.02, 0.03, 0.04], elapsed=2, errors=1)
+
+        self.assertEqual(summary['requests'], 4)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['throughput'], 2)
+        self.assertEqual(summary['p50_ms'], 25)
+
+    def test_seed_and_remove(self):
+        """Test seeding creates the requested volumes and can be removed"""
+        benchmarking.seed(users=2, records=5, tags=4, chemcomps=3, links=2)
+
+        users = get_user_model().objects.filter(email__endswith='@bench.local')
+        self.assertEqual(users.count(), 2)
+        self.assertEqual(Tag.objects.filter(user__in=users).count(), 8)
+        self.assertEqual(Chemcomp.objects.filter(user__in=users).count(), 6)
+        synthe = Synthesize.objects.filter(user=users[0]).first()
+        self.assertEqual(synthe.tags.count(), 2)
+        self.assertTrue(synthe.user.check_password(benchmarking.BENCH_PASSWORD))
+
+        benchmarking.remove_seeded()
+        self.assertFalse(Synthesize.objects.exists())
+
+    def test_measure_returns_per_call_samples(self):
+        """Test that measure returns the requested number of samples"""
+        samples = benchmarking.measure(lambda: None, repeat=5, min_time=0.001)
+
+        self.assertEqual(len(samples), 5)
+        self.assertTrue(all(sample >= 0 for sample in samples))
+
+    def test_compare_samples_flags_significant_changes_only(self):
+        """Test a large shift is a regression and noise is unchanged"""
+        baseline = [1.0, 1.01, 0.99, 1.02, 0.98, 1.0, 1.01, 0.99, 1.0, 1.0]
+        slower = [value * 1.5 for value in baseline]
+        noisy = [1.01, 0.99, 1.0, 1.02, 0.98, 1.0, 0.99, 1.01, 1.0, 1.0]
+
+        self.assertEqual(benchmarking.compare_samples(baseline, slower)['verdict'], 'regression')
+        self.assertEqual(benchmarking.compare_samples(slower, baseline)['verdict'], 'improvement')
+        self.assertEqual(benchmarking.compare_samples(baseline, noisy)['verdict'], 'unchanged')
+
+    def test_microbench_saves_and_compares_baseline(self):
+        """Test the microbench command stores a baseline and compares with it"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            options = {'repeat': 3, 'min_time': 0.0001, 'baseline': path}
+            call_command('microbench', 'models.synthesize_image_file_path',
+                         save=True, stdout=io.StringIO(), **options)
+
+            with open(path) as fp:
+                baseline = json.load(fp)
+            self.assertEqual(len(baseline['benchmarks']['models.synthesize_image_file_path']), 3)
+
+            call_command('microbench', 'models.synthesize_image_file_path',
+                         compare=True, stdout=io.StringIO(), **options)
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import deletion
+from core.models import SYNTHESIZE_IMAGE_DIR, ChangeLog, Chemcomp, DeletionJob, Synthesize, Tag
+
+
+def seed_user(email, count=5):
+    user = get_user_model().objects.create_user(email, 'testpass')
+    tag = Tag.objects.create(user=user, name='Tag')
+    chemcomp = Chemcomp.objects.create(user=user, name='CC')
+    for index in range(count):
+        synthe = Synthesize.objects.create(
+            user=user, title=f'Synthe {index}', time_years=1, chance=1,
+        )
+        synthe.tags.add(tag)
+        synthe.chemcomps.add(chemcomp)
+    return user
+
+
+class DeletionJobTests(TestCase):
+    """Tests for batched deletion"""
+
+    def setUp(self):
+        self.user = seed_user('doomed@g.com')
+        self.other = seed_user('other@g.com', count=2)
+
+    def test_user_deleted_in_batches(self):
+        """Test a user and their data are deleted batch by batch"""
+        job = deletion.create_job(self.user)
+        batches = []
+
+        deletion.run_job(job, batch_size=2, progress=lambda job: batches.append(job.rows_deleted))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertIsNone(job.user)
+        self.assertEqual(job.email, 'doomed@g.com')
+        self.assertFalse(get_user_model().objects.filter(email='doomed@g.com').exists())
+        self.assertFalse(Synthesize.objects.filter(title__startswith='Synthe 4').exists())
+        self.assertEqual(Synthesize.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(batches[:3], [6, 12, 15])     # 2 synthesizes and their links at a time
+        self.assertEqual(job.rows_deleted, batches[-1])
+        self.assertFalse(ChangeLog.objects.filter(user_id=self.user.pk).exists())
+
+    def test_synthesizes_only(self):
+        """Test deleting only the synthesizes keeps the user and elements"""
+        job = deletion.create_job(self.user, DeletionJob.SYNTHESIZES)
+
+        deletion.run_job(job)
+
+        self.assertFalse(Synthesize.objects.filter(user=self.user).exists())
+        self.assertTrue(Tag.objects.filter(user=self.user).exists())
+        self.assertTrue(get_user_model().objects.filter(pk=self.user.pk).exists())
+
+    def test_image_files_deleted(self):
+        """Test the images of deleted synthesizes are removed from storage"""
+        synthe = Synthesize.objects.filter(user=self.user).first()
+        synthe.image.save('doomed.jpg', ContentFile(b'image'))
+        path = synthe.image.path
+        self.assertTrue(os.path.exists(path))
+
+        job = deletion.run_job(deletion.create_job(self.user))
+
+        self.assertEqual(job.files_deleted, 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_command(self):
+        """Test deleting users from the command line"""
+        call_command('delete_user_data', 'doomed@g.com', batch_size=3, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(DeletionJob.objects.get().status, DeletionJob.DONE)
+        self.assertFalse(get_user_model().objects.filter(email='doomed@g.com').exists())
+
+    def test_resume_skips_jobs_held_by_a_live_runner(self):
+        """Test --resume takes over a stale running job but not a live one"""
+        stale = deletion.create_job(self.user)
+        live = deletion.create_job(self.other)
+        DeletionJob.objects.filter(pk=stale.pk).update(
+            status=DeletionJob.RUNNING, heartbeat=timezone.now() - timedelta(hours=1),
+        )
+        DeletionJob.objects.filter(pk=live.pk).update(
+            status=DeletionJob.RUNNING, heartbeat=timezone.now(),
+        )
+
+        call_command('delete_user_data', resume=True, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(DeletionJob.objects.get(pk=stale.pk).status, DeletionJob.DONE)
+        self.assertEqual(DeletionJob.objects.get(pk=live.pk).status, DeletionJob.RUNNING)
+        self.assertTrue(get_user_model().objects.filter(pk=self.other.pk).exists())
+        self.assertIsNone(deletion.run_job(live))
+
+    @patch('core.deletion.run_job_in_background')
+    def test_admin_action_starts_job(self, run_in_background):
+        """Test the admin action starts a background job and returns at once"""
+        admin = get_user_model().objects.create_superuser('admin@g.com', 'admin123')
+        self.client.force_login(admin)
+
+        response = self.client.post(reverse('admin:core_user_changelist'), {
+            'action': 'delete_users_in_background',
+            '_selected_action': [self.user.pk],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        job = DeletionJob.objects.get()
+        run_in_background.assert_called_once_with(job)
+        self.assertEqual(job.status, DeletionJob.PENDING)
+
+
+class GcMediaTests(TestCase):
+    """Tests for deleting orphaned image files"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = get_user_model().objects.create_user('media@g.com', 'testpass')
+        self.synthe = Synthesize.objects.create(user=user, title='Kept', time_years=1, chance=1)
+        self.synthe.image.save('kept.jpg', ContentFile(b'kept'))
+        self.orphan = default_storage.save(SYNTHESIZE_IMAGE_DIR + 'orphan.jpg',
+                                           ContentFile(b'orphan'))
+        self.fresh = default_storage.save(SYNTHESIZE_IMAGE_DIR + 'fresh.jpg', ContentFile(b'new'))
+        for name in (self.synthe.image.name, self.orphan):
+            os.utime(default_storage.path(name), (1, 1))    # long past the grace period
+
+    def gc_media(self, *args):
+        out = StringIO()
+        call_command('gc_media', '--batch-size', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_deleted(self):
+        """Test only old files no synthesize refers to are deleted"""
+        out = self.gc_media()
+
+        self.assertIn('1 of 1 unreferenced files deleted, 6 bytes freed', out)
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertTrue(default_storage.exists(self.synthe.image.name))
+        self.assertTrue(default_storage.exists(self.fresh))
+
+    def test_dry_run(self):
+        """Test a dry run lists the orphans without deleting them"""
+        out = self.gc_media('--dry-run')
+
+        self.assertIn(self.orphan, out)
+        self.assertTrue(default_storage.exists(self.orphan))
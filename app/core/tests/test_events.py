@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core import events, tokens
+from core.asgi import EventStreamMiddleware
+from core.models import Tag
+
+
+async def not_found(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+
+
+class LocalBrokerTests(SimpleTestCase):
+    """Tests for fanning events out within the process"""
+
+    def test_event_published_from_another_thread(self):
+        broker = events.LocalBroker()
+
+        async def listen():
+            subscription = broker.subscribe(7)
+            other = broker.subscribe(8)
+            threading.Thread(target=broker.publish, args=(7, {'ids': [1]})).start()
+            received = await subscription.get(timeout=5)
+            self.assertEqual(await other.get(timeout=0.01), [])
+            subscription.close()
+            other.close()
+            return received
+
+        self.assertEqual(asyncio.run(listen()), [{'ids': [1]}])
+        self.assertEqual(broker.subscriptions, {})
+
+    def test_slow_client_told_to_resync(self):
+        """Test a client that fell behind gets one resync instead of the backlog"""
+        broker = events.LocalBroker()
+
+        async def listen():
+            subscription = broker.subscribe(7, max_pending=2)
+            for index in range(5):
+                broker.publish(7, {'ids': [index]})
+            await asyncio.sleep(0)
+            return await subscription.get(timeout=1)
+
+        self.assertEqual(asyncio.run(listen()), [events.RESYNC])
+
+
+class ChangeEventTests(TestCase):
+    """Tests for publishing changes once they're committed"""
+
+    def test_change_published_on_commit(self):
+        user = get_user_model().objects.create_user('events@g.com', 'testpass')
+        with patch('core.events.get_broker') as get_broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                tag = Tag.objects.create(user=user, name='Pushed')
+                get_broker.return_value.publish.assert_not_called()
+
+        get_broker.return_value.publish.assert_called_once_with(
+            user.pk, {'model': 'tag', 'ids': [tag.pk], 'action': 'created'},
+        )
+
+
+class EventStreamTests(SimpleTestCase):
+    """Tests for the server-sent event stream"""
+
+    def run_stream(self, headers, events_to_publish=(), on_connect=None):
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if b'event:' in message.get('body', b''):
+                disconnect.set()    # the client leaves after its first events
+
+        async def run():
+            app = EventStreamMiddleware(not_found)
+            scope = {'type': 'http', 'path': '/api/events/', 'headers': headers}
+            task = asyncio.ensure_future(app(scope, receive, send))
+            while len(sent) < 2 and not task.done():
+                await asyncio.sleep(0.001)
+            if on_connect:
+                on_connect()
+            for user_id, event in events_to_publish:
+                events.get_broker().publish(user_id, event)
+            await asyncio.wait_for(task, 5)
+
+        asyncio.run(run())
+        return sent
+
+    def test_unauthenticated_rejected(self):
+        sent = self.run_stream([(b'authorization', b'Bearer forged')])
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_events_streamed_to_user(self):
+        """Test a connected user gets their events as server-sent events"""
+        user = get_user_model()(pk=42)
+        token = tokens.issue_access_token(user).encode()
+
+        sent = self.run_stream(
+            [(b'authorization', b'Bearer ' + token)],
+            [(43, {'ids': [2]}), (42, {'ids': [1], 'action': 'created'})],
+        )
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        body = b''.join(message.get('body', b'') for message in sent[1:]).decode()
+        self.assertIn('data: ' + json.dumps({'ids': [1], 'action': 'created'}), body)
+        self.assertNotIn('"ids": [2]', body)
+        self.assertEqual(events.get_broker().subscriptions, {})
+
+    @override_settings(EVENT_STREAM_HEARTBEAT=0.01)
+    def test_stream_ends_once_token_revoked(self):
+        """Test the stream is closed at the next heartbeat after a revocation"""
+        user = get_user_model()(pk=42)
+        token = tokens.issue_access_token(user).encode()
+
+        sent = self.run_stream(
+            [(b'authorization', b'Bearer ' + token)],
+            on_connect=lambda: cache.set(tokens.token_state_key(42), (False, None)),
+        )
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertFalse(sent[-1].get('more_body', False))
+        self.assertEqual(events.get_broker().subscriptions, {})
+
+    def test_other_paths_passed_on(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(EventStreamMiddleware(not_found)({'type': 'http', 'path': '/api/'},
+                                                     None, send))
+        self.assertEqual(sent[0]['status'], 404)
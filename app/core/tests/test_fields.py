@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory
+
+from core.fields import UserPrimaryKeyRelatedField
+from core.models import Tag
+
+
+class TagIdsSerializer(serializers.Serializer):
+    tags = UserPrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+
+
+class UserPrimaryKeyRelatedFieldTests(TestCase):
+    """Tests for the user scoped, set based related field"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('fields@g.com', 'testpass')
+        self.other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        self.tags = [Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(20)]
+        request = APIRequestFactory().post('/')
+        request.user = self.user
+        self.context = {'request': request}
+
+    def test_ids_validated_with_one_query(self):
+        """Test any number of ids costs a single query, keeping their order"""
+        ids = [tag.id for tag in reversed(self.tags)]
+        serializer = TagIdsSerializer(data={'tags': ids + ids[:3]}, context=self.context)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+        self.assertEqual([tag.id for tag in serializer.validated_data['tags']], ids)
+
+    def test_no_ids_accepted_without_request(self):
+        """Test a serializer used without a request doesn't accept any user's ids"""
+        serializer = TagIdsSerializer(data={'tags': [self.tags[0].id]})
+
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('tags', serializer.errors)
+
+    def test_every_invalid_id_reported(self):
+        """Test missing, foreign and malformed ids are all reported at once"""
+        foreign = Tag.objects.create(user=self.other, name='Foreign')
+        serializer = TagIdsSerializer(
+            data={'tags': [self.tags[0].id, foreign.id, 999999, 'x']}, context=self.context,
+        )
+
+        self.assertFalse(serializer.is_valid())
+
+        errors = serializer.errors['tags']
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(any(f'"{foreign.id}"' in error for error in errors))
+        self.assertTrue(any('"999999"' in error for error in errors))
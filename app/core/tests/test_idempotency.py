@@ -0,0 +1,120 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import IdempotencyKey, Synthesize, Tag
+
+SYNTHE_URL = reverse('synthesize:synthesize-list')
+TAGS_URL = reverse('synthesize:tag-list')
+
+PAYLOAD = {'title': 'Once', 'time_years': 10, 'chance': '1.00', 'tags': [], 'chemcomps': []}
+
+
+class IdempotencyKeyTests(TestCase):
+    """Tests for replaying requests sent with an Idempotency-Key"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('retry@g.com', 'testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, url, payload, key):
+        return self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        """Test a retried create returns the first response without creating again"""
+        first = self.post(SYNTHE_URL, PAYLOAD, 'key-1')
+        retry = self.post(SYNTHE_URL, PAYLOAD, 'key-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Synthesize.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        """Test two users can use the same key"""
+        self.post(TAGS_URL, {'name': 'Mine'}, 'shared')
+        other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        self.client.force_authenticate(user=other)
+
+        res = self.post(TAGS_URL, {'name': 'Theirs'}, 'shared')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_key_reused_for_other_request(self):
+        self.post(SYNTHE_URL, PAYLOAD, 'key-1')
+
+        res = self.post(SYNTHE_URL, {**PAYLOAD, 'title': 'Twice'}, 'key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Synthesize.objects.count(), 1)
+
+    def test_concurrent_duplicate_gets_conflict(self):
+        """Test a retry of a request still running is told to come back"""
+        first = self.post(TAGS_URL, {'name': 'Slow'}, 'key-1')
+        IdempotencyKey.objects.filter(key='key-1').update(response_status=None)
+
+        res = self.post(TAGS_URL, {'name': 'Slow'}, 'key-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res['Retry-After'], '1')
+
+    def test_abandoned_key_taken_over(self):
+        """Test a retry runs once the request holding the key is past its lease"""
+        self.post(TAGS_URL, {'name': 'Lost'}, 'key-1')
+        IdempotencyKey.objects.update(   # as if its worker died before storing the response
+            response_status=None, started=timezone.now() - timedelta(minutes=5),
+        )
+
+        res = self.post(TAGS_URL, {'name': 'Lost'}, 'key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 201)
+
+    def test_writes_roll_back_without_stored_response(self):
+        """Test the view's writes aren't committed when storing the response fails"""
+        with patch.object(IdempotencyKey, 'save', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.post(TAGS_URL, {'name': 'Unstored'}, 'key-1')
+
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_failed_request_not_stored(self):
+        """Test errors are not replayed, so the request can be fixed and retried"""
+        res = self.post(SYNTHE_URL, {'title': 'Invalid'}, 'key-1')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_key_runs_again(self):
+        self.post(TAGS_URL, {'name': 'Old'}, 'key-1')
+        IdempotencyKey.objects.update(expires=timezone.now() - timedelta(seconds=1))
+
+        res = self.post(TAGS_URL, {'name': 'Old'}, 'key-1')
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_purge_command(self):
+        self.post(TAGS_URL, {'name': 'Old'}, 'old')
+        self.post(TAGS_URL, {'name': 'New'}, 'new')
+        IdempotencyKey.objects.filter(key='old').update(expires=timezone.now())
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
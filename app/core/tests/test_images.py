@@ -0,0 +1,155 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.images import VariantCache
+from core.models import ChangeLog, Synthesize
+
+
+class VariantCacheTests(SimpleTestCase):
+    """Tests for the LRU disk cache of image variants"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_least_recently_used_evicted(self):
+        """Test the files not read for the longest go first once over the size"""
+        cache = VariantCache(self.directory, max_bytes=25)
+        cache.put('aa01', b'x' * 10).close()
+        cache.put('bb02', b'x' * 10).close()
+        os.utime(cache.path('aa01'), (1, 1))
+        os.utime(cache.path('bb02'), (2, 2))
+        cache.get('aa01').close()       # now the most recent
+
+        cache.put('cc03', b'x' * 10).close()
+
+        self.assertIsNotNone(cache.get('aa01'))
+        self.assertIsNone(cache.get('bb02'))
+        self.assertIsNotNone(cache.get('cc03'))
+
+    def test_not_scanned_while_it_fits(self):
+        """Test the files are only listed once the tracked size is over the limit"""
+        cache = VariantCache(self.directory, max_bytes=25)
+        cache.put('aa01', b'x' * 10).close()
+
+        with patch.object(cache, 'evict') as evict:
+            cache.put('bb02', b'x' * 10).close()
+            evict.assert_not_called()
+            cache.put('aa01', b'x' * 12).close()    # replacing counts the difference only
+            evict.assert_not_called()
+            cache.put('cc03', b'x' * 10).close()
+            evict.assert_called_once()
+
+    def test_single_flight(self):
+        """Test concurrent misses of one key render it once"""
+        cache = VariantCache(self.directory, max_bytes=1000)
+        renders = []
+
+        def render():
+            renders.append(1)
+            time.sleep(0.05)
+            return b'variant'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_render('dd04', render)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(renders), 1)
+        self.assertEqual([variant.read() for variant in results], [b'variant'] * 4)
+        for variant in results:
+            variant.close()
+
+
+@override_settings(IMAGE_ORIGINAL_MAX_DIMENSION=100, IMAGE_DERIVATIVES=[{'w': 20}])
+class ReprocessImagesCommandTests(TestCase):
+    """Tests for reprocessing the stored images"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(IMAGE_CACHE_DIR=os.path.join(self.directory, 'cache'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.checkpoint = os.path.join(self.directory, 'checkpoint.json')
+
+        self.user = get_user_model().objects.create_user('reprocess@g.com', 'testpass')
+        self.large = self.synthesize((300, 150))
+        self.small = self.synthesize((50, 50))
+
+    def tearDown(self):
+        for synthe in Synthesize.objects.exclude(image=''):
+            synthe.image.delete()
+
+    def synthesize(self, size):
+        data = io.BytesIO()
+        Image.new('RGB', size).save(data, format='JPEG')
+        return Synthesize.objects.create(user=self.user, title='Pictured', time_years=1, chance=1,
+                                         image=SimpleUploadedFile('source.jpg', data.getvalue()))
+
+    def reprocess(self, *args):
+        out = StringIO()
+        call_command('reprocess_images', '--processes', '1', '--checkpoint', self.checkpoint,
+                     '--max-writes-per-second', '1000', *args, stdout=out)
+        return out.getvalue()
+
+    def test_large_images_rewritten(self):
+        """Test oversized images are scaled down under a new name, small ones kept"""
+        old_name, small_name = self.large.image.name, self.small.image.name
+
+        out = self.reprocess()
+
+        self.large.refresh_from_db()
+        self.small.refresh_from_db()
+        self.assertIn('2 images processed, 1 rewritten, 0 failed', out)
+        self.assertNotEqual(self.large.image.name, old_name)
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertEqual(Image.open(self.large.image.path).size, (100, 50))
+        self.assertEqual(self.small.image.name, small_name)
+        self.assertTrue(ChangeLog.objects.filter(object_id=self.large.pk,
+                                                 action=ChangeLog.UPDATED).exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertTrue(os.listdir(os.path.join(self.directory, 'cache')))    # derivatives
+
+    def test_resume_from_checkpoint(self):
+        """Test a resumed run skips the synthesizes already checkpointed"""
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({'last_id': self.large.pk, 'processed': 1, 'rewritten': 0, 'failed': 0},
+                      checkpoint)
+        old_name = self.large.image.name
+
+        out = self.reprocess('--resume')
+
+        self.large.refresh_from_db()
+        self.assertIn('2 images processed, 0 rewritten', out)
+        self.assertEqual(self.large.image.name, old_name)
+
+    def test_no_images(self):
+        """Test a run over no images finishes without a checkpoint to remove"""
+        for synthe in (self.large, self.small):
+            synthe.image.delete()
+
+        out = self.reprocess()
+
+        self.assertIn('Done: 0 images processed', out)
+        self.assertFalse(os.path.exists(self.checkpoint))
@@ -0,0 +1,113 @@
+import json
+import os
+import socket
+import subprocess
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+
+SYNTHE_URL = reverse('synthesize:synthesize-list')
+METRICS_URL = reverse('metrics')
+
+
+class MetricsRegistryTests(TestCase):
+    """Tests for the metrics registry and exporter"""
+
+    def test_histogram_rendered_cumulative(self):
+        """Test histogram buckets are exported cumulatively"""
+        registry = metrics.MetricsRegistry()
+        registry.observe('http_request_queries', 1, (1, 5), route='r')
+        registry.observe('http_request_queries', 3, (1, 5), route='r')
+        registry.observe('http_request_queries', 9, (1, 5), route='r')
+
+        text = metrics.render_prometheus([registry.snapshot()])
+
+        self.assertIn('# TYPE http_request_queries histogram', text)
+        self.assertIn('http_request_queries_bucket{route="r",le="1"} 1', text)
+        self.assertIn('http_request_queries_bucket{route="r",le="5"} 2', text)
+        self.assertIn('http_request_queries_bucket{route="r",le="+Inf"} 3', text)
+        self.assertIn('http_request_queries_sum{route="r"} 13', text)
+
+    def test_worker_snapshots_are_aggregated(self):
+        """Test that snapshots written by other workers are summed up"""
+        worker = subprocess.Popen(['true'])
+        worker.wait()
+        other = metrics.MetricsRegistry()
+        other.inc('http_responses_total', 2, route='r', method='GET', status=200)
+
+        with tempfile.TemporaryDirectory() as directory:
+            # its pid is only meaningful on its own host
+            path = metrics.snapshot_path(directory, f'other-host-{worker.pid}-0a1b2c3d')
+            with open(path, 'w') as fp:
+                json.dump(other.snapshot(), fp)
+
+            with override_settings(METRICS_DIR=directory):
+                metrics.registry.inc(
+                    'http_responses_total', route='r', method='GET', status=200,
+                )
+                counters, _ = metrics.merge(metrics.collect())
+
+            self.assertTrue(os.path.exists(path))
+        key = ('http_responses_total', (('method', 'GET'), ('route', 'r'), ('status', 200)))
+        self.assertGreaterEqual(counters[key], 3)
+
+    def test_snapshots_of_dead_workers_are_retired(self):
+        """Test the counts of a worker that is gone are kept, and counted once"""
+        worker = subprocess.Popen(['true'])
+        worker.wait()
+        dead = metrics.MetricsRegistry()
+        dead.inc('http_responses_total', 5, route='dead', method='GET', status=200)
+        key = ('http_responses_total', (('method', 'GET'), ('route', 'dead'), ('status', 200)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = metrics.snapshot_path(directory, f'{socket.gethostname()}-{worker.pid}-0a1b')
+            with open(path, 'w') as fp:
+                json.dump(dead.snapshot(), fp)
+
+            with override_settings(METRICS_DIR=directory):
+                first, _ = metrics.merge(metrics.collect())
+                second, _ = metrics.merge(metrics.collect())
+
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(first[key], 5)
+        self.assertEqual(second[key], 5)
+
+
+class MetricsEndpointTests(TestCase):
+    """Tests for the /metrics endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('metrics@g.com', 'testpass')
+        self.client.force_authenticate(user=self.user)
+
+    def test_requests_are_recorded_per_route(self):
+        """Test that API requests show up keyed by their router name"""
+        self.client.get(SYNTHE_URL)
+
+        response = self.client.get(METRICS_URL)
+        text = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",route="synthesize:synthesize-list"}',
+            text,
+        )
+        self.assertIn('route="synthesize:synthesize-list",status="200"', text)
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='scrape-secret')
+    def test_scraping_requires_token_outside_allowlist(self):
+        """Test /metrics is refused to other addresses without the token"""
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+        response = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer scrape-secret')
+
+        self.assertEqual(response.status_code, 200)
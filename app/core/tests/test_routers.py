@@ -0,0 +1,132 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import tokens
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Synthesize
+from core.routers import PrimaryReplicaRouter, check_pin_cache, pin_credentials
+
+router = PrimaryReplicaRouter()
+
+REPLICA = 'replica_test'
+TAGS_URL = reverse('synthesize:tag-list')
+CHANGES_URL = reverse('synthesize:changes')
+
+
+def read_alias_view(request):
+    if request.method == 'POST':
+        pin_credentials(request, 'Token issued')
+    return HttpResponse(router.db_for_read(Synthesize))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_PIN_SECONDS=60,
+                   REPLICA_PIN_CACHE='default')
+class ReplicaRoutingTests(SimpleTestCase):
+    """Tests for sending reads to replicas"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(read_alias_view)
+        cache.clear()
+
+    def read_alias(self, method='get', **extra):
+        request = getattr(self.factory, method)('/api/synthesize/synthesize/', **extra)
+        return self.middleware(request).content.decode()
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.read_alias(HTTP_AUTHORIZATION='Token a'), 'replica_0')
+
+    def test_writes_use_primary(self):
+        self.assertEqual(self.read_alias('patch', HTTP_AUTHORIZATION='Token a'), 'default')
+        self.assertEqual(router.db_for_write(Synthesize), 'default')
+
+    def test_client_pinned_to_primary_after_write(self):
+        """Test a client reads its own writes, other clients keep using replicas"""
+        self.read_alias('patch', HTTP_AUTHORIZATION='Token a', REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(self.read_alias(HTTP_AUTHORIZATION='Token a'), 'default')
+        self.assertEqual(
+            self.read_alias(HTTP_AUTHORIZATION='Token b', REMOTE_ADDR='10.0.0.1'), 'replica_0',
+        )
+        self.assertEqual(self.read_alias(REMOTE_ADDR='10.0.0.1'), 'replica_0')
+
+    def test_signed_tokens_pinned_by_user(self):
+        """Test a refreshed access token reads from the primary like the old one"""
+        user = get_user_model()(pk=7)
+        with override_settings(SIGNED_ACCESS_TOKEN_LIFETIME=300):
+            old, new = tokens.issue_access_token(user), tokens.issue_access_token(user)
+            self.read_alias('patch', HTTP_AUTHORIZATION=f'Bearer {old}')
+
+            self.assertEqual(self.read_alias(HTTP_AUTHORIZATION=f'Bearer {new}'), 'default')
+
+    def test_issued_credentials_pinned(self):
+        """Test the first reads with a token handed out by a write go to the primary"""
+        self.read_alias('post')
+
+        self.assertEqual(self.read_alias(HTTP_AUTHORIZATION='Token issued'), 'default')
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(router.db_for_read(Synthesize), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.read_alias(), 'default')
+
+    def test_local_memory_pin_cache_refused(self):
+        """Test the system check rejects a pin cache the workers don't share"""
+        self.assertEqual([error.id for error in check_pin_cache(None)], ['core.E001'])
+
+        with override_settings(REPLICA_PIN_CACHE='replica-pins'):
+            self.assertEqual(check_pin_cache(None), [])
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingDatabaseTests(TransactionTestCase):
+    """Tests for the routing of a client's queries between two databases"""
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('replica@g.com', 'testpass')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}')
+
+    def queries(self, method, url, data=None):
+        """Return the number of queries the request ran on the primary and the replica"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_reads_on_replica_until_a_write(self):
+        """Test reads go to the replica, and to the primary right after a write"""
+        _, replica_reads = self.queries('get', TAGS_URL)
+        self.assertGreater(replica_reads, 0)
+
+        self.queries('post', TAGS_URL, {'name': 'Fresh'})
+        primary_reads, replica_reads = self.queries('get', TAGS_URL)
+
+        self.assertEqual(replica_reads, 0)
+        self.assertGreater(primary_reads, 1)    # the pin lookup and the reads
+
+    def test_change_feed_read_from_primary(self):
+        """Test the change feed never reads the log or its objects from a replica"""
+        self.queries('post', TAGS_URL, {'name': 'Fresh'})
+        caches['replica-pins'].clear()      # the pin ran out
+
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(CHANGES_URL, {'since': 0})
+
+        self.assertEqual(response.data['tags']['upserted'][0]['name'], 'Fresh')
+        self.assertGreater(len(replica.captured_queries), 0)     # the token lookup
+        for query in replica.captured_queries:
+            self.assertNotRegex(query['sql'], 'core_changelog|core_tag')
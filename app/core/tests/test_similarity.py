@@ -0,0 +1,90 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import similarity
+from core.models import Chemcomp, SimilarityBand, SimilaritySignature, Synthesize, Tag
+
+
+class SimilarityIndexTests(TestCase):
+    """Tests for the MinHash index of similar synthesizes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('similar@g.com', 'testpass')
+        self.tags = [Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(8)]
+        self.ccs = [Chemcomp.objects.create(user=self.user, name=f'CC {i}') for i in range(8)]
+
+    def synthesize(self, tags, ccs, user=None):
+        synthe = Synthesize.objects.create(user=user or self.user, title='Synthe',
+                                           time_years=1, chance=1)
+        synthe.tags.set(tags)
+        synthe.chemcomps.set(ccs)
+        return synthe
+
+    def test_signature_estimates_jaccard(self):
+        """Test the share of equal signature values follows the Jaccard similarity"""
+        first, second = set(range(0, 100)), set(range(50, 150))
+        a, b = similarity.signature(first), similarity.signature(second)
+        estimate = sum(x == y for x, y in zip(a, b)) / similarity.PERMUTATIONS
+
+        self.assertAlmostEqual(estimate, similarity.jaccard(first, second), delta=0.2)
+        self.assertEqual(similarity.signature(first), a)
+
+    def test_similar_ranked_by_jaccard(self):
+        """Test neighbours are ranked by exact similarity, unrelated ones left out"""
+        target = self.synthesize(self.tags[:4], self.ccs[:4])
+        close = self.synthesize(self.tags[:4], self.ccs[:3])
+        closer = self.synthesize(self.tags[:4], self.ccs[:4] + self.ccs[4:5])
+        unrelated = self.synthesize(self.tags[6:], self.ccs[6:])
+        similarity.update([target.id, close.id, closer.id, unrelated.id])
+
+        result = similarity.similar(target, 10)
+
+        self.assertEqual([synthesize_id for synthesize_id, _ in result], [closer.id, close.id])
+        self.assertAlmostEqual(result[0][1], 8 / 9)
+
+    @override_settings(SIMILARITY_MAX_CANDIDATES=1)
+    def test_candidates_capped(self):
+        """Test only the candidates sharing the most bands are scored"""
+        target = self.synthesize(self.tags[:4], self.ccs[:4])
+        closer = self.synthesize(self.tags[:4], self.ccs[:4] + self.ccs[4:5])
+        close = self.synthesize(self.tags[:4], self.ccs[:2])
+        similarity.update([target.id, close.id, closer.id])
+
+        self.assertEqual([synthesize_id for synthesize_id, _ in similarity.similar(target, 10)],
+                         [closer.id])
+
+    def test_similar_scoped_to_user(self):
+        """Test other users' synthesizes are never neighbours"""
+        other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        target = self.synthesize(self.tags[:4], [])
+        foreign = self.synthesize(self.tags[:4], [], user=other)
+        similarity.update([target.id, foreign.id])
+
+        self.assertEqual(similarity.similar(target, 10), [])
+
+    def test_links_update_index_on_commit(self):
+        """Test changing links updates the signature once the transaction commits"""
+        with self.captureOnCommitCallbacks(execute=True):
+            synthe = self.synthesize(self.tags[:2], [])
+        self.assertEqual(SimilarityBand.objects.filter(synthesize=synthe).count(),
+                         similarity.BANDS)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].synthesize_set.clear()
+            synthe.tags.remove(self.tags[1])
+        self.assertFalse(SimilaritySignature.objects.filter(synthesize=synthe).exists())
+        self.assertFalse(SimilarityBand.objects.filter(synthesize=synthe).exists())
+
+    def test_rebuild_command(self):
+        """Test the command indexes every synthesize with links"""
+        self.synthesize(self.tags[:2], [])
+        self.synthesize([], [])
+        out = StringIO()
+
+        call_command('rebuild_similarity_index', '--batch-size', '1', stdout=out)
+
+        self.assertIn('2 synthesizes indexed', out.getvalue())
+        self.assertEqual(SimilaritySignature.objects.count(), 1)
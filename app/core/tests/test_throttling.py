@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import TokenBucketTable, parse_rate
+
+SYNTHE_URL = reverse('synthesize:synthesize-list')
+TOKEN_URL = reverse('user:token')
+
+
+def consume_in_child(path, count):
+    table = TokenBucketTable(path, slots=128)
+    for _ in range(count):
+        table.consume('shared', capacity=5, refill_rate=0.001)
+
+
+class TokenBucketTableTests(SimpleTestCase):
+    """Tests for the shared token bucket table"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'buckets')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('100/min'), (100, 60))
+        self.assertEqual(parse_rate('5/s'), (5, 1))
+
+    def test_bucket_empties_and_refills(self):
+        """Test a bucket allows its capacity, then tells how long to wait"""
+        table = TokenBucketTable(self.path, slots=128)
+
+        results = [table.consume('key', 3, 1.0, now=100.0) for _ in range(4)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        self.assertAlmostEqual(results[-1][1], 1.0)
+
+        allowed, _ = table.consume('key', 3, 1.0, now=101.0)
+        self.assertTrue(allowed)
+        self.assertTrue(table.consume('other key', 3, 1.0, now=101.0)[0])
+
+    def test_bucket_updated_in_the_future_is_not_drained(self):
+        """Test a clock set back doesn't turn the refill into a drain"""
+        table = TokenBucketTable(self.path, slots=128)
+        table.consume('key', 3, 1.0, now=1000.0)
+        table.consume('key', 3, 1.0, now=1000.0)
+
+        allowed, _ = table.consume('key', 3, 1.0, now=10.0)
+
+        self.assertTrue(allowed)
+        self.assertFalse(table.consume('key', 3, 1.0, now=10.0)[0])
+
+    def test_full_stripe_evicts_least_recently_used(self):
+        """Test a full table reuses the stalest bucket instead of failing"""
+        table = TokenBucketTable(self.path, slots=64)
+        for index in range(100):
+            self.assertTrue(table.consume(f'key {index}', 1, 1.0, now=float(index))[0])
+
+    def test_buckets_shared_between_processes(self):
+        """Test tokens taken by another process are gone for this one"""
+        process = multiprocessing.get_context('fork').Process(
+            target=consume_in_child, args=(self.path, 5),
+        )
+        process.start()
+        process.join()
+
+        allowed, wait = TokenBucketTable(self.path, slots=128).consume(
+            'shared', capacity=5, refill_rate=0.001,
+        )
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+
+
+class ThrottleAPITests(TestCase):
+    """Tests for rate limiting the API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('throttle@g.com', 'testpass')
+        self.client.force_authenticate(user=self.user)
+        # drained buckets of these tests must not throttle the tests coming after
+        table = patch('core.throttling._table', TokenBucketTable(slots=128))
+        table.start()
+        self.addCleanup(table.stop)
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'reads': '2/min'}})
+    def test_reads_throttled_with_retry_after(self):
+        """Test going over the read rate returns 429 with Retry-After"""
+        self.assertEqual(self.client.get(SYNTHE_URL).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(SYNTHE_URL).status_code, status.HTTP_200_OK)
+
+        response = self.client.get(SYNTHE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'reads': '1/min'}})
+    def test_scopes_are_separate(self):
+        """Test that writes aren't limited by the read rate"""
+        self.client.get(SYNTHE_URL)
+
+        response = self.client.post(SYNTHE_URL, {'title': 'x', 'time_years': 1, 'chance': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'reads': '1/min'}})
+    def test_tokens_of_a_user_share_a_bucket(self):
+        """Test a new token, e.g. a refreshed one, doesn't get a fresh bucket"""
+        self.client.force_authenticate(user=self.user, token='first')
+        self.assertEqual(self.client.get(SYNTHE_URL).status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(user=self.user, token='second')
+        response = self.client.get(SYNTHE_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'token': '2/min'}})
+    def test_logins_throttled(self):
+        """Test a burst of login attempts is cut off"""
+        client = APIClient()
+        payload = {'email': 'throttle@g.com', 'password': 'wrong'}
+        for _ in range(2):
+            self.assertEqual(client.post(TOKEN_URL, payload).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+        response = client.post(TOKEN_URL, {**payload, 'password': 'testpass'})
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Synthesize
+from core.timing import RequestTimer
+
+SYNTHE_URL = reverse('synthesize:synthesize-list')
+ME_URL = reverse('user:me')
+
+
+class RequestTimerTests(TestCase):
+    """Tests for the request timer"""
+
+    def test_phases_accumulate(self):
+        """Test that repeated phases add up and show in the header"""
+        timer = RequestTimer()
+        timer.add('auth', 0.002)
+        timer.add('auth', 0.003)
+
+        self.assertAlmostEqual(timer.phases['auth'], 0.005)
+        self.assertIn('auth;dur=5.000', timer.header_value())
+        self.assertIn('total;dur=', timer.header_value())
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    """Tests for the Server-Timing middleware and DRF hooks"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'timing@g.com',
+            'testpass',
+        )
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_sampled_request_has_breakdown(self):
+        """Test that a sampled request reports every phase and its queries"""
+        Synthesize.objects.create(
+            user=self.user, title='timed', time_years=10, chance=5,
+        )
+
+        with self.assertLogs('core.timing', level='INFO') as logs:
+            response = self.client.get(SYNTHE_URL)
+
+        header = response['Server-Timing']
+        for phase in ('auth', 'permissions', 'throttle', 'handler', 'render', 'db', 'total'):
+            self.assertIn(f'{phase};dur=', header)
+        self.assertIn('"synthesize:synthesize-list"', logs.output[0])
+        self.assertIn('"queries":', logs.output[0])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_user_views_are_timed(self):
+        """Test that the user views report DRF phases too"""
+        response = self.client.get(ME_URL)
+
+        self.assertIn('auth;dur=', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request_has_no_header(self):
+        """Test that no header is added when sampling is off"""
+        response = self.client.get(SYNTHE_URL)
+
+        self.assertFalse(response.has_header('Server-Timing'))
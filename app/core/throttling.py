@@ -0,0 +1,163 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# One bucket: key hash (0 = free), tokens left, wall clock time of the last update
+SLOT = struct.Struct('<Qdd')
+STRIPE_SLOTS = 64       # slots guarded by one lock, buckets never probe outside their stripe
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Table file of the workers when THROTTLE_TABLE_PATH isn't set
+DEFAULT_TABLE_PATH = os.path.join(tempfile.gettempdir(), 'throttle-buckets')
+
+
+def parse_rate(rate):
+    """Turn '100/min' into (100 requests, 60 seconds)"""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class TokenBucketTable:
+    """Fixed size hash table of token buckets in a memory mapped file.
+
+    Every worker process on the host maps the same file, so they share the
+    buckets. Stripes of STRIPE_SLOTS slots are guarded by a byte range
+    lock on the file (across processes) and a thread lock (within one)."""
+
+    def __init__(self, path=None, slots=65536):
+        self.stripes = max(1, slots // STRIPE_SLOTS)
+        self.slots = self.stripes * STRIPE_SLOTS
+        size = self.slots * SLOT.size
+
+        if path:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        else:
+            fd, temp_path = tempfile.mkstemp(prefix='throttle-')
+            os.unlink(temp_path)            # private to this process and its forks
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+
+        self.fd = fd
+        self.map = mmap.mmap(fd, size)
+        self.locks = [threading.Lock() for _ in range(self.stripes)]
+
+    def key_hash(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        """Take a token from the bucket of key.
+
+        Returns (allowed, seconds until a token is available). The table
+        outlives processes and reboots, so time comes from the wall clock,
+        and a bucket updated in the future (the clock was set back) just
+        doesn't refill until then."""
+        now = time.time() if now is None else now
+        key_hash = self.key_hash(key)
+        start = key_hash % self.slots
+        stripe = start // STRIPE_SLOTS
+        base = stripe * STRIPE_SLOTS
+        stripe_bytes = STRIPE_SLOTS * SLOT.size
+
+        with self.locks[stripe]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, stripe_bytes, base * SLOT.size)
+            try:
+                offset, tokens, updated = self._find_slot(key_hash, start, base)
+                if tokens is None:          # new or evicted bucket starts full
+                    tokens, updated = float(capacity), now
+
+                tokens = min(float(capacity), tokens + max(0.0, now - updated) * refill_rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(self.map, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, stripe_bytes, base * SLOT.size)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / refill_rate
+
+    def _find_slot(self, key_hash, start, base):
+        """Return (offset, tokens, updated) of the key's slot, or the offset
+        of a free or least recently used slot with tokens None"""
+        oldest_offset, oldest_updated = None, None
+        for step in range(STRIPE_SLOTS):
+            offset = (base + (start - base + step) % STRIPE_SLOTS) * SLOT.size
+            slot_key, tokens, updated = SLOT.unpack_from(self.map, offset)
+            if slot_key == key_hash:
+                return offset, tokens, updated
+            if slot_key == 0:
+                return offset, None, None
+            if oldest_updated is None or updated < oldest_updated:
+                oldest_offset, oldest_updated = offset, updated
+        return oldest_offset, None, None
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    """Return this process's view of the bucket table shared by the workers
+    of the host, opened on first use"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = TokenBucketTable(
+                    getattr(settings, 'THROTTLE_TABLE_PATH', None) or DEFAULT_TABLE_PATH,
+                    getattr(settings, 'THROTTLE_TABLE_SLOTS', 65536),
+                )
+    return _table
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-user rate limiting with token buckets shared by all workers.
+
+    The scope is the view's `throttle_scope`, 'uploads' for image uploads,
+    else 'reads' or 'writes' by method; rates come from
+    DEFAULT_THROTTLE_RATES. Clients are told when to retry through the
+    Retry-After header."""
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        if getattr(view, 'action', None) == 'upload_image':
+            return 'uploads'
+        return 'reads' if request.method in SAFE_METHODS else 'writes'
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            # not the token: a refreshed signed token would get a new bucket
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = self.get_scope(request, view)
+        rate = (api_settings.DEFAULT_THROTTLE_RATES or {}).get(scope)
+        if rate is None:
+            return True
+
+        num_requests, duration = parse_rate(rate)
+        allowed, wait = get_table().consume(
+            f'{scope}:{self.get_client(request)}',
+            capacity=num_requests,
+            refill_rate=num_requests / duration,
+        )
+        self.retry_after = wait
+        return allowed
+
+    def wait(self):
+        return self.retry_after
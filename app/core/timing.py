@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+
+
+class RequestTimer:
+    """Collects per-phase timings and SQL stats for a single request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def add(self, name, seconds):
+        """Add the given duration (in seconds) to a named phase"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Time the wrapped block as the given phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Connection execute wrapper counting queries and their total time"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            self.query_time += time.perf_counter() - started
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        """Return all timings in milliseconds, plus the query count"""
+        data = {name: round(value * 1000, 3) for name, value in self.phases.items()}
+        data['db'] = round(self.query_time * 1000, 3)
+        data['queries'] = self.query_count
+        data['total'] = round(self.total() * 1000, 3)
+        return data
+
+    def header_value(self):
+        """Render the timings as a Server-Timing header value"""
+        metrics = [
+            f'{name};dur={value * 1000:.3f}'
+            for name, value in self.phases.items()
+        ]
+        metrics.append(
+            f'db;dur={self.query_time * 1000:.3f};desc="{self.query_count} queries"'
+        )
+        metrics.append(f'total;dur={self.total() * 1000:.3f}')
+        return ', '.join(metrics)
+
+
+def get_timer(request):
+    """Return the timer attached to a (Django or DRF) request, if sampled"""
+    return getattr(request, 'timer', None)
+
+
+class TimedAPIViewMixin:
+    """DRF hooks that report auth, permission, throttle, handler and
+    render phases to the request timer set up by ServerTimingMiddleware"""
+
+    def perform_authentication(self, request):
+        timer = get_timer(request)
+        if timer is None:
+            return super().perform_authentication(request)
+        with timer.phase('auth'):
+            return super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        timer = get_timer(request)
+        if timer is None:
+            return super().check_permissions(request)
+        with timer.phase('permissions'):
+            return super().check_permissions(request)
+
+    def check_throttles(self, request):
+        timer = get_timer(request)
+        if timer is None:
+            return super().check_throttles(request)
+        with timer.phase('throttle'):
+            super().check_throttles(request)
+        self._handler_started = time.perf_counter()  # handler runs right after throttling
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        timer = get_timer(request)
+        started = getattr(self, '_handler_started', None)
+        if timer is not None and started is not None:
+            timer.add('handler', time.perf_counter() - started)
+
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        if timer is not None and hasattr(response, 'render'):
+            render = response.render
+
+            def timed_render():
+                with timer.phase('render'):
+                    return render()
+
+            response.render = timed_render      # Django renders the response after the view returns
+
+        return response
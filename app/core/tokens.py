@@ -0,0 +1,145 @@
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from core.models import RefreshToken
+
+ACCESS_TOKEN_SALT = 'core.tokens.access'
+
+
+def access_token_lifetime():
+    return getattr(settings, 'SIGNED_ACCESS_TOKEN_LIFETIME', 300)
+
+
+def token_state_key(user_id):
+    return f'token-state:{user_id}'
+
+
+def token_state(user_id):
+    """Return (is_active, token_version) of the user, or None if it's gone.
+
+    Kept in the cache for TOKEN_STATE_CACHE_SECONDS, so a deactivated user
+    or a bumped version is seen by every worker at most that late, while
+    most requests still don't query the user."""
+    key = token_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = get_user_model().objects.filter(pk=user_id) \
+            .values_list('is_active', 'token_version').first() or (False, None)
+        cache.set(key, state, getattr(settings, 'TOKEN_STATE_CACHE_SECONDS', 10))
+    return state
+
+
+def issue_access_token(user):
+    """Return a signed access token carrying the user id and token version.
+
+    It stays valid until it expires, SIGNED_ACCESS_TOKEN_LIFETIME after
+    issue, or until the user is deactivated or revoke_tokens() is called."""
+    cache.set(token_state_key(user.pk), (user.is_active, user.token_version),
+              getattr(settings, 'TOKEN_STATE_CACHE_SECONDS', 10))
+    return signing.dumps(
+        {'u': user.pk, 'v': user.token_version},
+        salt=ACCESS_TOKEN_SALT,
+        compress=False,
+    )
+
+
+def decode_access_token(token):
+    """Return the user id and token version of a signed, unexpired access token.
+
+    Pure CPU: checks the HMAC signature and the age, without any query.
+    Raises signing.BadSignature (or its SignatureExpired subclass)."""
+    payload = signing.loads(token, salt=ACCESS_TOKEN_SALT, max_age=access_token_lifetime())
+    return payload['u'], payload['v']
+
+
+def read_access_token(token):
+    """Return the user id of a valid access token.
+
+    Like decode_access_token(), and also refused once the user is
+    inactive or its token version was bumped, see token_state()."""
+    user_id, version = decode_access_token(token)
+    if token_state(user_id) != (True, version):
+        raise signing.BadSignature('The token was revoked.')
+    return user_id
+
+
+def hash_refresh_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_refresh_token(user):
+    """Store a new refresh token for the user and return its key"""
+    key = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user,
+        key_hash=hash_refresh_key(key),
+        token_version=user.token_version,
+        expires=timezone.now() + timedelta(
+            seconds=getattr(settings, 'REFRESH_TOKEN_LIFETIME', 30 * 24 * 3600)
+        ),
+    )
+    return key
+
+
+def issue_token_pair(user):
+    return {
+        'access': issue_access_token(user),
+        'refresh': issue_refresh_token(user),
+        'token_type': 'Bearer',
+        'expires_in': access_token_lifetime(),
+    }
+
+
+def rotate_refresh_token(key):
+    """Exchange a refresh token for a new token pair, or return None.
+
+    The used refresh token is deleted; it is refused once expired or after
+    the user's token version was bumped by revoke_tokens()."""
+    try:
+        refresh = RefreshToken.objects.select_related('user').get(
+            key_hash=hash_refresh_key(key),
+        )
+    except RefreshToken.DoesNotExist:
+        return None
+
+    deleted, _ = RefreshToken.objects.filter(pk=refresh.pk).delete()
+    user = refresh.user
+    if (
+        not deleted or                      # a concurrent request used it first
+        refresh.expires <= timezone.now() or
+        refresh.token_version != user.token_version or
+        not user.is_active
+    ):
+        return None
+
+    return issue_token_pair(user)
+
+
+def revoke_tokens(user):
+    """Bump the token version so all tokens of the user are refused; the
+    caller saves the user. Other workers may accept access tokens handed
+    out before for up to TOKEN_STATE_CACHE_SECONDS."""
+    user.token_version += 1
+
+
+def user_saved(sender, instance, **kwargs):
+    cache.delete(token_state_key(instance.pk))
+
+
+def connect():
+    post_save.connect(user_saved, sender=settings.AUTH_USER_MODEL,
+                      dispatch_uid='tokens-user-saved')
+
+
+def purge_expired_refresh_tokens():
+    """Delete expired refresh tokens, return how many"""
+    deleted, _ = RefreshToken.objects.filter(expires__lte=timezone.now()).delete()
+    return deleted
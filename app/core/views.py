@@ -0,0 +1,52 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import batch, metrics
+from core.authentication import SignedTokenAuthentication
+from core.timing import TimedAPIViewMixin
+
+
+def metrics_allowed(request):
+    """Return whether request may read the metrics"""
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' \
+        and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+@require_GET
+def metrics_view(request):
+    """Export the metrics of all worker processes in Prometheus text format"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+class BatchView(TimedAPIViewMixin, APIView):
+    """Run a list of API requests and return all their responses.
+
+    The batch authenticates once, its sub-requests run as the same user.
+    Each sub-request gets its own response, a failing one doesn't stop
+    the others."""
+    authentication_classes = (TokenAuthentication, SignedTokenAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = batch.BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(batch.run(
+            request, serializer.validated_data['requests'],
+            parallel=serializer.validated_data['parallel'],
+        ))
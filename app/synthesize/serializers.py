@@ -1,5 +1,9 @@
+from django.conf import settings
 from rest_framework import serializers
+from core import images
+from core.fields import UserPrimaryKeyRelatedField
 from core.models import Tag, Chemcomp, Synthesize
+from core.relations import RELATION_FIELDS, add_related, remove_related
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -22,21 +26,65 @@ class ChemcompSerializer(serializers.ModelSerializer):
 
 class SynthesizeSerializer(serializers.ModelSerializer):
     """Serializer for the Synthesize objects"""
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset = Tag.objects.all()
     )
 
-    chemcomps = serializers.PrimaryKeyRelatedField(
+    chemcomps = UserPrimaryKeyRelatedField(
         many=True,
         queryset = Chemcomp.objects.all()
     )
 
+    # PATCH only the change of the sets instead of the whole list
+    tags_add = UserPrimaryKeyRelatedField(
+        many=True, write_only=True, required=False, queryset=Tag.objects.all(),
+    )
+    tags_remove = UserPrimaryKeyRelatedField(
+        many=True, write_only=True, required=False, queryset=Tag.objects.all(),
+    )
+    chemcomps_add = UserPrimaryKeyRelatedField(
+        many=True, write_only=True, required=False, queryset=Chemcomp.objects.all(),
+    )
+    chemcomps_remove = UserPrimaryKeyRelatedField(
+        many=True, write_only=True, required=False, queryset=Chemcomp.objects.all(),
+    )
+
     class Meta:
         model = Synthesize
-        fields = ('id','title','time_years','chance','link','tags','chemcomps',)
+        fields = ('id','title','time_years','chance','link','tags','chemcomps',
+                  'tags_add','tags_remove','chemcomps_add','chemcomps_remove',)
         read_only_fields = ('id',)
 
+    def _pop_changes(self, validated_data):
+        return {
+            (field_name, operation): validated_data.pop(f'{field_name}_{operation}')
+            for field_name in RELATION_FIELDS
+            for operation in ('add', 'remove')
+            if f'{field_name}_{operation}' in validated_data
+        }
+
+    def _apply_changes(self, instance, changes):
+        """Write the added and removed ids after the full sets, if any"""
+        for (field_name, operation), related in changes.items():
+            change = add_related if operation == 'add' else remove_related
+            change(instance.user_id, field_name, [instance.pk],
+                   [obj.pk for obj in related])
+        if changes and hasattr(instance, '_prefetched_objects_cache'):
+            instance._prefetched_objects_cache.clear()
+
+    def create(self, validated_data):
+        changes = self._pop_changes(validated_data)
+        instance = super().create(validated_data)
+        self._apply_changes(instance, changes)
+        return instance
+
+    def update(self, instance, validated_data):
+        changes = self._pop_changes(validated_data)
+        instance = super().update(instance, validated_data)
+        self._apply_changes(instance, changes)
+        return instance
+
 
 class SynthesizeDetailSerializer(SynthesizeSerializer):
     """Serializer for the synthesize detail"""
@@ -45,9 +93,84 @@ class SynthesizeDetailSerializer(SynthesizeSerializer):
     chemcomps = ChemcompSerializer(many=True, read_only=True)
 
 
+class SimilarSynthesizeSerializer(SynthesizeSerializer):
+    """Serializer for a synthesize found similar to another one"""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(SynthesizeSerializer.Meta):
+        fields = SynthesizeSerializer.Meta.fields + ('similarity',)
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the similar synthesizes"""
+    k = serializers.IntegerField(default=10, min_value=1, max_value=100)
+
+
+class SynthesizeRelationsSerializer(serializers.Serializer):
+    """Serializer for tags and chemcomps added to or removed from synthesizes"""
+    tags = UserPrimaryKeyRelatedField(
+        many=True, required=False, queryset=Tag.objects.all(), max_length=1000,
+    )
+    chemcomps = UserPrimaryKeyRelatedField(
+        many=True, required=False, queryset=Chemcomp.objects.all(), max_length=1000,
+    )
+
+    def validate(self, attrs):
+        max_links = getattr(settings, 'RELATIONS_MAX_LINKS', 10000)
+        related = sum(len(attrs.get(field_name, ())) for field_name in RELATION_FIELDS)
+        if related * len(attrs.get('ids', [None])) > max_links:
+            raise serializers.ValidationError(
+                f'At most {max_links} links (synthesizes times tags and chemcomps) '
+                'can be changed at once.'
+            )
+        return attrs
+
+
+class SynthesizeBulkRelationsSerializer(SynthesizeRelationsSerializer):
+    """Serializer for changing the tags and chemcomps of many synthesizes"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=1000,
+    )
+
+
 class SynthesizeImageUploadSerializer(serializers.ModelSerializer):
     """Serializer for the synthesize image upload"""
     class Meta:
         model = Synthesize
         fields = ('id', 'image',)
-        read_only_fields = ('id',)
\ No newline at end of file
+        read_only_fields = ('id',)
+
+
+class SynthesizeListQuerySerializer(serializers.Serializer):
+    """Serializer for the range filters and ordering of the synthesize list"""
+    ORDERING_FIELDS = ('id', 'chance', 'time_years', 'title')
+
+    chance_min = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    chance_max = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    time_years_min = serializers.IntegerField(required=False)
+    time_years_max = serializers.IntegerField(required=False)
+    ordering = serializers.ChoiceField(
+        choices=[prefix + field for field in ORDERING_FIELDS for prefix in ('', '-')],
+        default='-id',
+    )
+
+
+class ImageQuerySerializer(serializers.Serializer):
+    """Serializer for the size of a resized synthesize image"""
+    w = serializers.IntegerField(required=False, min_value=1)
+    h = serializers.IntegerField(required=False, min_value=1)
+    fit = serializers.ChoiceField(choices=images.FITS, default='contain')
+
+    def validate(self, attrs):
+        max_dimension = getattr(settings, 'IMAGE_MAX_DIMENSION', 2000)
+        if not attrs.get('w') and not attrs.get('h'):
+            raise serializers.ValidationError('A width `w`, a height `h` or both are required.')
+        if max(attrs.get('w') or 0, attrs.get('h') or 0) > max_dimension:
+            raise serializers.ValidationError(f'At most {max_dimension} pixels are allowed.')
+        return attrs
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the change feed"""
+    since = serializers.IntegerField(required=False, min_value=0)
+    limit = serializers.IntegerField(default=500, min_value=1, max_value=1000)
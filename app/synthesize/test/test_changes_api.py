@@ -0,0 +1,151 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import changes
+from core.models import ChangeLog, Synthesize, Tag, Chemcomp
+
+CHANGES_URL = reverse('synthesize:changes')
+
+
+def sample_synthesize(user, title='Sample Synthesizer'):
+    return Synthesize.objects.create(user=user, title=title, time_years=10, chance=5)
+
+
+class ChangesAPITests(TestCase):
+    """Test the incremental change feed"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('sync@g.com', 'testpass')
+        self.client.force_authenticate(self.user)
+
+    def cursor(self):
+        return self.client.get(CHANGES_URL).data['cursor']
+
+    def changes(self, since, **params):
+        res = self.client.get(CHANGES_URL, {'since': since, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_authentication_required(self):
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_changes_after_cursor(self):
+        """Test objects changed before the cursor are left out"""
+        Tag.objects.create(user=self.user, name='Old')
+        since = self.cursor()
+        tag = Tag.objects.create(user=self.user, name='New')
+
+        data = self.changes(since)
+
+        self.assertEqual([row['id'] for row in data['tags']['upserted']], [tag.id])
+        self.assertGreater(data['cursor'], since)
+        self.assertEqual(self.changes(data['cursor'])['tags']['upserted'], [])
+
+    def test_changes_collapsed_to_current_state(self):
+        """Test several updates of an object return it once, as it is now"""
+        since = self.cursor()
+        synthe = sample_synthesize(self.user)
+        synthe.title = 'Renamed'
+        synthe.save()
+
+        data = self.changes(since)
+
+        self.assertEqual(len(data['synthesizes']['upserted']), 1)
+        self.assertEqual(data['synthesizes']['upserted'][0]['title'], 'Renamed')
+
+    def test_deletes_are_tombstones(self):
+        synthe = sample_synthesize(self.user)
+        chemcomp = Chemcomp.objects.create(user=self.user, name='Gone')
+        since = self.cursor()
+        synthe_id, chemcomp_id = synthe.id, chemcomp.id
+        self.client.delete(reverse('synthesize:synthesize-detail', args=[synthe.id]))
+        changes.delete(Chemcomp.objects.filter(pk=chemcomp.id))
+
+        data = self.changes(since)
+
+        self.assertEqual(data['synthesizes']['deleted'], [synthe_id])
+        self.assertEqual(data['chemcomps']['deleted'], [chemcomp_id])
+        self.assertEqual(data['synthesizes']['upserted'], [])
+
+    def test_link_changes(self):
+        """Test added and removed tags are reported, by any means of changing them"""
+        synthe = sample_synthesize(self.user)
+        kept, removed = Tag.objects.create(user=self.user, name='K'), \
+            Tag.objects.create(user=self.user, name='R')
+        synthe.tags.add(removed)
+        since = self.cursor()
+
+        synthe.tags.remove(removed)
+        self.client.post(reverse('synthesize:synthesize-bulk-add-relations'),
+                         {'ids': [synthe.id], 'tags': [kept.id]}, format='json')
+
+        links = self.changes(since)['links']
+        self.assertIn({'synthesize': synthe.id, 'model': 'tag', 'id': removed.id,
+                       'linked': False}, links)
+        self.assertIn({'synthesize': synthe.id, 'model': 'tag', 'id': kept.id,
+                       'linked': True}, links)
+
+    def test_paging_with_limit(self):
+        since = self.cursor()
+        for index in range(5):
+            Tag.objects.create(user=self.user, name=f'Tag {index}')
+
+        first = self.changes(since, limit=3)
+        rest = self.changes(first['cursor'], limit=3)
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(first['tags']['upserted']) + len(rest['tags']['upserted']), 5)
+
+    def test_other_users_changes_excluded(self):
+        since = self.cursor()
+        other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        Tag.objects.create(user=other, name='Theirs')
+
+        self.assertEqual(self.changes(since)['tags']['upserted'], [])
+
+    def test_late_commit_not_skipped(self):
+        """Test an entry that becomes visible after later ids is still returned"""
+        since = self.cursor()
+        early = Tag.objects.create(user=self.user, name='Early')
+        late = Tag.objects.create(user=self.user, name='Late')
+        # as if the transaction of the first entry hadn't committed yet
+        entry = ChangeLog.objects.get(object_id=early.id, model='tag')
+        entry.delete()
+
+        first = self.changes(since)
+        ChangeLog.objects.create(user=self.user, model='tag', object_id=early.id,
+                                 action=ChangeLog.CREATED, id=entry.id)
+        second = self.changes(first['cursor'])
+
+        self.assertEqual([row['id'] for row in first['tags']['upserted']], [late.id])
+        self.assertEqual([row['id'] for row in second['tags']['upserted']], [early.id])
+        self.assertGreater(second['cursor'], first['cursor'])
+
+    def test_compacted_cursor_gone(self):
+        """Test a cursor older than the kept entries is told to download everything"""
+        old_cursor = self.cursor()
+        Tag.objects.create(user=self.user, name='Old')
+        current = self.cursor()
+        ChangeLog.objects.update(created=timezone.now() - timedelta(days=60))
+        Tag.objects.create(user=self.user, name='Kept')
+
+        call_command('compact_change_log', stdout=StringIO())
+
+        res = self.client.get(CHANGES_URL, {'since': old_cursor})
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+        self.assertEqual([row['name'] for row in self.changes(current)['tags']['upserted']],
+                         ['Kept'])
+        self.assertEqual(self.cursor(), self.changes(current)['cursor'])
@@ -0,0 +1,123 @@
+import io
+import shutil
+import tempfile
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Synthesize
+
+
+def image_url(synthe_id):
+    return reverse('synthesize-image', args=[synthe_id])
+
+
+def image_file(size=(400, 200), image_format='JPEG', name='source.jpg', orientation=1):
+    data = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    Image.new('RGB', size, 'red').save(data, format=image_format, exif=exif.tobytes())
+    return SimpleUploadedFile(name, data.getvalue())
+
+
+class ImageVariantApiTests(TestCase):
+    """Tests for serving resized synthesize images"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        override = override_settings(IMAGE_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('images@g.com', 'testpass')
+        self.client.force_authenticate(user=self.user)
+        self.synthe = Synthesize.objects.create(user=self.user, title='Pictured', time_years=1,
+                                                chance=1, image=image_file())
+
+    def tearDown(self):
+        self.synthe.image.delete()
+
+    def fetch(self, params, accept='image/jpeg'):
+        response = self.client.get(image_url(self.synthe.id), params, HTTP_ACCEPT=accept)
+        return response, Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_resize_keeps_aspect_ratio(self):
+        """Test a width alone scales the height along"""
+        response, image = self.fetch({'w': 100})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual((image.format, image.size), ('JPEG', (100, 50)))
+
+    def test_fits(self):
+        """Test contain fits inside the box and cover fills it"""
+        _, contained = self.fetch({'w': 100, 'h': 100})
+        _, covered = self.fetch({'w': 100, 'h': 100, 'fit': 'cover'})
+
+        self.assertEqual(contained.size, (100, 50))
+        self.assertEqual(covered.size, (100, 100))
+
+    def test_rotated_photo_sized_upright(self):
+        """Test sizes apply to the image as shown, turned by its EXIF orientation"""
+        self.synthe.image.delete()
+        self.synthe.image = image_file(orientation=6)    # stored 400x200, shown 200x400
+        self.synthe.save()
+
+        _, resized = self.fetch({'w': 100})
+        _, covered = self.fetch({'w': 100, 'h': 50, 'fit': 'cover'})
+
+        self.assertEqual(resized.size, (100, 200))
+        self.assertEqual(covered.size, (100, 50))
+
+    def test_webp_when_accepted(self):
+        """Test clients accepting WebP get WebP"""
+        response, image = self.fetch({'w': 50}, accept='image/webp,image/*;q=0.8')
+
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(image.format, 'WEBP')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_variant_cached(self):
+        """Test a variant is rendered once and then served from the cache"""
+        self.fetch({'w': 80})
+        self.synthe.image.storage.delete(self.synthe.image.name)    # the source is no longer read
+
+        response, image = self.fetch({'w': 80})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(image.size, (80, 40))
+
+    def test_invalid_requests(self):
+        """Test sizes are required and bounded, images of other users not found"""
+        other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        foreign = Synthesize.objects.create(user=other, title='Theirs', time_years=1, chance=1)
+
+        self.assertEqual(self.client.get(image_url(self.synthe.id)).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(image_url(self.synthe.id), {'w': 100000}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(image_url(foreign.id), {'w': 10}).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_broken_sources(self):
+        """Test a missing source file is not found and an unreadable one unprocessable"""
+        storage, name = self.synthe.image.storage, self.synthe.image.name
+        with open(storage.path(name), 'wb') as source:
+            source.write(b'not an image')
+
+        self.assertEqual(self.client.get(image_url(self.synthe.id), {'w': 10}).status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        storage.delete(name)
+
+        self.assertEqual(self.client.get(image_url(self.synthe.id), {'w': 20}).status_code,
+                         status.HTTP_404_NOT_FOUND)
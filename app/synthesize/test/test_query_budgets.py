@@ -0,0 +1,186 @@
+import io
+
+from PIL import Image
+
+from django.test import TestCase
+from django.urls import reverse
+
+from core import similarity
+from core.models import Synthesize, Tag, Chemcomp
+from core.testing import QueryBudget, QueryBudgetTestMixin, route_names
+
+from synthesize.urls import urlpatterns
+
+
+def seed_rows(user, size):
+    """Create `size` tags, chemcomps and synthesizes, each linked to two of both"""
+    tags = [Tag.objects.create(user=user, name=f'Tag {i}') for i in range(size)]
+    ccs = [Chemcomp.objects.create(user=user, name=f'CC {i}') for i in range(size)]
+    synthes = []
+    for i in range(size):
+        synthe = Synthesize.objects.create(
+            user=user, title=f'Synthe {i}', time_years=1000 + i, chance=50,
+        )
+        synthe.tags.add(*tags[:2])
+        synthe.chemcomps.add(*ccs[:2])
+        synthes.append(synthe)
+    return tags, ccs, synthes
+
+
+def list_url(route):
+    def prepare(user, size):
+        seed_rows(user, size)
+        return reverse(route), None
+    return prepare
+
+
+def detail_prepare(payload=None):
+    def prepare(user, size):
+        tags, ccs, synthes = seed_rows(user, size)
+        data = payload(tags, ccs) if payload else None
+        return reverse('synthesize:synthesize-detail', args=[synthes[0].id]), data
+    return prepare
+
+
+def multi_get_prepare(route):
+    def prepare(user, size):
+        tags, ccs, synthes = seed_rows(user, size)
+        rows = {'synthesize:tag-list': tags, 'synthesize:chemcomp-list': ccs}.get(route, synthes)
+        return reverse(route), {'ids': ','.join(str(row.id) for row in rows)}
+    return prepare
+
+
+def filter_prepare(user, size):
+    tags, ccs, synthes = seed_rows(user, size)
+    return reverse('synthesize:synthesize-list'), {
+        'tags': f'{tags[0].id},{tags[1].id}',
+        'chemcomps': f'{ccs[0].id}',
+    }
+
+
+def paginated_prepare(user, size):
+    seed_rows(user, size)
+    return reverse('synthesize:synthesize-list'), {'limit': 5}
+
+
+def keyset_prepare(user, size):
+    seed_rows(user, size)
+    return reverse('synthesize:synthesize-list'), {
+        'chance_min': 10, 'ordering': '-chance', 'page_size': 5,
+    }
+
+
+def create_prepare(user, size):
+    tags, ccs, synthes = seed_rows(user, size)
+    return reverse('synthesize:synthesize-list'), {
+        'title': 'New', 'time_years': 10, 'chance': '1.00',
+        'tags': [tags[0].id, tags[1].id], 'chemcomps': [ccs[0].id],
+    }
+
+
+def upload_prepare(user, size):
+    tags, ccs, synthes = seed_rows(user, size)
+    image = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(image, format='JPEG')
+    image.name = 'budget.jpg'
+    image.seek(0)
+    return reverse('synthesize:synthesize-upload-image', args=[synthes[0].id]), {
+        'image': image,
+    }
+
+
+def relations_prepare(operation):
+    def prepare(user, size):
+        tags, ccs, synthes = seed_rows(user, size)
+        return reverse(f'synthesize:synthesize-{operation}-relations', args=[synthes[0].id]), {
+            'tags': [tags[0].id, tags[1].id], 'chemcomps': [ccs[0].id],
+        }
+    return prepare
+
+
+def bulk_relations_prepare(operation):
+    def prepare(user, size):
+        tags, ccs, synthes = seed_rows(user, size)
+        return reverse(f'synthesize:synthesize-bulk-{operation}-relations'), {
+            'ids': [synthe.id for synthe in synthes],
+            'tags': [tags[0].id, tags[1].id], 'chemcomps': [ccs[0].id],
+        }
+    return prepare
+
+
+def similar_prepare(user, size):
+    tags, ccs, synthes = seed_rows(user, size)
+    similarity.update([synthe.id for synthe in synthes])
+    return reverse('synthesize:synthesize-similar', args=[synthes[0].id]), None
+
+
+def changes_prepare(user, size):
+    seed_rows(user, size)
+    return reverse('synthesize:changes'), {'since': 0}
+
+
+def element_create(route):
+    def prepare(user, size):
+        seed_rows(user, size)
+        return reverse(route), {'name': 'New element'}
+    return prepare
+
+
+def update_payload(tags, ccs):
+    return {
+        'title': 'Updated', 'time_years': 5, 'chance': '2.00',
+        'tags': [tags[1].id], 'chemcomps': [ccs[1].id],
+    }
+
+
+class SynthesizeQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Query budgets of every route in synthesize/urls.py"""
+
+    covered_routes = route_names('synthesize', urlpatterns)
+
+    budgets = (
+        QueryBudget('synthesize:api-root', 'GET', 0, lambda user, size: (
+            reverse('synthesize:api-root'), None)),
+        QueryBudget('synthesize:tag-list', 'GET', 1, list_url('synthesize:tag-list')),
+        QueryBudget('synthesize:tag-list', 'POST', 2, element_create('synthesize:tag-list')),
+        QueryBudget('synthesize:chemcomp-list', 'GET', 1,
+                    list_url('synthesize:chemcomp-list')),
+        QueryBudget('synthesize:chemcomp-list', 'POST', 2,
+                    element_create('synthesize:chemcomp-list')),
+        QueryBudget('synthesize:synthesize-list', 'GET', 3,
+                    list_url('synthesize:synthesize-list')),
+        QueryBudget('synthesize:synthesize-list', 'GET', 3, filter_prepare,
+                    label='filtered'),
+        QueryBudget('synthesize:synthesize-list', 'GET', 3,
+                    multi_get_prepare('synthesize:synthesize-list'), label='multi-get'),
+        QueryBudget('synthesize:synthesize-list', 'GET', 4, paginated_prepare,
+                    label='paginated'),
+        QueryBudget('synthesize:synthesize-list', 'GET', 3, keyset_prepare,
+                    label='keyset'),
+        QueryBudget('synthesize:tag-list', 'GET', 1, multi_get_prepare('synthesize:tag-list'),
+                    label='multi-get'),
+        QueryBudget('synthesize:chemcomp-list', 'GET', 1,
+                    multi_get_prepare('synthesize:chemcomp-list'), label='multi-get'),
+        QueryBudget('synthesize:synthesize-list', 'POST', 14, create_prepare),
+        QueryBudget('synthesize:synthesize-detail', 'GET', 3, detail_prepare()),
+        QueryBudget('synthesize:synthesize-detail', 'PUT', 13,
+                    detail_prepare(update_payload)),
+        QueryBudget('synthesize:synthesize-detail', 'PATCH', 13,
+                    detail_prepare(update_payload)),
+        QueryBudget('synthesize:synthesize-detail', 'DELETE', 9, detail_prepare()),
+        QueryBudget('synthesize:synthesize-upload-image', 'POST', 3, upload_prepare,
+                    format='multipart'),
+        QueryBudget('synthesize:synthesize-add-relations', 'POST', 9, relations_prepare('add')),
+        QueryBudget('synthesize:synthesize-remove-relations', 'POST', 9,
+                    relations_prepare('remove')),
+        QueryBudget('synthesize:synthesize-bulk-add-relations', 'POST', 9,
+                    bulk_relations_prepare('add')),
+        QueryBudget('synthesize:synthesize-bulk-remove-relations', 'POST', 9,
+                    bulk_relations_prepare('remove')),
+        QueryBudget('synthesize:synthesize-similar', 'GET', 8, similar_prepare),
+        QueryBudget('synthesize:changes', 'GET', 12, changes_prepare),
+    )
+
+    def tearDown(self):
+        for synthe in Synthesize.objects.exclude(image=''):
+            synthe.image.delete()
@@ -1,10 +1,13 @@
+import json
 import os
 import tempfile
+from base64 import urlsafe_b64encode
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from decimal import Decimal
@@ -13,6 +16,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Synthesize, Tag, Chemcomp
+from core.pagination import KeysetPagination
 
 from synthesize.serializers import SynthesizeSerializer, SynthesizeDetailSerializer
 
@@ -24,6 +28,12 @@ def image_upload_url(synthe_id):
 def detail_url(synthe_id):
     return reverse('synthesize:synthesize-detail', args=[synthe_id])
 
+def similar_url(synthe_id):
+    return reverse('synthesize:synthesize-similar', args=[synthe_id])
+
+def relations_url(synthe_id, operation):
+    return reverse(f'synthesize:synthesize-{operation}-relations', args=[synthe_id])
+
 def sample_synthesize(user, **params):
     """Create and return an sample synthesizer element"""
     defaults = {
@@ -166,6 +176,142 @@ class SynthesizePrivateAPITests(TestCase):
         self.assertIn(cc_1, ccs)
         self.assertIn(cc_2, ccs)
 
+    def test_create_synthesize_with_other_users_tag_fails(self):
+        """Test tags of other users can't be attached"""
+        other = get_user_model().objects.create_user('tagowner@g.com', 'testpass')
+        foreign_tag = sample_tag(user=other)
+        payload = {
+            'title': 'Borrowed', 'time_years': 10, 'chance': 5.00,
+            'tags': [foreign_tag.id],
+        }
+
+        res = self.client.post(SYNTHE_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(foreign_tag.id), res.data['tags'][0])
+
+    def test_multi_get_synthesizes(self):
+        """Test fetching synthesizes by ids keeps the order and reports missing ids"""
+        first, second = sample_synthesize(user=self.user), sample_synthesize(user=self.user)
+        first.tags.add(sample_tag(user=self.user))
+        other = get_user_model().objects.create_user('idsother@g.com', 'testpass')
+        foreign = sample_synthesize(user=other)
+
+        res = self.client.get(SYNTHE_URL, {'ids': f'{second.id},{foreign.id},{first.id},99999'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data['results']], [second.id, first.id])
+        self.assertEqual(res.data['results'][1]['tags'][0]['name'], 'Sample Tag')
+        self.assertEqual(res.data['missing'], [foreign.id, 99999])
+
+    @override_settings(MULTI_GET_MAX_IDS=2)
+    def test_multi_get_limited(self):
+        """Test asking for too many or malformed ids fails"""
+        self.assertEqual(self.client.get(SYNTHE_URL, {'ids': '1,2,3'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(SYNTHE_URL, {'ids': '1,x'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_paginated_list(self):
+        """Test lists requested with a limit are paginated with an exact small count"""
+        synthes = [sample_synthesize(user=self.user, title=f'Synthe {i}') for i in range(5)]
+
+        res = self.client.get(SYNTHE_URL, {'limit': 2, 'offset': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 5)
+        self.assertTrue(res.data['count_exact'])
+        self.assertEqual([row['id'] for row in res.data['results']],
+                         [synthes[2].id, synthes[1].id])
+        self.assertIn('offset=4', res.data['next'])
+
+    @override_settings(EXACT_COUNT_LIMIT=3)
+    def test_paginated_list_count_capped(self):
+        """Test large counts are flagged inexact unless an exact count is asked for"""
+        for i in range(6):
+            sample_synthesize(user=self.user, title=f'Synthe {i}')
+
+        capped = self.client.get(SYNTHE_URL, {'limit': 2})
+        exact = self.client.get(SYNTHE_URL, {'limit': 2, 'count': 'exact'})
+        last = self.client.get(SYNTHE_URL, {'limit': 2, 'offset': 4})
+
+        self.assertEqual((capped.data['count'], capped.data['count_exact']), (4, False))
+        self.assertIsNotNone(capped.data['next'])
+        self.assertEqual((exact.data['count'], exact.data['count_exact']), (6, True))
+        self.assertEqual((last.data['count'], last.data['count_exact']), (6, True))
+        self.assertIsNone(last.data['next'])
+
+    def test_range_filters_and_ordering(self):
+        """Test filtering by chance and time_years ranges, ordered by chance"""
+        low = sample_synthesize(user=self.user, chance=50, time_years=10)
+        high = sample_synthesize(user=self.user, chance=90, time_years=10)
+        mid = sample_synthesize(user=self.user, chance=80, time_years=10)
+        sample_synthesize(user=self.user, chance=95, time_years=2000000)
+
+        res = self.client.get(SYNTHE_URL, {
+            'chance_min': 80, 'time_years_max': 1000000, 'ordering': 'chance',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data], [mid.id, high.id])
+        self.assertNotIn(low.id, [row['id'] for row in res.data])
+
+    def test_invalid_filters_rejected(self):
+        """Test unknown orderings and malformed ranges fail"""
+        for params in ({'ordering': 'link'}, {'chance_min': 'high'}):
+            res = self.client.get(SYNTHE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_pagination(self):
+        """Test walking pages by cursor on a sort key with ties"""
+        for chance in (70, 90, 70, 80, 90):
+            sample_synthesize(user=self.user, chance=chance)
+        expected = list(Synthesize.objects.order_by('-chance', '-id').values_list('id', flat=True))
+
+        seen = []
+        res = self.client.get(SYNTHE_URL, {'ordering': '-chance', 'page_size': 2})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen += [row['id'] for row in res.data['results']]
+            if res.data['next'] is None:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get(SYNTHE_URL, {'page_size': 2, 'cursor': 'x'}).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_keyset_invalid_cursors(self):
+        """Test cursors that weren't handed out, or hold values of the wrong type, fail"""
+        sample_synthesize(user=self.user)
+        params = {'ordering': '-chance', 'page_size': 2}
+        paginator = KeysetPagination()
+        paginator.salt = 'core.pagination.keyset:-chance,-id'
+        unsigned = urlsafe_b64encode(json.dumps([90, 1]).encode()).decode()
+        cursors = [unsigned] + [paginator.encode_cursor(position)
+                                for position in (['abc', 'x'], [{'a': 1}, 1], [None, None], [1])]
+
+        for cursor in cursors:
+            res = self.client.get(SYNTHE_URL, {**params, 'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_similar_synthesizes(self):
+        """Test listing the synthesizes sharing tags and chemcomps with one"""
+        tags = [sample_tag(user=self.user, name=f'Tag {i}') for i in range(3)]
+        target, near, far = (sample_synthesize(user=self.user) for _ in range(3))
+        with self.captureOnCommitCallbacks(execute=True):
+            target.tags.set(tags)
+            near.tags.set(tags[:2])
+            far.tags.set(tags[2:])
+
+        res = self.client.get(similar_url(target.id), {'k': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['id'] for row in res.data], [near.id])
+        self.assertAlmostEqual(res.data[0]['similarity'], 2 / 3)
+
     # -------------- Test update Synthesize ----------------------
 
     def test_partial_update_synthesize(self):
@@ -216,6 +362,101 @@ class SynthesizePrivateAPITests(TestCase):
         tags = synthe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    # -------------- Test adding and removing relations ----------------------
+
+    def test_partial_update_add_and_remove_tags(self):
+        """Test patching only the tags added and removed"""
+        synthe = sample_synthesize(user=self.user)
+        kept, removed = sample_tag(user=self.user), sample_tag(user=self.user, name='Old')
+        added = sample_tag(user=self.user, name='New')
+        synthe.tags.add(kept, removed)
+
+        res = self.client.patch(detail_url(synthe.id), {
+            'tags_add': [added.id], 'tags_remove': [removed.id],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(res.data['tags']), sorted([kept.id, added.id]))
+        self.assertNotIn('tags_add', res.data)
+
+    def test_add_and_remove_relations_actions(self):
+        """Test the add and remove actions only touch the given ids"""
+        synthe = sample_synthesize(user=self.user)
+        tag, chemcomp = sample_tag(user=self.user), sample_chemcomp(user=self.user)
+        synthe.tags.add(tag)
+
+        res = self.client.post(relations_url(synthe.id, 'add'), {
+            'tags': [tag.id], 'chemcomps': [chemcomp.id],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(synthe.tags.all()), [tag])
+        self.assertEqual(list(synthe.chemcomps.all()), [chemcomp])
+
+        res = self.client.post(relations_url(synthe.id, 'remove'), {'tags': [tag.id]},
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(synthe.tags.exists())
+        self.assertTrue(synthe.chemcomps.exists())
+
+    def test_bulk_add_and_remove_relations(self):
+        """Test a tag is added to and removed from many synthesizes at once"""
+        synthes = [sample_synthesize(user=self.user, title=f'S{i}') for i in range(5)]
+        tag = sample_tag(user=self.user)
+        ids = [synthe.id for synthe in synthes]
+
+        res = self.client.post(reverse('synthesize:synthesize-bulk-add-relations'), {
+            'ids': ids, 'tags': [tag.id],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(tag.synthesize_set.count(), 5)
+
+        res = self.client.post(reverse('synthesize:synthesize-bulk-remove-relations'), {
+            'ids': ids[:3], 'tags': [tag.id],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(tag.synthesize_set.count(), 2)
+
+    def test_bulk_relations_limited_to_own_synthesizes(self):
+        """Test the bulk actions reject synthesizes of other users"""
+        other = get_user_model().objects.create_user('other@g.com', 'testpass')
+        own, foreign = sample_synthesize(user=self.user), sample_synthesize(user=other)
+        tag = sample_tag(user=self.user)
+
+        res = self.client.post(reverse('synthesize:synthesize-bulk-add-relations'), {
+            'ids': [own.id, foreign.id], 'tags': [tag.id],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(foreign.id), res.data['ids'][0])
+        self.assertFalse(own.tags.exists())
+
+    def test_relations_written_with_their_log(self):
+        """Test links aren't left behind without change log entries when logging fails"""
+        synthe = sample_synthesize(user=self.user)
+        tag, chemcomp = sample_tag(user=self.user), sample_chemcomp(user=self.user)
+
+        with patch('core.relations.record_links', side_effect=[None, RuntimeError('boom')]), \
+                self.assertRaises(RuntimeError):
+            self.client.post(relations_url(synthe.id, 'add'), {
+                'tags': [tag.id], 'chemcomps': [chemcomp.id],
+            }, format='json')
+
+        self.assertFalse(synthe.tags.exists())
+        self.assertFalse(synthe.chemcomps.exists())
+
+    @override_settings(RELATIONS_MAX_LINKS=4)
+    def test_bulk_relations_capped(self):
+        """Test requests changing more links than RELATIONS_MAX_LINKS are rejected"""
+        ids = [sample_synthesize(user=self.user, title=f'S{i}').id for i in range(3)]
+        tags = [sample_tag(user=self.user, name=f'T{i}').id for i in range(2)]
+
+        res = self.client.post(reverse('synthesize:synthesize-bulk-add-relations'), {
+            'ids': ids, 'tags': tags,
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.filter(synthesize__isnull=False).exists())
+
 
 class SynthesizeImageUploadAPITests(TestCase):
 
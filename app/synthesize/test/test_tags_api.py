@@ -142,4 +142,15 @@ class PrivateTagAPITests(TestCase):
         synthe2.tags.add(tag)
 
         res = self.client.get(TAG_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data), 1)
+
+    def test_multi_get_tags(self):
+        """Test fetching tags by ids in one request"""
+        tag1 = Tag.objects.create(user=self.user, name='first')
+        tag2 = Tag.objects.create(user=self.user, name='second')
+
+        res = self.client.get(TAG_URL, {'ids': f'{tag2.id},{tag1.id}'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], TagSerializer([tag2, tag1], many=True).data)
+        self.assertEqual(res.data['missing'], [])
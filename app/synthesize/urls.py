@@ -10,6 +10,7 @@ router.register('synthesize', views.SynthesizeViewSet)
 app_name = 'synthesize'
 
 urlpatterns = [
+    path('changes/', views.ChangesView.as_view(), name='changes'),
     path('', include(router.urls))
 ]
 
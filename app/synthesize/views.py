@@ -1,17 +1,68 @@
+from django.conf import settings
+from django.http import FileResponse
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Prefetch, Q
+from django.shortcuts import get_object_or_404
+from PIL import UnidentifiedImageError
+
 from rest_framework.decorators import action    #   This is to add custom action
 from rest_framework.response import Response    #   This to add custom response to custom action
 from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-from core.models import Tag, Chemcomp, Synthesize
+from core import changes, events, images, metrics, similarity
+from core.authentication import BatchAuthentication, SignedTokenAuthentication
+from core.idempotency import idempotent
+from core.models import ChangeLog, Tag, Chemcomp, Synthesize
+from core.pagination import EstimatedCountPagination, KeysetPagination
+from core.relations import RELATION_FIELDS, add_related, remove_related
+from core.timing import TimedAPIViewMixin
 from synthesize import serializers
 
 
-class SynthesizeElementViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, 
-                mixins.CreateModelMixin):
+class MultiGetMixin:
+    """Fetch several objects by id in one request with `?ids=1,2,3` on the list.
+
+    Returns the found objects in the requested order and the ids that
+    don't exist or belong to another user, using a single IN query."""
+    multi_get_serializer_class = None
+
+    def _ids_param(self, value):
+        try:
+            ids = [int(str_id) for str_id in value.split(',') if str_id.strip()]
+        except ValueError:
+            raise ValidationError({'ids': ['A comma separated list of integers is required.']})
+
+        ids = list(dict.fromkeys(ids))      # keep the requested order, drop repeats
+        max_ids = getattr(settings, 'MULTI_GET_MAX_IDS', 100)
+        if not ids or len(ids) > max_ids:
+            raise ValidationError({'ids': [f'Between 1 and {max_ids} ids are allowed.']})
+        return ids
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        ids = self._ids_param(request.query_params['ids'])
+        found = {obj.pk: obj for obj in self.get_queryset().filter(pk__in=ids)}
+        serializer_class = self.multi_get_serializer_class or self.get_serializer_class()
+        serializer = serializer_class(
+            [found[pk] for pk in ids if pk in found], many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in found],
+        })
+
+
+class SynthesizeElementViewSet(TimedAPIViewMixin, MultiGetMixin, viewsets.GenericViewSet,
+                mixins.ListModelMixin, mixins.CreateModelMixin):
     """Manage Synthesize elements in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (TokenAuthentication, SignedTokenAuthentication, BatchAuthentication)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):                                         # filter per user
@@ -26,6 +77,10 @@ class SynthesizeElementViewSet(viewsets.GenericViewSet, mixins.ListModelMixin,
 
         return queryset.filter(user=self.request.user).order_by('-name').distinct()
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Create a Synthesize elements"""
         serializer.save(user=self.request.user)     # This is to set logged in user as element user
@@ -43,11 +98,18 @@ class ChemcompViewSet(SynthesizeElementViewSet):
     queryset = Chemcomp.objects.all()
 
 
-class SynthesizeViewSet(viewsets.ModelViewSet):
+class SynthesizeViewSet(TimedAPIViewMixin, MultiGetMixin, viewsets.ModelViewSet):
     """Manage Synthesizes in the database"""
     serializer_class = serializers.SynthesizeSerializer
+    multi_get_serializer_class = serializers.SynthesizeDetailSerializer
     queryset = Synthesize.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    pagination_class = EstimatedCountPagination
+    keyset_pagination_class = KeysetPagination
+    range_filters = {
+        'chance_min': 'chance__gte', 'chance_max': 'chance__lte',
+        'time_years_min': 'time_years__gte', 'time_years_max': 'time_years__lte',
+    }
+    authentication_classes = (TokenAuthentication, SignedTokenAuthentication, BatchAuthentication)
     permission_classes = (IsAuthenticated,)
     
     def _params_to_ints(self, qs):
@@ -68,7 +130,33 @@ class SynthesizeViewSet(viewsets.ModelViewSet):
             cc_ids = self._params_to_ints(ccs)
             queryset = queryset.filter(chemcomps__id__in=cc_ids)
 
-        return queryset.filter(user=self.request.user).order_by('-id').distinct()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related('tags', 'chemcomps')  # avoid a query per row for the ids
+
+        ordering = '-id'
+        if self.action == 'list':
+            query = serializers.SynthesizeListQuerySerializer(data=self.request.query_params)
+            query.is_valid(raise_exception=True)
+            ordering = query.validated_data['ordering']
+            queryset = queryset.filter(**{
+                lookup: query.validated_data[param]
+                for param, lookup in self.range_filters.items() if param in query.validated_data
+            })
+
+        # id breaks ties, so the order is total and matches the (user, field, id) indexes
+        order_by = [ordering] if ordering.lstrip('-') == 'id' else \
+            [ordering, '-id' if ordering.startswith('-') else 'id']
+        return queryset.filter(user=self.request.user).order_by(*order_by).distinct()
+
+    @property
+    def paginator(self):
+        """Keyset pagination for `?page_size=`, limit/offset for `?limit=`"""
+        if not hasattr(self, '_paginator'):
+            if 'page_size' in self.request.query_params:
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self):
         """Return the appropriate serializer class"""
@@ -79,12 +167,29 @@ class SynthesizeViewSet(viewsets.ModelViewSet):
         elif self.action == 'upload_image':
             return serializers.SynthesizeImageUploadSerializer
 
+        elif self.action in ('add_relations', 'remove_relations'):
+            return serializers.SynthesizeRelationsSerializer
+
+        elif self.action in ('bulk_add_relations', 'bulk_remove_relations'):
+            return serializers.SynthesizeBulkRelationsSerializer
+
         return self.serializer_class
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Create a Synthesize elements"""
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Delete the Synthesize, leaving a tombstone in the change feed"""
+        with transaction.atomic():
+            rows = [(instance.pk, instance.user_id)]
+            instance.delete()
+            changes.record_deleted(Synthesize, rows)
+
     @action(methods=['POST'], detail=True, url_path='upload-image') # custom-url and its corresponding action
     def upload_image(self, request, pk=None):       # pk is the id of the synthesize obj. i.e. /synthesize/3/upload-image
         """Upload an image to a synthesize record"""
@@ -96,6 +201,12 @@ class SynthesizeViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()       # as serializer is ModelSerializer, we can save
+            image = serializer.validated_data.get('image')
+            if image:
+                metrics.registry.inc('synthesize_image_upload_bytes_total', image.size)
+                events.publish_on_commit(synthe.user_id, {
+                    'model': 'synthesize', 'ids': [synthe.pk], 'action': 'image_ready',
+                })
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -104,4 +215,186 @@ class SynthesizeViewSet(viewsets.ModelViewSet):
         return Response(
                 serializer.errors,  # i.e. Upload a valid image. The file you uploaded was either not an image or a corrupted image.
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """Synthesizes sharing the most tags and chemcomps with this one, up to `k`"""
+        query = serializers.SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        scores = dict(similarity.similar(self.get_object(), query.validated_data['k']))
+
+        found = Synthesize.objects.filter(pk__in=scores).prefetch_related('tags', 'chemcomps')
+        rows = sorted(found, key=lambda synthe: (-scores[synthe.pk], synthe.pk))
+        for synthe in rows:
+            synthe.similarity = scores[synthe.pk]
+        return Response(serializers.SimilarSynthesizeSerializer(
+            rows, many=True, context=self.get_serializer_context()).data)
+
+    def _change_relations(self, serializer, synthesize_ids, change):
+        """Add or remove the submitted tags and chemcomps of the synthesizes"""
+        with transaction.atomic():      # both fields or neither
+            for field_name in RELATION_FIELDS:
+                related = serializer.validated_data.get(field_name)
+                if related:
+                    change(self.request.user.pk, field_name, synthesize_ids,
+                           [obj.pk for obj in related])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _owned_ids(self, ids):
+        """Return the ids if they're all synthesizes of the user"""
+        owned = set(Synthesize.objects.filter(user=self.request.user, id__in=ids)
+                    .values_list('id', flat=True))
+        missing = sorted(set(ids) - owned)
+        if missing:
+            raise ValidationError({'ids': [
+                f'Invalid pk "{synthesize_id}" - object does not exist.'
+                for synthesize_id in missing
+            ]})
+        return sorted(owned)
+
+    @action(methods=['POST'], detail=True, url_path='add-relations')
+    def add_relations(self, request, pk=None):
+        """Add tags and chemcomps to a synthesize, keeping the ones it has"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._change_relations(serializer, [self.get_object().pk], add_related)
+
+    @action(methods=['POST'], detail=True, url_path='remove-relations')
+    def remove_relations(self, request, pk=None):
+        """Remove tags and chemcomps from a synthesize"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._change_relations(serializer, [self.get_object().pk], remove_related)
+
+    @action(methods=['POST'], detail=False, url_path='bulk-add-relations')
+    @idempotent
+    def bulk_add_relations(self, request):
+        """Add tags and chemcomps to every synthesize in `ids`"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = self._owned_ids(serializer.validated_data['ids'])
+        return self._change_relations(serializer, ids, add_related)
+
+    @action(methods=['POST'], detail=False, url_path='bulk-remove-relations')
+    @idempotent
+    def bulk_remove_relations(self, request):
+        """Remove tags and chemcomps from every synthesize in `ids`"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = self._owned_ids(serializer.validated_data['ids'])
+        return self._change_relations(serializer, ids, remove_related)
+
+
+class SynthesizeImageView(TimedAPIViewMixin, APIView):
+    """The image of a synthesize resized to `w` x `h`, WebP for clients accepting it"""
+    authentication_classes = (TokenAuthentication, SignedTokenAuthentication, BatchAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    def perform_content_negotiation(self, request, force=False):
+        # Accept picks the image format, errors are JSON whatever it asks for
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, pk):
+        query = serializers.ImageQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        synthe = get_object_or_404(
+            Synthesize.objects.filter(user=request.user).exclude(image='').exclude(image=None),
+            pk=pk,
+        )
+
+        image_format = images.negotiate_format(request.headers.get('Accept', ''),
+                                               synthe.image.name)
+        try:
+            variant = images.variant(synthe.image.name, query.validated_data.get('w'),
+                                     query.validated_data.get('h'), query.validated_data['fit'],
+                                     image_format)
+        except FileNotFoundError:
+            raise NotFound('The image file is missing.')
+        except UnidentifiedImageError:
+            return Response({'detail': 'The stored file is not an image that can be read.'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = FileResponse(variant, content_type=images.CONTENT_TYPES[image_format])
+        response['Cache-Control'] = 'private, max-age=86400'
+        response['Vary'] = 'Accept, Authorization'
+        return response
+
+
+class ChangesView(TimedAPIViewMixin, APIView):
+    """Changes of the user's synthesizes, tags and chemcomps after a cursor.
+
+    Without `since` only the current cursor is returned, for clients that
+    just downloaded everything. Several changes of one object collapse
+    into its current state, or its id under `deleted`. A cursor from
+    before the oldest entries kept by `manage.py compact_change_log` gets
+    a 410: the client has to download everything again."""
+    authentication_classes = (TokenAuthentication, SignedTokenAuthentication, BatchAuthentication)
+    permission_classes = (IsAuthenticated,)
+
+    sections = (
+        ('synthesize', 'synthesizes', Synthesize, serializers.SynthesizeSerializer),
+        ('tag', 'tags', Tag, serializers.TagSerializer),
+        ('chemcomp', 'chemcomps', Chemcomp, serializers.ChemcompSerializer),
+    )
+
+    def get(self, request):
+        query = serializers.ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since, limit = query.validated_data.get('since'), query.validated_data['limit']
+        cursor = changes.sequence(request.user.pk)
+
+        if since is None:
+            return Response(self.changes(cursor or 0, False, []))
+
+        # the truncation mark, if any, comes along: it's before every other entry.
+        # The entries and their objects are read where the positions were given
+        entries = list(
+            ChangeLog.objects.using(DEFAULT_DB_ALIAS).filter(Q(position__gt=since) | Q(action=ChangeLog.TRUNCATED),
+                                     user=request.user)
+            .order_by('position', 'id')[:limit + 2]
+        )
+        if entries and entries[0].action == ChangeLog.TRUNCATED:
+            if entries[0].position > since:
+                return Response({'detail': 'Changes after this cursor are no longer kept, '
+                                           'download everything again.'},
+                                status=status.HTTP_410_GONE)
+            entries = entries[1:]
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        return Response(self.changes(entries[-1].position if entries else since, has_more,
+                                     entries))
+
+    def changes(self, cursor, has_more, entries):
+        states, links = {}, {}
+        for entry in entries:
+            if entry.related_model:
+                links[(entry.object_id, entry.related_model, entry.related_id)] = \
+                    entry.action == ChangeLog.LINKED
+            else:
+                states[(entry.model, entry.object_id)] = entry.action
+
+        data = {'cursor': cursor, 'has_more': has_more}
+        for name, plural, model, serializer_class in self.sections:
+            upserted = [pk for (kind, pk), action in states.items()
+                        if kind == name and action != ChangeLog.DELETED]
+            rows = []
+            if upserted:
+                rows = model.objects.using(DEFAULT_DB_ALIAS) \
+                    .filter(user=self.request.user, pk__in=upserted).order_by('pk')
+                if model is Synthesize:
+                    rows = rows.prefetch_related(
+                        Prefetch('tags', Tag.objects.using(DEFAULT_DB_ALIAS)),
+                        Prefetch('chemcomps', Chemcomp.objects.using(DEFAULT_DB_ALIAS)),
+                    )
+            data[plural] = {
+                'upserted': serializer_class(rows, many=True).data,
+                'deleted': [pk for (kind, pk), action in states.items()
+                            if kind == name and action == ChangeLog.DELETED],
+            }
+        data['links'] = [
+            {'synthesize': synthesize_id, 'model': related_model, 'id': related_id,
+             'linked': linked}
+            for (synthesize_id, related_model, related_id), linked in links.items()
+        ]
+        return data
@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from core.tokens import revoke_tokens
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user objects"""
 
@@ -21,6 +23,7 @@ class UserSerializer(serializers.ModelSerializer):
 
         if password:
             user.set_password(password)
+            revoke_tokens(user)     # refresh tokens issued for the old password stop working
             user.save()
 
         return user
@@ -53,4 +56,10 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code="authentication")
 
         attrs['user'] = user
-        return attrs
\ No newline at end of file
+        return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for exchanging a refresh token"""
+
+    refresh = serializers.CharField(trim_whitespace=False)
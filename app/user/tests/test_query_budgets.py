@@ -0,0 +1,52 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from core import tokens
+from core.models import Synthesize
+from core.testing import QueryBudget, QueryBudgetTestMixin, route_names
+
+from user.urls import urlpatterns
+
+
+def seed_rows(user, size):
+    """Give the user `size` synthesize records"""
+    for i in range(size):
+        Synthesize.objects.create(user=user, title=f'Synthe {i}', time_years=i, chance=1)
+
+
+def create_prepare(user, size):
+    seed_rows(user, size)
+    return reverse('user:create'), {
+        'email': f'new-{user.id}@g.com', 'password': 'testpass', 'name': 'New',
+    }
+
+
+def token_prepare(user, size):
+    seed_rows(user, size)
+    return reverse('user:token'), {'email': user.email, 'password': 'testpass'}
+
+
+def refresh_prepare(user, size):
+    seed_rows(user, size)
+    return reverse('user:token-refresh'), {'refresh': tokens.issue_refresh_token(user)}
+
+
+def me_prepare(payload=None):
+    def prepare(user, size):
+        seed_rows(user, size)
+        return reverse('user:me'), payload
+    return prepare
+
+
+class UserQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Query budgets of every route in user/urls.py"""
+
+    covered_routes = route_names('user', urlpatterns)
+
+    budgets = (
+        QueryBudget('user:create', 'POST', 2, create_prepare, anonymous=True),
+        QueryBudget('user:token', 'POST', 2, token_prepare, anonymous=True),
+        QueryBudget('user:token-refresh', 'POST', 3, refresh_prepare, anonymous=True),
+        QueryBudget('user:me', 'GET', 0, me_prepare()),
+        QueryBudget('user:me', 'PATCH', 2, me_prepare({'name': 'Renamed', 'password': 'newpass'})),
+    )
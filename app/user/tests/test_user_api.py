@@ -1,6 +1,9 @@
+from io import StringIO
+
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 
 from rest_framework import status
 from rest_framework.test import APIClient # it is a test client
@@ -8,6 +11,8 @@ from rest_framework.test import APIClient # it is a test client
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+REFRESH_URL = reverse('user:token-refresh')
+SYNTHE_URL = reverse('synthesize:synthesize-list')
 
 #helper functions for API testing
 def create_user(**params):
@@ -81,6 +86,21 @@ class PublicUserAPITests(TestCase):
         self.assertIn('token', response.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_create_token_reuses_existing_token(self):
+        """Test that logging in again returns the same token without writes"""
+        payload = {
+            'email': 'tanvir@g.com',
+            'password': 'testpass',
+        }
+        create_user(**payload)
+        first = self.client.post(TOKEN_URL, payload)
+
+        with self.assertNumQueries(1):
+            second = self.client.post(TOKEN_URL, {**payload, 'email': 'Tanvir@G.com'})
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['token'], second.data['token'])
+
     def test_create_token_invalid_credentials(self):
         """Test to check create token when invalid credentials is given"""
 
@@ -167,4 +187,91 @@ class PrivateUserAPITests(TestCase):
 
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(AUTH_TOKEN_MODE='signed')
+class SignedTokenAPITests(TestCase):
+    """Testing the stateless signed access tokens"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {'email': 'tanvir@g.com', 'password': 'testpass'}
+        self.user = create_user(name='Tanvir', **self.payload)
+
+    def login(self):
+        response = self.client.post(TOKEN_URL, self.payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_signed_token_verified_without_queries(self):
+        """Test that an access token authenticates without touching the db"""
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {pair["access"]}')
+
+        with self.assertNumQueries(1):      # just the synthesize list itself
+            response = self.client.get(SYNTHE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(ME_URL)
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_tampered_or_expired_token_rejected(self):
+        """Test that invalid and expired access tokens are refused"""
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {pair["access"]}x')
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {pair["access"]}')
+        with override_settings(SIGNED_ACCESS_TOKEN_LIFETIME=-1):
+            self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token_rotates(self):
+        """Test a refresh token can be used exactly once"""
+        pair = self.login()
+
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertNotEqual(response.data['refresh'], pair['refresh'])
+
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_refresh_tokens(self):
+        """Test refresh tokens stop working after the password changes"""
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {pair["access"]}')
+        self.client.patch(ME_URL, {'password': 'newpassword'})
+
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_refresh_tokens_purged(self):
+        """Test purge_refresh_tokens deletes only expired refresh tokens"""
+        with override_settings(REFRESH_TOKEN_LIFETIME=-1):
+            self.login()
+        pair = self.login()
+
+        call_command('purge_refresh_tokens', stdout=StringIO())
+
+        self.assertEqual(self.user.refresh_tokens.count(), 1)
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_access_tokens_revoked(self):
+        """Test access tokens stop working once the password changes or the user is deactivated"""
+        pair = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {pair["access"]}')
+        self.client.patch(ME_URL, {'password': 'newpassword'})
+
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.payload['password'] = 'newpassword'
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.login()["access"]}')
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
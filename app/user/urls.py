@@ -6,5 +6,6 @@ app_name = "user"
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name="create"),
     path('token/', views.CreateTokenView.as_view(), name="token"),
+    path('token/refresh/', views.RefreshTokenView.as_view(), name="token-refresh"),
     path('me/', views.ManageUserView.as_view(), name="me"),
 ]
\ No newline at end of file
@@ -1,30 +1,87 @@
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils.translation import gettext_lazy as _
+from rest_framework import generics, authentication, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core import tokens
+from core.routers import pin_credentials
+from core.authentication import BatchAuthentication, SignedTokenAuthentication, load_user
+from core.timing import TimedAPIViewMixin
+from user.serializers import UserSerializer, AuthTokenSerializer, RefreshTokenSerializer
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(TimedAPIViewMixin, generics.CreateAPIView):
     """Creates a new user in the system"""
     
     serializer_class = UserSerializer
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(TimedAPIViewMixin, ObtainAuthToken):
     """Creates a new auth token for the requested user"""
     
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES     # ObtainAuthToken has none
+    throttle_scope = 'token'
 
+    def post(self, request, *args, **kwargs):
+        """Return the user's token, creating it on the first login only"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+        if getattr(settings, 'AUTH_TOKEN_MODE', 'db') == 'signed':
+            pair = tokens.issue_token_pair(user)
+            pin_credentials(request, f'Bearer {pair["access"]}')
+            return Response(pair)
+
+        try:
+            token = user.auth_token     # loaded together with the user by EmailBackend
+        except Token.DoesNotExist:
+            try:
+                token = Token.objects.create(user=user)
+            except IntegrityError:      # a concurrent login created it first
+                token = Token.objects.get(user=user)
+
+        pin_credentials(request, f'Token {token.key}')
+        return Response({'token': token.key})
+
+
+class RefreshTokenView(TimedAPIViewMixin, generics.GenericAPIView):
+    """Exchanges a refresh token for a new signed access and refresh token"""
+
+    serializer_class = RefreshTokenSerializer
+    authentication_classes = ()
+    permission_classes = ()
+    throttle_scope = 'token'
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        pair = tokens.rotate_refresh_token(serializer.validated_data['refresh'])
+        if pair is None:
+            return Response(
+                {'detail': _('Invalid or expired refresh token.')},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        pin_credentials(request, f'Bearer {pair["access"]}')
+        return Response(pair)
+
+
+class ManageUserView(TimedAPIViewMixin, generics.RetrieveUpdateAPIView):
     """Mange the authenticated users"""
 
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (authentication.TokenAuthentication, SignedTokenAuthentication,
+                              BatchAuthentication)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """Retrieve and return authenticated user"""
-        return self.request.user # request will have user due to authentication class. thanks to DRF, same is out-of-box for django
+        return load_user(self.request.user) # request will have user due to authentication class. thanks to DRF, same is out-of-box for django
 
 